@@ -0,0 +1,75 @@
+"""Compare two benchmark results files and flag regressions.
+
+    python -m benchmarks.compare results/main.json results/branch.json --threshold 10
+
+Exits with status 1 if any latency grew, or throughput dropped, by more than
+the threshold (latency changes under --min-delta-ms are treated as noise),
+so it can gate CI or a pre-merge check.
+"""
+import argparse
+import sys
+
+from benchmarks.results import load_results
+
+# Metric -> True if higher is better
+METRICS = {"p50_ms": False, "p95_ms": False, "mean_ms": False, "rps": True, "size_bytes": False}
+
+
+def compare(base, head, threshold: float, min_delta_ms: float = 0):
+    """(name, metric, base value, head value, change %, regressed) for every shared metric"""
+    base_results = {result["name"]: result for result in base["results"]}
+    rows = []
+    for result in head["results"]:
+        before = base_results.get(result["name"])
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if not before.get(metric) or result.get(metric) is None:
+                continue
+            change = (result[metric] - before[metric]) / before[metric] * 100
+            worse = -change if higher_is_better else change
+            # Sub-millisecond latencies jitter by large percentages; ignore changes below the floor
+            noise = metric.endswith("_ms") and abs(result[metric] - before[metric]) < min_delta_ms
+            rows.append((result["name"], metric, before[metric], result[metric], change, worse > threshold and not noise))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10, help="Allowed change in percent (default 10)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore latency changes smaller than this many ms (default 0.5)")
+    args = parser.parse_args()
+
+    base = load_results(args.base)
+    head = load_results(args.head)
+    if base["suite"] != head["suite"]:
+        sys.exit(f"Cannot compare suite {base['suite']!r} with {head['suite']!r}")
+
+    print(f"{base['suite']}: {base.get('git_commit')} -> {head.get('git_commit')}")
+    # Numbers from different data or servers are not comparable; say so rather than refuse
+    for key in ("churches", "postgres", "params"):
+        if base.get(key) != head.get(key):
+            print(f"warning: {key} differs ({base.get(key)!r} vs {head.get(key)!r})")
+
+    rows = compare(base, head, args.threshold, args.min_delta_ms)
+    width = max((len(name) for name, *_ in rows), default=4)
+    print(f"{'name':<{width}} {'metric':>8} {'base':>10} {'head':>10} {'change':>8}")
+    for name, metric, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}} {metric:>8} {before:>10.2f} {after:>10.2f} {change:>+7.1f}%{flag}")
+
+    missing = {r["name"] for r in base["results"]} - {r["name"] for r in head["results"]}
+    for name in sorted(missing):
+        print(f"warning: {name} is missing from {args.head}")
+
+    regressions = sum(1 for *_, regressed in rows if regressed)
+    if regressions:
+        sys.exit(f"{regressions} metric(s) regressed by more than {args.threshold:g}%")
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
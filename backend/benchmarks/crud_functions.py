@@ -0,0 +1,119 @@
+"""Latency of every crud function against the current database.
+
+Run from backend/, after importing data (e.g. from benchmarks.generate):
+
+    python -m benchmarks.crud_functions --queries 200 --output results/crud.json
+
+Reads use points, ids and names sampled from the table. Writes create,
+update and then delete their own rows (negative osm_ids), so the table is
+left as it was.
+"""
+import argparse
+import random
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from benchmarks.common import (
+    get_engine, grow_to, sample_points, sample_queries, summarize, tile_for, time_calls, viewport,
+)
+from benchmarks.results import save_results
+from schemas import ChurchCreate, ChurchUpdate, NearbyOrigin
+
+# Far below any osm_id benchmarks.generate or common.grow_to hands out
+WRITE_OSM_ID_BASE = -10 ** 12
+
+
+def sample_ids(engine, n):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT id FROM churches ORDER BY random() LIMIT :n"), {"n": n}).scalars().all()
+
+
+def read_cases(db, engine, n):
+    """name -> (call, argument tuples) for every read function"""
+    points = sample_points(engine, n)
+    queries = sample_queries(engine, n)
+    ids = sample_ids(engine, n)
+    batches = [
+        ([NearbyOrigin(latitude=lat, longitude=lng, radius_km=5, limit=10)
+          for lat, lng in random.sample(points, min(100, len(points)))],)
+        for _ in range(max(1, n // 20))
+    ]
+
+    def bind(fn):
+        return lambda *args: fn(db, *args)
+
+    return {
+        "get_church": (bind(crud.get_church), [(church_id,) for church_id in ids]),
+        "get_churches_first_page": (lambda: crud.get_churches(db, limit=100), [()] * n),
+        "get_churches_keyset_page": (lambda after: crud.get_churches(db, limit=100, after=after), [(church_id,) for church_id in ids]),
+        "search_churches": (bind(crud.search_churches), queries),
+        "find_nearby_churches": (bind(crud.find_nearby_churches), points),
+        "find_nearby_churches_batch_100": (bind(crud.find_nearby_churches_batch), batches),
+        "get_church_clusters_z8": (bind(crud.get_church_clusters), [viewport(lat, lng, 8) for lat, lng in points]),
+        "get_church_clusters_z14": (bind(crud.get_church_clusters), [viewport(lat, lng, 14) for lat, lng in points]),
+        "get_church_tile_z10": (bind(crud.get_church_tile), [tile_for(lat, lng, 10) for lat, lng in points]),
+        "get_church_tile_z15": (bind(crud.get_church_tile), [tile_for(lat, lng, 15) for lat, lng in points]),
+    }
+
+
+def run_writes(db, points):
+    """Time create, update and delete on the same rows; every created row is deleted again"""
+    creates = [
+        (ChurchCreate(name=f"Benchmark {i}", religion="christian", amenity="place_of_worship",
+                      latitude=lat, longitude=lng, osm_id=WRITE_OSM_ID_BASE - i),)
+        for i, (lat, lng) in enumerate(points)
+    ]
+    created = []
+    try:
+        results = {"create_church": time_calls(lambda church: created.append(crud.create_church(db, church)), creates, warmup=0)}
+        updates = [(church["id"], ChurchUpdate(name=f"{church['name']} (updated)")) for church in created]
+        results["update_church"] = time_calls(lambda church_id, upd: crud.update_church(db, church_id, upd), updates, warmup=0)
+        results["delete_church"] = time_calls(lambda church_id: crud.delete_church(db, church_id), [(c["id"],) for c in created], warmup=0)
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM churches WHERE osm_id <= :base"), {"base": WRITE_OSM_ID_BASE})
+        db.commit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200, help="Calls per function")
+    parser.add_argument("--size", type=int, help="Grow the table to this many rows first (see common.grow_to)")
+    parser.add_argument("--functions", help="Comma-separated subset of the benchmark names")
+    parser.add_argument("--no-writes", action="store_true", help="Skip create/update/delete")
+    parser.add_argument("--output", help="Write a JSON results file (see benchmarks.results)")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if args.size:
+        grow_to(engine, args.size)
+    Session = sessionmaker(bind=engine)
+    wanted = set(args.functions.split(",")) if args.functions else None
+
+    results = []
+    print(f"{'function':>32} {'p50':>9} {'p95':>9} {'mean':>9}")
+
+    def report(name, samples):
+        summary = {"name": name, **summarize(samples)}
+        results.append(summary)
+        print(f"{name:>32} {summary['p50_ms']:>7.2f}ms {summary['p95_ms']:>7.2f}ms {summary['mean_ms']:>7.2f}ms", flush=True)
+
+    with Session() as db:
+        for name, (call, calls) in read_cases(db, engine, args.queries).items():
+            if wanted is None or name in wanted:
+                report(name, time_calls(call, calls))
+
+        if not args.no_writes:
+            for name, samples in run_writes(db, sample_points(engine, args.queries)).items():
+                if wanted is None or name in wanted:
+                    report(name, samples)
+
+    if args.output:
+        save_results(args.output, "crud", results, vars(args), engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Synthetic Overpass exports shaped like data.json, at any size.
+
+    python -m benchmarks.generate --size 1M --out bench_1m.json
+    python import_data.py bench_1m.json
+
+Churches cluster around Vietnamese cities the way real ones do: most sit in
+parishes around a city's districts, the rest are spread over the surrounding
+countryside. Output is deterministic for a given --seed. Nodes get negative
+ids, the OSM convention for objects that do not exist upstream, so
+benchmarks.common.drop_synthetic removes them again.
+"""
+import argparse
+import random
+import sys
+import time
+
+import orjson
+
+# (name, latitude, longitude, relative weight, spread in km)
+CITIES = [
+    ("TP. Hồ Chí Minh", 10.7769, 106.7009, 20, 12),
+    ("Biên Hòa", 10.9574, 106.8427, 12, 8),
+    ("Hà Nội", 21.0285, 105.8542, 10, 10),
+    ("Nam Định", 20.4388, 106.1621, 10, 15),
+    ("Phát Diệm", 20.0917, 106.0797, 6, 10),
+    ("Thái Bình", 20.4463, 106.3366, 5, 12),
+    ("Vinh", 18.6796, 105.6813, 5, 15),
+    ("Huế", 16.4637, 107.5909, 4, 10),
+    ("Đà Nẵng", 16.0544, 108.2022, 3, 8),
+    ("Quy Nhơn", 13.7765, 109.2237, 2, 8),
+    ("Kon Tum", 14.3545, 108.0076, 3, 12),
+    ("Pleiku", 13.9833, 108.0000, 2, 12),
+    ("Buôn Ma Thuột", 12.6667, 108.0500, 4, 15),
+    ("Đà Lạt", 11.9404, 108.4583, 4, 10),
+    ("Nha Trang", 12.2388, 109.1967, 2, 6),
+    ("Vũng Tàu", 10.4114, 107.1362, 3, 8),
+    ("Xuân Lộc", 10.9300, 107.4100, 4, 12),
+    ("Mỹ Tho", 10.3600, 106.3600, 2, 10),
+    ("Cần Thơ", 10.0452, 105.7469, 3, 12),
+    ("Long Xuyên", 10.3864, 105.4351, 2, 12),
+    ("Hải Phòng", 20.8449, 106.6881, 2, 10),
+    ("Lạng Sơn", 21.8537, 106.7615, 1, 15),
+    ("Sa Pa", 22.3364, 103.8438, 1, 15),
+]
+DISTRICTS_PER_CITY = 12
+# Share of churches spread over the countryside around a city instead of its districts
+RURAL_SHARE = 0.15
+RURAL_SPREAD_KM = 45
+KM_PER_DEGREE = 111.32
+
+SAINTS = [
+    "Thánh Giuse", "Đức Mẹ Mân Côi", "Thánh Phêrô", "Thánh Phaolô", "Thánh Tâm", "Thánh Gia",
+    "Đức Mẹ Hồn Xác Lên Trời", "Thánh Martinô", "Thánh Antôn", "Thánh Giuse Thợ", "Chúa Kitô Vua",
+    "Đức Mẹ Vô Nhiễm", "Thánh Giuse Hiền", "Các Thánh Tử Đạo Việt Nam", "Thánh Tôma",
+]
+PLACES = [
+    "Tân Định", "Hàm Long", "Phú Nhai", "Bùi Chu", "Hố Nai", "Tân Phước", "Thánh Mẫu", "Xuân Hiệp",
+    "Phước Lý", "Kẻ Sặt", "Trung Lao", "Bắc Ninh", "Lạc Đạo", "Vĩnh Long", "An Lạc", "Bình Thái",
+    "Tam Hà", "Thủ Đức", "Gia Định", "Chợ Quán", "Phú Hạnh", "Thái Hà", "Cửa Bắc", "Ninh Cường",
+]
+STREETS = [
+    "Trần Hưng Đạo", "Lê Lợi", "Nguyễn Trãi", "Hai Bà Trưng", "Quang Trung", "Lý Thường Kiệt",
+    "Nguyễn Huệ", "Hùng Vương", "Phan Đình Phùng", "Cách Mạng Tháng Tám", "Lê Duẩn", "Điện Biên Phủ",
+]
+NAME_PATTERNS = [
+    ("Nhà thờ {place}", 0.30),
+    ("Giáo xứ {place}", 0.25),
+    ("Nhà thờ Giáo xứ {saint}", 0.15),
+    ("Giáo họ {place}", 0.10),
+    ("Hội thánh Tin Lành {place}", 0.12),
+    ("{saint} Church", 0.08),
+]
+
+
+def parse_size(value: str) -> int:
+    """10000, 10k, 1M, 10M"""
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1:].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+
+def district_centres(rng):
+    centres = []
+    for name, lat, lng, weight, spread_km in CITIES:
+        for _ in range(DISTRICTS_PER_CITY):
+            spread = spread_km / KM_PER_DEGREE
+            centres.append((lat + rng.gauss(0, spread), lng + rng.gauss(0, spread), weight, spread / 4))
+    return centres
+
+
+def church_tags(rng):
+    tags = {"amenity": "place_of_worship", "religion": "christian"}
+    if rng.random() < 0.8:
+        pattern = rng.choices([p for p, _ in NAME_PATTERNS], weights=[w for _, w in NAME_PATTERNS])[0]
+        tags["name"] = pattern.format(place=rng.choice(PLACES), saint=rng.choice(SAINTS))
+        if "Tin Lành" in tags["name"]:
+            tags["denomination"] = "protestant"
+        elif rng.random() < 0.85:
+            tags["denomination"] = "catholic"
+    if rng.random() < 0.5:
+        tags["building"] = "church"
+    if rng.random() < 0.3:
+        tags["addr:housenumber"] = str(rng.randint(1, 500))
+        tags["addr:street"] = rng.choice(STREETS)
+    if rng.random() < 0.1:
+        tags["phone"] = f"+84 {rng.randint(20, 299)} {rng.randint(1000000, 9999999)}"
+    if rng.random() < 0.05:
+        tags["website"] = f"https://giaoxu{rng.randint(1, 99999)}.org"
+    return tags
+
+
+def generate_nodes(size: int, seed: int = 42):
+    rng = random.Random(seed)
+    centres = district_centres(rng)
+    weights = [weight for _, _, weight, _ in centres]
+    cities = [(lat, lng) for _, lat, lng, _, _ in CITIES]
+    city_weights = [weight for _, _, _, weight, _ in CITIES]
+    rural_spread = RURAL_SPREAD_KM / KM_PER_DEGREE
+
+    for i in range(1, size + 1):
+        if rng.random() < RURAL_SHARE:
+            lat, lng = rng.choices(cities, weights=city_weights)[0]
+            spread = rural_spread
+        else:
+            lat, lng, _, spread = rng.choices(centres, weights=weights)[0]
+        yield {
+            "type": "node",
+            "id": -i,
+            "lat": round(lat + rng.gauss(0, spread), 7),
+            "lon": round(lng + rng.gauss(0, spread), 7),
+            "tags": church_tags(rng),
+        }
+
+
+def write_overpass_json(path: str, size: int, seed: int = 42):
+    """Stream `size` nodes to an Overpass-style JSON file; memory use does not grow with size"""
+    started = time.perf_counter()
+    header = {
+        "version": 0.6,
+        "generator": f"benchmarks.generate (seed {seed})",
+        "osm3s": {"copyright": "Synthetic data for benchmarks; not from OpenStreetMap."},
+    }
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(header)[:-1] + b',\n"elements": [\n')
+        for node in generate_nodes(size, seed):
+            if node["id"] != -1:
+                f.write(b",\n")
+            f.write(orjson.dumps(node))
+            if node["id"] % 1_000_000 == 0:
+                print(f"{-node['id']:,} nodes...", file=sys.stderr, flush=True)
+        f.write(b"\n]\n}\n")
+    print(f"Wrote {size:,} nodes to {path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=parse_size, default="100k", help="Number of churches: 10k, 100k, 1M, 10M, ...")
+    parser.add_argument("--out", default="bench_data.json")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    write_overpass_json(args.out, args.size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
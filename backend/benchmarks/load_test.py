@@ -0,0 +1,193 @@
+"""HTTP load test: map browsing, nearby search, text search and writes.
+
+Start the API (e.g. `docker compose up backend`), then from backend/:
+
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 64 --duration 30
+
+or drive main.app in-process, without a server, against DATABASE_URL:
+
+    python -m benchmarks.load_test --app --scenarios mixed --output results/load.json
+
+Scenarios: browse (clusters and tiles), nearby, search, write (create,
+update, delete) and mixed, a weighted blend of all four. To compare the
+sync and async stacks, run it once against each build with the same
+settings and compare the requests/sec columns.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import httpx
+
+from benchmarks.common import summarize, tile_for, viewport
+from benchmarks.results import save_results
+
+# Origins for nearby searches: major Vietnamese cities
+CITY_CENTRES = [
+    (21.0285, 105.8542),  # Hà Nội
+    (10.7769, 106.7009),  # TP. Hồ Chí Minh
+    (16.0544, 108.2022),  # Đà Nẵng
+    (20.8449, 106.6881),  # Hải Phòng
+    (10.0452, 105.7469),  # Cần Thơ
+    (16.4637, 107.5909),  # Huế
+    (11.9404, 108.4583),  # Đà Lạt
+    (12.2388, 109.1967),  # Nha Trang
+    (20.4388, 106.1621),  # Nam Định
+    (10.9574, 106.8427),  # Biên Hòa
+]
+
+SEARCH_TERMS = ["Nhà thờ", "nha tho", "Giáo xứ", "catholic", "Tin Lành", "Thánh", "Đức Mẹ", "Mân Côi", "giao"]
+
+# Churches created by the write scenario; negative osm_ids, so common.drop_synthetic also removes them
+WRITE_OSM_IDS = itertools.count(2 * 10 ** 12)
+# Share of each operation in the mixed scenario
+MIX = {"browse": 50, "nearby": 25, "search": 20, "write": 5}
+
+
+def near_city(spread=0.05):
+    lat, lng = random.choice(CITY_CENTRES)
+    return lat + random.uniform(-spread, spread), lng + random.uniform(-spread, spread)
+
+
+async def browse(client, state):
+    lat, lng = near_city(0.2)
+    zoom = random.randint(6, 15)
+    if random.random() < 0.5:
+        min_lng, min_lat, max_lng, max_lat, zoom = viewport(lat, lng, zoom)
+        return await client.get("/churches/clusters", params={
+            "bbox": f"{min_lng},{min_lat},{max_lng},{max_lat}", "zoom": zoom,
+        })
+    z, x, y = tile_for(lat, lng, zoom)
+    return await client.get(f"/churches/tiles/{z}/{x}/{y}")
+
+
+async def nearby(client, state):
+    lat, lng = near_city()
+    return await client.get("/churches/search/nearby", params={
+        "lat": lat, "lng": lng, "radius": random.choice([2, 5, 10, 25]),
+    })
+
+
+async def search(client, state):
+    term = random.choice(SEARCH_TERMS)
+    # Simulate autocomplete: anything from the first three characters to the full term
+    return await client.get("/churches/search/text", params={"q": term[:random.randint(3, len(term))]})
+
+
+async def write(client, state):
+    created = state["created"]
+    roll = random.random()
+    if len(created) < 20 or roll < 0.4:
+        lat, lng = near_city()
+        response = await client.post("/churches", json={
+            "name": "Nhà thờ Benchmark", "religion": "christian", "amenity": "place_of_worship",
+            "latitude": lat, "longitude": lng, "osm_id": -next(WRITE_OSM_IDS),
+        })
+        if response.status_code == 200:
+            created.append(response.json()["id"])
+        return response
+    if roll < 0.7:
+        return await client.put(f"/churches/{random.choice(created)}", json={"description": f"Updated {time.time()}"})
+    church_id = created.pop(random.randrange(len(created)))
+    return await client.delete(f"/churches/{church_id}")
+
+
+OPERATIONS = {"browse": browse, "nearby": nearby, "search": search, "write": write}
+
+
+def scenario_operations(name):
+    if name == "mixed":
+        return list(MIX), list(MIX.values())
+    return [name], [1]
+
+
+async def worker(client, operations, weights, deadline, state, samples, errors):
+    while time.perf_counter() < deadline:
+        operation = random.choices(operations, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await OPERATIONS[operation](client, state)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+            continue
+        samples.append((operation, time.perf_counter() - start))
+
+
+def make_client(url, app, concurrency):
+    if app:
+        # In-process: no server or network, only the ASGI app and its database
+        from main import app as asgi_app
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url="http://benchmark", timeout=30)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=url, limits=limits, timeout=30)
+
+
+async def run_scenario(client, name, concurrency, duration):
+    operations, weights = scenario_operations(name)
+    state = {"created": []}
+    samples = []
+    errors = []
+
+    try:
+        # Warm the server and its connection pool before measuring
+        await asyncio.gather(*(worker(client, operations, weights, time.perf_counter() + 2, state, [], [])
+                               for _ in range(concurrency)))
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(worker(client, operations, weights, deadline, state, samples, errors)
+                               for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        for church_id in state["created"]:
+            await client.delete(f"/churches/{church_id}")
+
+    results = [{
+        "name": name,
+        "requests": len(samples),
+        "errors": len(errors),
+        "rps": len(samples) / elapsed,
+        **(summarize([seconds for _, seconds in samples]) if samples else {}),
+    }]
+    if len(operations) > 1:
+        for operation in operations:
+            timings = [seconds for op, seconds in samples if op == operation]
+            if timings:
+                results.append({"name": f"{name}/{operation}", "requests": len(timings), **summarize(timings)})
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--app", action="store_true", help="Drive main.app in-process instead of --url")
+    parser.add_argument("--scenarios", default="browse,nearby,search,write,mixed")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per scenario")
+    parser.add_argument("--output", help="Write a JSON results file (see benchmarks.results)")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'scenario':>16} {'req/s':>9} {'p50':>9} {'p95':>9} {'errors':>7}")
+    async with make_client(args.url, args.app, args.concurrency) as client:
+        for name in args.scenarios.split(","):
+            for result in await run_scenario(client, name, args.concurrency, args.duration):
+                results.append(result)
+                rps = f"{result['rps']:>9.1f}" if "rps" in result else f"{'':>9}"
+                print(
+                    f"{result['name']:>16} {rps} {result.get('p50_ms', 0):>7.1f}ms"
+                    f" {result.get('p95_ms', 0):>7.1f}ms {result.get('errors', 0):>7}",
+                    flush=True,
+                )
+
+    if args.output:
+        save_results(args.output, "load", results, vars(args))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
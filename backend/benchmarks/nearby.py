@@ -0,0 +1,87 @@
+"""Proximity search latency as the churches table grows.
+
+Run from backend/ against a database that already holds the OSM import:
+
+    python -m benchmarks.nearby --sizes 5000,100000,1000000,3000000
+
+Synthetic rows are removed again at the end unless --keep is given.
+"""
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from benchmarks.common import drop_synthetic, get_engine, grow_to, sample_points, summarize, time_calls
+from benchmarks.results import save_results
+
+# The pre-KNN query, kept here only for comparison
+LEGACY_SQL = text("""
+    SELECT id,
+           ST_Distance(ST_Transform(location, 3857),
+                       ST_Transform(ST_SetSRID(ST_MakePoint(:lng, :lat), 4326), 3857)) AS distance
+    FROM churches
+    WHERE ST_DWithin(ST_Transform(location, 3857),
+                     ST_Transform(ST_SetSRID(ST_MakePoint(:lng, :lat), 4326), 3857),
+                     :radius)
+    ORDER BY distance
+    LIMIT :limit
+""")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5000,100000,1000000,3000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=10, help="Search radius in km")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--legacy", action="store_true", help="Also time the ST_Transform query")
+    parser.add_argument("--keep", action="store_true", help="Keep synthetic rows afterwards")
+    parser.add_argument("--output", help="Write a JSON results file (see benchmarks.results)")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    Session = sessionmaker(bind=engine)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = []
+
+    print(f"{'rows':>10} {'knn p50':>9} {'knn p95':>9} {'legacy p50':>11} {'legacy p95':>11}")
+    try:
+        for size in sizes:
+            rows = grow_to(engine, size)
+            points = sample_points(engine, args.queries)
+
+            with Session() as db:
+                knn = summarize(time_calls(
+                    lambda lat, lng: crud.find_nearby_churches(
+                        db, latitude=lat, longitude=lng, radius_km=args.radius, limit=args.limit
+                    ),
+                    points,
+                ))
+
+                legacy = None
+                if args.legacy:
+                    legacy = summarize(time_calls(
+                        lambda lat, lng: db.execute(LEGACY_SQL, {
+                            "lat": lat, "lng": lng, "radius": args.radius * 1000, "limit": args.limit
+                        }).all(),
+                        points,
+                    ))
+
+            results.append({"name": f"knn/{size}", "rows": rows, **knn})
+            if legacy:
+                results.append({"name": f"legacy/{size}", "rows": rows, **legacy})
+
+            line = f"{rows:>10} {knn['p50_ms']:>7.2f}ms {knn['p95_ms']:>7.2f}ms"
+            if legacy:
+                line += f" {legacy['p50_ms']:>9.2f}ms {legacy['p95_ms']:>9.2f}ms"
+            print(line, flush=True)
+        if args.output:
+            save_results(args.output, "nearby", results, vars(args), engine)
+    finally:
+        if not args.keep:
+            drop_synthetic(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark results files, compared between commits by benchmarks.compare.
+
+Every benchmark script takes --output and writes one JSON document:
+
+    {
+      "format": 1,
+      "suite": "crud",
+      "created_at": "2024-01-01T12:00:00+00:00",
+      "git_commit": "1a2b3c4", "git_dirty": false,
+      "python": "3.11.7", "postgres": "PostgreSQL 15.4 ...", "churches": 100000,
+      "params": {"queries": 200, ...},
+      "results": [{"name": "find_nearby_churches", "samples": 200, "mean_ms": 1.9, "p50_ms": 1.7, "p95_ms": 3.2}, ...]
+    }
+
+Result names are unique within a file. Metrics ending in _ms are latencies
+(lower is better); rps is throughput (higher is better); size_bytes is a
+payload size (lower is better).
+"""
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import orjson
+from sqlalchemy import text
+
+FORMAT_VERSION = 1
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(engine=None):
+    """Where the numbers came from: commit, interpreter and, given an engine, the database"""
+    info = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git("rev-parse", "--short", "HEAD"),
+        "git_dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "postgres": None,
+        "churches": None,
+    }
+    if engine is not None:
+        with engine.connect() as conn:
+            info["postgres"] = conn.execute(text("SELECT version()")).scalar()
+            info["churches"] = conn.execute(text("SELECT count(*) FROM churches")).scalar()
+    return info
+
+
+def save_results(path, suite: str, results, params, engine=None):
+    params = {key: value for key, value in params.items() if key != "output"}
+    document = {"format": FORMAT_VERSION, "suite": suite, **environment(engine), "params": params, "results": results}
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(document, option=orjson.OPT_INDENT_2))
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def load_results(path):
+    with open(path, "rb") as f:
+        document = orjson.loads(f.read())
+    if document.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported results format {document.get('format')!r}")
+    return document
@@ -0,0 +1,100 @@
+"""Response serialization cost and size for a page of churches, without a database.
+
+Compares the previous path (dict per row, Pydantic validation of the list,
+jsonable_encoder, stdlib json) with RowSet + orjson, and with the compact
+formats clients can ask for (serializers.ROW_FORMATS): columnar JSON,
+MessagePack and GeoArrow. From backend/:
+
+    python -m benchmarks.serialization --rows 1000,10000
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import crud
+import schemas
+from benchmarks.common import summarize, time_calls
+from benchmarks.results import save_results
+from serializers import RowSet, dumps, dumps_columnar, dumps_geoarrow, dumps_msgpack
+
+CHURCH_LIST = TypeAdapter(List[schemas.NearbyChurch])
+
+
+def synthetic_rows(count):
+    fields = crud.CHURCH_FIELDS + ("distance_meters",)
+    created = datetime(2024, 1, 1)
+    rows = [
+        (
+            i, 1_000_000 + i, f"Nhà thờ Giáo xứ {i}", "catholic", "christian", "place_of_worship", "church",
+            f"{i} Đường Lê Lợi, Quận 1, TP. Hồ Chí Minh", None, None, None,
+            created, created + timedelta(seconds=i),
+            106.7 + random.uniform(-0.2, 0.2), 10.77 + random.uniform(-0.2, 0.2),
+            random.uniform(0, 10_000),
+        )
+        for i in range(count)
+    ]
+    return fields, rows
+
+
+def legacy_encode(fields, rows):
+    churches = [dict(zip(fields, row)) for row in rows]
+    validated = CHURCH_LIST.validate_python(churches)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def rowset_encode(fields, rows):
+    return dumps(RowSet(fields, rows))
+
+
+ENCODERS = {
+    "legacy": legacy_encode,
+    "orjson": rowset_encode,
+    "columnar": lambda fields, rows: dumps_columnar(RowSet(fields, rows)),
+    "msgpack": lambda fields, rows: dumps_msgpack(RowSet(fields, rows)),
+    "geoarrow": lambda fields, rows: dumps_geoarrow(RowSet(fields, rows)),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="50,1000,10000")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--formats", default=",".join(ENCODERS),
+                        help="Comma-separated subset of " + ", ".join(ENCODERS) + "; the first is the baseline")
+    parser.add_argument("--output", help="Write a JSON results file (see benchmarks.results)")
+    args = parser.parse_args()
+    results = []
+
+    print(f"{'rows':>7} {'format':>9} {'p50':>9} {'bytes':>10} {'vs base':>10}")
+    for count in (int(size) for size in args.rows.split(",")):
+        fields, rows = synthetic_rows(count)
+        calls = [(fields, rows)] * args.repeat
+
+        # Both JSON paths must produce the same document
+        assert json.loads(legacy_encode(fields, rows)) == json.loads(rowset_encode(fields, rows))
+
+        baseline = None
+        for name, encode in ENCODERS.items():
+            if name not in args.formats.split(","):
+                continue
+            size = len(encode(fields, rows))
+            summary = {"name": f"{name}/{count}", **summarize(time_calls(encode, calls)), "size_bytes": size}
+            results.append(summary)
+            baseline = baseline or summary
+            print(
+                f"{count:>7} {name:>9} {summary['p50_ms']:>7.2f}ms {size:>10,}"
+                f" {baseline['p50_ms'] / summary['p50_ms']:>5.1f}x/{size / baseline['size_bytes']:>4.0%}",
+                flush=True,
+            )
+
+    if args.output:
+        save_results(args.output, "serialization", results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Cold start: import time, time until a fresh server answers and is warm, first-request latency.
+
+    python -m benchmarks.startup --runs 5 --output results/startup.json
+
+Each run starts a new server process (uvicorn, or gunicorn with --gunicorn)
+against DATABASE_URL on a free port, polls /health and /ready, then times
+the first and a repeated nearby and text search. The server's read cache is
+bypassed with a different origin and query per run, so these are database
+round-trips on connections the warm-up opened.
+"""
+import argparse
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import get_engine, summarize
+from benchmarks.load_test import CITY_CENTRES, SEARCH_TERMS
+from benchmarks.results import save_results
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+POLL_INTERVAL = 0.01
+
+
+def import_seconds():
+    """Seconds to import main in a fresh interpreter (what every worker, or a preloading master, pays)"""
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(port, gunicorn):
+    if gunicorn:
+        return ["gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "main:app"]
+    return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+
+
+def wait_for(client, path, started, timeout):
+    """Seconds from `started` until `path` first answers 200"""
+    while time.perf_counter() - started < timeout:
+        try:
+            if client.get(path).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(f"{path} not OK after {timeout}s")
+
+
+def timed_get(client, path, params):
+    started = time.perf_counter()
+    client.get(path, params=params).raise_for_status()
+    return time.perf_counter() - started
+
+
+def start_once(gunicorn, timeout):
+    """(seconds to /health, seconds to /ready, {request: seconds}) for one fresh server"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(server_command(port, gunicorn), start_new_session=True)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            healthy = wait_for(client, "/health", started, timeout)
+            ready = wait_for(client, "/ready", started, timeout)
+
+            lat, lng = random.choice(CITY_CENTRES)
+            nearby = {"lat": lat + random.uniform(-0.5, 0.5), "lng": lng + random.uniform(-0.5, 0.5), "radius": 5}
+            search = {"q": f"{random.choice(SEARCH_TERMS)} {random.randint(0, 10 ** 6)}"}
+            requests = {
+                "first_nearby": timed_get(client, "/churches/search/nearby", nearby),
+                "first_search": timed_get(client, "/churches/search/text", search),
+            }
+            # Same statements with other values: what every request after the first costs
+            nearby["lat"] += 0.01
+            search["q"] += "1"
+            requests["second_nearby"] = timed_get(client, "/churches/search/nearby", nearby)
+            requests["second_search"] = timed_get(client, "/churches/search/text", search)
+        return healthy, ready, requests
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true", help="Start gunicorn (gunicorn.conf.py) instead of uvicorn")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for /health and /ready")
+    parser.add_argument("--output", help="Write a JSON results file (see benchmarks.results)")
+    args = parser.parse_args()
+
+    samples = {"import_main": [import_seconds() for _ in range(args.runs)]}
+    for run in range(args.runs):
+        healthy, ready, requests = start_once(args.gunicorn, args.timeout)
+        print(f"run {run + 1}: /health after {healthy * 1000:.0f}ms, /ready after {ready * 1000:.0f}ms", flush=True)
+        samples.setdefault("to_health", []).append(healthy)
+        samples.setdefault("to_ready", []).append(ready)
+        for name, seconds in requests.items():
+            samples.setdefault(name, []).append(seconds)
+
+    results = []
+    print(f"{'':>14} {'p50':>9} {'p95':>9}")
+    for name, timings in samples.items():
+        result = {"name": name, **summarize(timings)}
+        results.append(result)
+        print(f"{name:>14} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms")
+
+    if args.output:
+        save_results(args.output, "startup", results, vars(args), get_engine())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Text search latency: trigram/full-text search versus the old ILIKE scan.
+
+Run from backend/ against a database that already holds the OSM import:
+
+    python -m benchmarks.text_search --sizes 10000,100000,1000000
+
+Synthetic rows are removed again at the end unless --keep is given.
+"""
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from benchmarks.common import drop_synthetic, get_engine, grow_to, sample_queries, summarize, time_calls
+from benchmarks.results import save_results
+
+# The pre-index query, kept here only for comparison
+ILIKE_SQL = text("""
+    SELECT id, name
+    FROM churches
+    WHERE name ILIKE :pattern OR denomination ILIKE :pattern OR address ILIKE :pattern
+    LIMIT :limit
+""")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="Keep synthetic rows afterwards")
+    parser.add_argument("--output", help="Write a JSON results file (see benchmarks.results)")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    Session = sessionmaker(bind=engine)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = []
+
+    print(f"{'rows':>10} {'search p50':>11} {'search p95':>11} {'ilike p50':>10} {'ilike p95':>10}")
+    try:
+        for size in sizes:
+            rows = grow_to(engine, size)
+            queries = sample_queries(engine, args.queries)
+
+            with Session() as db:
+                indexed = summarize(time_calls(
+                    lambda q: crud.search_churches(db, query=q, limit=args.limit),
+                    queries,
+                ))
+                ilike = summarize(time_calls(
+                    lambda q: db.execute(ILIKE_SQL, {"pattern": f"%{q}%", "limit": args.limit}).all(),
+                    queries,
+                ))
+
+            results.append({"name": f"search/{size}", "rows": rows, **indexed})
+            results.append({"name": f"ilike/{size}", "rows": rows, **ilike})
+            print(
+                f"{rows:>10} {indexed['p50_ms']:>9.2f}ms {indexed['p95_ms']:>9.2f}ms"
+                f" {ilike['p50_ms']:>8.2f}ms {ilike['p95_ms']:>8.2f}ms",
+                flush=True,
+            )
+        if args.output:
+            save_results(args.output, "text_search", results, vars(args), engine)
+    finally:
+        if not args.keep:
+            drop_synthetic(engine)
+
+
+if __name__ == "__main__":
+    main()
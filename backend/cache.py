@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Bumped by every write in crud; cache keys embed it so that stale entries
+# simply stop being looked up and age out of the LRU.
+_data_version = 0
+_version_lock = threading.Lock()
+
+
+def data_version():
+    return _data_version
+
+
+def bump_data_version():
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+        return _data_version
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires_at, value = self._entries[key]
+            except KeyError:
+                return None
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ReadCache:
+    """Cache for encoded API responses, keyed by namespace, data version and request.
+
+    Values are bytes. They live in an in-process LRU, or in Redis when
+    CACHE_REDIS_URL is set, in which case the data version is shared through
+    Redis too so a write in any worker invalidates every worker's entries.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, redis_url: str = None, prefix: str = "churches:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.redis = None
+        if redis_url:
+            # Optional dependency, only needed when Redis is configured
+            import redis.asyncio as redis
+            self.redis = redis.from_url(redis_url)
+        self.hits = Counter()
+        self.misses = Counter()
+        self._database_version = None
+
+    async def version(self):
+        if self.redis is None:
+            return data_version()
+        return int(await self.redis.get(self.prefix + "data_version") or 0)
+
+    async def invalidate(self):
+        bump_data_version()
+        if self.redis is not None:
+            await self.redis.incr(self.prefix + "data_version")
+
+    async def sync_database_version(self, database_version):
+        """Invalidate when the table's own version (crud.get_data_version) has moved since last seen.
+
+        Catches writes this process did not make: other workers without Redis,
+        imports and syncs, manual edits.
+        """
+        if database_version != self._database_version:
+            self._database_version = database_version
+            await self.invalidate()
+
+    async def get_or_load(self, namespace: str, key_parts, loader):
+        """Cached bytes for the request, calling `loader` on a miss; None results are not cached"""
+        version = await self.version()
+        key = ":".join([namespace, str(version), *map(str, key_parts)])
+
+        if self.redis is None:
+            value = self.local.get(key)
+        else:
+            value = await self.redis.get(self.prefix + key)
+        if value is not None:
+            self.hits[namespace] += 1
+            return value
+
+        self.misses[namespace] += 1
+        value = await loader()
+        if value is not None:
+            if self.redis is None:
+                self.local.set(key, value)
+            else:
+                await self.redis.set(self.prefix + key, value, ex=int(self.ttl) or None)
+        return value
+
+    def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": "redis" if self.redis is not None else "memory",
+            "entries": len(self.local) if self.redis is None else None,
+            "evictions": self.local.evictions if self.redis is None else None,
+            "namespaces": {
+                namespace: {
+                    "hits": self.hits[namespace],
+                    "misses": self.misses[namespace],
+                    "hit_ratio": self.hits[namespace] / ((self.hits[namespace] + self.misses[namespace]) or 1),
+                }
+                for namespace in namespaces
+            },
+        }
+
+
+tile_cache = LRUCache(max_entries=int(os.getenv("TILE_CACHE_SIZE", "4096")))
+
+read_cache = ReadCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("CACHE_TTL", "300")),
+    redis_url=os.getenv("CACHE_REDIS_URL"),
+)
@@ -0,0 +1,118 @@
+-- Change tracking on churches: the data version behind HTTP validators and cache
+-- keys, and the change feed. Idempotent, so the one copy serves both new
+-- databases (run by Postgres after database/init.sql, see docker-compose.yml)
+-- and existing ones (run by import_data.py and load_regions.py on every start).
+
+-- Table-level change counter for HTTP validators (ETag / Last-Modified): one
+-- row, bumped once per statement that writes churches, whoever issues it
+CREATE TABLE IF NOT EXISTS church_data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO church_data_version (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- Statement-level, so a bulk import bumps the version once rather than per row
+CREATE OR REPLACE FUNCTION bump_church_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE church_data_version SET version = version + 1, updated_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER churches_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+    ON churches FOR EACH STATEMENT EXECUTE FUNCTION bump_church_data_version();
+
+-- Regional results are cached under the churches data version, so reloading regions bumps it too
+CREATE OR REPLACE TRIGGER admin_regions_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+    ON admin_regions FOR EACH STATEMENT EXECUTE FUNCTION bump_church_data_version();
+
+-- Change feed (GET /churches/changes, backend/changes.py): one NOTIFY on the
+-- church_changes channel per statement, listing the changed churches. Statements
+-- touching more than 50 churches (imports, bulk deletes), or whose list would not
+-- fit the 8000-byte payload limit, only announce a "bulk" change and listeners
+-- replay it from updated_at and church_deletions.
+
+-- Deleted churches, so that a feed can be resumed across deletes; kept for 30 days
+CREATE TABLE IF NOT EXISTS church_deletions (
+    id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+    location GEOMETRY(POINT, 4326) NOT NULL,
+    PRIMARY KEY (deleted_at, id)
+);
+
+CREATE OR REPLACE FUNCTION notify_church_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed BIGINT;
+    changes JSON;
+    payload TEXT;
+BEGIN
+    -- Rows are only listed for small statements; counted first, so that a large
+    -- import never builds a JSON list of its rows just to throw it away
+    IF TG_OP = 'TRUNCATE' THEN
+        changed := -1;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO church_deletions (id, location) SELECT id, location FROM old_rows;
+        DELETE FROM church_deletions WHERE deleted_at < LOCALTIMESTAMP - INTERVAL '30 days';
+        SELECT count(*) INTO changed FROM old_rows;
+        IF changed <= 50 THEN
+            SELECT json_agg(json_build_object(
+                'id', id, 'updated_at', LOCALTIMESTAMP, 'longitude', ST_X(location), 'latitude', ST_Y(location)
+            ))
+            INTO changes FROM old_rows;
+        END IF;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT count(*) INTO changed FROM new_rows;
+        IF changed <= 50 THEN
+            -- The old position too, so that feeds filtered by area see churches moving out of it
+            SELECT json_agg(json_build_object(
+                'id', n.id, 'updated_at', n.updated_at, 'longitude', ST_X(n.location), 'latitude', ST_Y(n.location),
+                'old_longitude', ST_X(o.location), 'old_latitude', ST_Y(o.location)
+            ))
+            INTO changes FROM new_rows n JOIN old_rows o ON o.id = n.id;
+        END IF;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+        IF changed <= 50 THEN
+            SELECT json_agg(json_build_object(
+                'id', id, 'updated_at', updated_at, 'longitude', ST_X(location), 'latitude', ST_Y(location)
+            ))
+            INTO changes FROM new_rows;
+        END IF;
+    END IF;
+
+    IF changed <> 0 THEN
+        -- churches_data_version fires first (triggers run in name order), so this is the version after the change
+        payload := json_build_object(
+            'op', lower(TG_OP),
+            'version', (SELECT version FROM church_data_version),
+            'count', changed,
+            'rows', changes
+        )::text;
+        -- pg_notify raises on payloads of 8000 bytes or more, which would roll the write back;
+        -- 50 updated rows with full-precision coordinates already get there, so send them as bulk
+        IF octet_length(payload) >= 8000 THEN
+            payload := json_build_object(
+                'op', lower(TG_OP),
+                'version', (SELECT version FROM church_data_version),
+                'count', changed,
+                'rows', NULL
+            )::text;
+        END IF;
+        PERFORM pg_notify('church_changes', payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Transition tables allow only one event per trigger
+CREATE OR REPLACE TRIGGER churches_notify_insert AFTER INSERT ON churches
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_church_changes();
+CREATE OR REPLACE TRIGGER churches_notify_update AFTER UPDATE ON churches
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_church_changes();
+CREATE OR REPLACE TRIGGER churches_notify_delete AFTER DELETE ON churches
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_church_changes();
+CREATE OR REPLACE TRIGGER churches_notify_truncate AFTER TRUNCATE ON churches
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_church_changes();
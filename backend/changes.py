@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import asyncpg
+import orjson
+from sqlalchemy import make_url
+
+import crud_async
+from cache import read_cache
+from database import ASYNC_DATABASE_URL, AsyncSessionLocal
+from metrics import CHANGE_FEED_NOTIFICATIONS, CHANGE_FEED_SUBSCRIBERS
+from pagination import encode_cursor
+from serializers import dumps
+
+# Change feed: the notify_church_changes trigger (change_tracking.sql) NOTIFYs once per
+# statement; one LISTEN connection per process fans that out to GET /churches/changes
+# streams and keeps the process's read cache in step with writes made anywhere.
+
+CHANNEL = "church_changes"
+# Events a stream may have queued before it counts as too slow; it is then ended
+# and the client resumes from its last event id
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("CHANGES_QUEUE_SIZE", "1000"))
+# Keep-alive comments on idle streams, and liveness checks of the LISTEN connection
+HEARTBEAT_INTERVAL = float(os.getenv("CHANGES_HEARTBEAT_INTERVAL", "15"))
+# Changes are stamped with their transaction's start time, so a slow transaction can
+# commit changes older than ones already sent; resumed feeds start this much earlier
+REPLAY_OVERLAP = timedelta(seconds=float(os.getenv("CHANGES_REPLAY_OVERLAP", "5")))
+REPLAY_BATCH_SIZE = 1000
+RECONNECT_MAX_DELAY = 30
+
+# Stream endings: after RESYNC the client resumes from its last event id (missed or bulk
+# changes are replayed from the database); after RESET it must reload everything (TRUNCATE)
+RESYNC = "resync"
+RESET = "reset"
+
+Position = namedtuple("Position", "updated_at id")
+
+logger = logging.getLogger("change_feed")
+
+
+def listen_dsn():
+    return make_url(ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def format_event(position: Position, name: str, data) -> bytes:
+    event_id = encode_cursor("updated", position)
+    return b"id: " + event_id.encode() + b"\nevent: " + name.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class Subscriber:
+    """One open stream: its area filter and the events waiting to be sent"""
+
+    def __init__(self, bbox=None):
+        self.bbox = bbox
+        self.queue = asyncio.Queue()
+        self.ended = False
+
+    def wants(self, *points) -> bool:
+        if self.bbox is None:
+            return True
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        return any(
+            longitude is not None and min_lng <= longitude <= max_lng and min_lat <= latitude <= max_lat
+            for longitude, latitude in points
+        )
+
+    def send(self, event):
+        if self.ended:
+            return
+        if self.queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+            return self.end(RESYNC)
+        self.queue.put_nowait(event)
+
+    def end(self, reason: str):
+        # Queued events are dropped; whatever they held is replayed when the client resumes
+        if self.ended:
+            return
+        self.ended = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(reason)
+
+
+class ChangeFeed:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.subscribers = set()
+        self._notifications = asyncio.Queue()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._dispatch())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._end_all(RESYNC)
+
+    def subscribe(self, bbox=None) -> Subscriber:
+        subscriber = Subscriber(bbox)
+        self.subscribers.add(subscriber)
+        CHANGE_FEED_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            CHANGE_FEED_SUBSCRIBERS.dec()
+
+    def _end_all(self, reason: str):
+        for subscriber in list(self.subscribers):
+            subscriber.end(reason)
+
+    def _notified(self, connection, pid, channel, payload):
+        # Handled in order by _dispatch; asyncpg calls this synchronously
+        self._notifications.put_nowait(payload)
+
+    async def _listen(self):
+        delay = 1
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(CHANNEL, self._notified)
+                # Anything that changed while nobody was listening was missed
+                await read_cache.invalidate()
+                self._end_all(RESYNC)
+                delay = 1
+                while True:
+                    await asyncio.sleep(HEARTBEAT_INTERVAL)
+                    # A dead connection would otherwise just look like a quiet one
+                    await connection.fetchval("SELECT 1", timeout=HEARTBEAT_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as exc:
+                logger.warning("Change feed not listening (%s); retrying in %ds", exc, delay)
+            finally:
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _dispatch(self):
+        while True:
+            payload = await self._notifications.get()
+            try:
+                await self._handle(orjson.loads(payload))
+            except Exception:
+                logger.exception("Cannot handle change notification")
+
+    async def _handle(self, message):
+        CHANGE_FEED_NOTIFICATIONS.labels(message["op"]).inc()
+        await read_cache.sync_database_version(message["version"])
+        if not self.subscribers:
+            return
+        if message["op"] == "truncate":
+            return self._end_all(RESET)
+        if message["rows"] is None:
+            # Too many rows for one payload: streams replay them from the database
+            return self._end_all(RESYNC)
+
+        for row in message["rows"]:
+            row["updated_at"] = datetime.fromisoformat(row["updated_at"])
+        if message["op"] == "delete":
+            for row in message["rows"]:
+                self._publish(Position(row["updated_at"], row["id"]), "delete", row, row)
+            return
+
+        # One query per notification, however many streams want the churches
+        wanted = [row for row in message["rows"] if any(subscriber.wants(*_points(row)) for subscriber in self.subscribers)]
+        if not wanted:
+            return
+        async with AsyncSessionLocal() as db:
+            churches = await crud_async.get_churches_by_id(db, [row["id"] for row in wanted])
+        for row in wanted:
+            church = churches.get(row["id"])
+            if church is not None:  # Deleted since; its delete notification follows
+                self._publish(Position(church["updated_at"], church["id"]), "upsert", church, row)
+
+    def _publish(self, position: Position, name: str, data, row):
+        points = _points(row)
+        event = (position, name, data)
+        for subscriber in list(self.subscribers):
+            if subscriber.wants(*points):
+                subscriber.send(event)
+
+
+def _points(row):
+    # Current position and, for updates, the previous one
+    return (row["longitude"], row["latitude"]), (row.get("old_longitude"), row.get("old_latitude"))
+
+
+async def replay(after: Position, bbox=None):
+    """(position, event, data) for every change after `after`, churches and deletions merged in feed order"""
+    while True:
+        async with AsyncSessionLocal() as db:
+            churches, deletions = await crud_async.get_changes(db, after, bbox=bbox, limit=REPLAY_BATCH_SIZE)
+        events = [(Position(church["updated_at"], church["id"]), "upsert", church) for church in churches]
+        events += [(Position(deletion["updated_at"], deletion["id"]), "delete", deletion) for deletion in deletions]
+        # Everything up to the batch size-th event of the merge is in one of the two batches
+        events = sorted(events, key=lambda event: event[0])[:REPLAY_BATCH_SIZE]
+        if not events:
+            return
+        for event in events:
+            yield event
+        after = events[-1][0]
+
+
+async def event_stream(feed: ChangeFeed, bbox=None, after: Position = None):
+    """Server-sent events: the changes after `after`, then live changes as they are notified.
+
+    Delivery is at least once: a change may be sent twice, never skipped.
+    """
+    # Subscribed before the replay, so that nothing committed during it is missed
+    subscriber = feed.subscribe(bbox)
+    try:
+        # EventSource reconnects by itself after a stream ends; a second is plenty
+        yield b"retry: 1000\n\n"
+        if after is None:
+            async with AsyncSessionLocal() as db:
+                position = Position(await crud_async.get_database_time(db), 0)
+        else:
+            position = after
+            async for position, name, data in replay(Position(after.updated_at - REPLAY_OVERLAP, after.id), bbox):
+                yield format_event(position, name, data)
+            position = max(position, after)
+        # Gives clients a position to resume from even if nothing changes before they disconnect
+        yield format_event(position, "ready", {})
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if event in (RESYNC, RESET):
+                yield b"event: " + event.encode() + b"\ndata: {}\n\n"
+                return
+            yield format_event(*event)
+    finally:
+        feed.unsubscribe(subscriber)
+
+
+change_feed = ChangeFeed(listen_dsn())
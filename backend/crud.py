@@ -1,291 +1,787 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, text
-from geoalchemy2 import functions as geo_func
-from geoalchemy2.elements import WKTElement
-from database import Church
-from schemas import ChurchCreate, ChurchUpdate
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import timezone
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import BigInteger, Float, Integer, Text, and_, case, cast, column, delete, func, insert, literal, or_, select, text, true, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY, array, insert as pg_insert
+from database import AdminRegion, AdminRegionPart, Church, ChurchDataVersion, ChurchDeletion
+from schemas import BulkChurchOperation, ChurchBase, ChurchCreate, ChurchFilters, ChurchUpdate, NearbyOrigin
 from typing import List, Optional
+from cache import bump_data_version
+from metrics import track_queries
+from serializers import RowSet, row_to_dict
 
-def get_church(db: Session, church_id: int):
-    return db.query(Church).filter(Church.id == church_id).first()
+# Below this zoom level points are aggregated into grid cells on the server
+CLUSTER_MAX_ZOOM = 15
+# Grid cells per 256px tile edge, i.e. one cluster per 32px square on screen
+CLUSTER_CELLS_PER_TILE = 8
+WEB_MERCATOR_WORLD_METERS = 40075016.68557849
 
-def get_churches(db: Session, skip: int = 0, limit: int = 100):
-    churches = db.query(
-        Church.id,
-        Church.osm_id,
-        Church.name,
-        Church.denomination,
-        Church.religion,
-        Church.amenity,
-        Church.building,
-        Church.address,
-        Church.phone,
-        Church.website,
-        Church.description,
-        Church.created_at,
-        Church.updated_at,
-        func.ST_X(Church.location).label('longitude'),
-        func.ST_Y(Church.location).label('latitude')
-    ).offset(skip).limit(limit).all()
-    
-    return [
-        {
-            'id': church.id,
-            'osm_id': church.osm_id,
-            'name': church.name,
-            'denomination': church.denomination,
-            'religion': church.religion,
-            'amenity': church.amenity,
-            'building': church.building,
-            'address': church.address,
-            'phone': church.phone,
-            'website': church.website,
-            'description': church.description,
-            'latitude': float(church.latitude) if church.latitude else None,
-            'longitude': float(church.longitude) if church.longitude else None,
-            'created_at': church.created_at,
-            'updated_at': church.updated_at
-        }
-        for church in churches
-    ]
+# Columns every church response is built from
+CHURCH_COLUMNS = (
+    Church.id,
+    Church.osm_id,
+    Church.name,
+    Church.denomination,
+    Church.religion,
+    Church.amenity,
+    Church.building,
+    Church.address,
+    Church.phone,
+    Church.website,
+    Church.description,
+    Church.created_at,
+    Church.updated_at,
+    func.ST_X(Church.location).label('longitude'),
+    func.ST_Y(Church.location).label('latitude'),
+)
 
-def create_church(db: Session, church: ChurchCreate):
-    point = WKTElement(f'POINT({church.longitude} {church.latitude})', srid=4326)
-    
-    db_church = Church(
-        osm_id=church.osm_id,
-        name=church.name,
-        denomination=church.denomination,
-        religion=church.religion,
-        amenity=church.amenity,
-        building=church.building,
-        location=point,
-        address=church.address,
-        phone=church.phone,
-        website=church.website,
-        description=church.description
+CHURCH_FIELDS = tuple(column.key for column in CHURCH_COLUMNS)
+
+# The statement builders below are shared by these sync functions and crud_async
+
+def location_point(latitude, longitude):
+    return func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
+
+def church_statement(church_id: int):
+    return select(*CHURCH_COLUMNS).where(Church.id == church_id)
+
+def data_version_statement():
+    return select(ChurchDataVersion.version, ChurchDataVersion.updated_at)
+
+def church_version_statement(church_id: int):
+    # The church's updated_at (NULL if there is no such church) and the table version, in one lookup
+    return select(Church.updated_at, ChurchDataVersion.version).select_from(ChurchDataVersion).outerjoin(
+        Church, Church.id == church_id
     )
-    db.add(db_church)
-    db.commit()
-    db.refresh(db_church)
-    
-    # Return with coordinates
-    result = db.query(
-        Church.id,
-        Church.osm_id,
-        Church.name,
+
+def churches_statement(limit: int = 100, after=None, order: str = 'id', skip: int = 0):
+    # Keyset pagination: `after` is the last key of the previous page, so every
+    # page is an index range scan instead of skipping over `skip` rows
+    if order == 'updated':
+        statement = select(*CHURCH_COLUMNS).order_by(Church.updated_at, Church.id)
+        if after is not None:
+            statement = statement.where(tuple_(Church.updated_at, Church.id) > tuple_(*after))
+    else:
+        statement = select(*CHURCH_COLUMNS).order_by(Church.id)
+        if after is not None:
+            statement = statement.where(Church.id > after)
+
+    if skip:
+        statement = statement.offset(skip)
+    return statement.limit(limit)
+
+def export_statement():
+    return select(*CHURCH_COLUMNS).order_by(Church.id)
+
+def insert_statement(church: ChurchCreate):
+    values = church.dict(exclude={'latitude', 'longitude'})
+    return insert(Church).values(
+        **values,
+        location=location_point(church.latitude, church.longitude)
+    ).returning(*CHURCH_COLUMNS)
+
+def update_statement(church_id: int, church_update: ChurchUpdate):
+    values = church_update.dict(exclude_unset=True)
+    latitude = values.pop('latitude', None)
+    longitude = values.pop('longitude', None)
+
+    # A single coordinate is combined with the stored other one inside the UPDATE
+    if latitude is not None or longitude is not None:
+        values['location'] = location_point(
+            latitude if latitude is not None else func.ST_Y(Church.location),
+            longitude if longitude is not None else func.ST_X(Church.location)
+        )
+
+    return update(Church).where(Church.id == church_id).values(**values).returning(*CHURCH_COLUMNS)
+
+def filter_conditions(filters: Optional[ChurchFilters]):
+    """WHERE conditions for the attribute and area filters of the search endpoints"""
+    if filters is None:
+        return []
+    conditions = []
+    if filters.denomination:
+        # GiST can't search `= ANY(...)`: only a single `=` lets the KNN scan use
+        # idx_churches_denomination_location_geog; several values are a plain filter
+        if len(filters.denomination) == 1:
+            conditions.append(Church.denomination == filters.denomination[0])
+        else:
+            conditions.append(Church.denomination.in_(filters.denomination))
+    if filters.building:
+        conditions.append(Church.building.in_(filters.building))
+    # IS [NOT] NULL exactly as in the partial index predicates
+    if filters.has_phone is not None:
+        conditions.append(Church.phone.isnot(None) if filters.has_phone else Church.phone.is_(None))
+    if filters.has_website is not None:
+        conditions.append(Church.website.isnot(None) if filters.has_website else Church.website.is_(None))
+    if filters.bbox:
+        conditions.append(func.ST_Intersects(Church.location, func.ST_MakeEnvelope(*filters.bbox, 4326)))
+    if filters.polygon:
+        ring = list(filters.polygon)
+        if ring[0] != ring[-1]:
+            ring.append(ring[0])
+        wkt = 'POLYGON((' + ', '.join(f'{lng!r} {lat!r}' for lng, lat in ring) + '))'
+        conditions.append(func.ST_Intersects(Church.location, func.ST_GeomFromText(wkt, 4326)))
+    return conditions
+
+def _search_match(query: str):
+    """(WHERE condition, rank) for a text query, or None if it has no words"""
+    # NFC first so decomposed Vietnamese diacritics don't split words
+    query = unicodedata.normalize('NFC', query)
+    words = re.findall(r'[^\W_]+', query)
+    if not words:
+        return None
+
+    # Every word is matched as a prefix so autocomplete works on partial input
+    ts_query = func.to_tsquery('simple', func.f_unaccent(' & '.join(f'{word}:*' for word in words)))
+    normalized = func.f_unaccent(func.lower(' '.join(words)))
+    escaped = query.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    substring = func.concat('%', func.f_unaccent(func.lower(escaped)), '%')
+    rank = func.ts_rank_cd(Church.search_vector, ts_query) + func.word_similarity(normalized, Church.search_text)
+
+    # Word prefixes via the tsvector GIN index; substrings and typos via the trigram index
+    condition = (
+        Church.search_vector.op('@@')(ts_query) |
+        Church.search_text.like(substring) |
+        normalized.op('<%')(Church.search_text)
+    )
+    return condition, rank
+
+def search_statement(query: str, limit: int = 50, filters: Optional[ChurchFilters] = None):
+    match = _search_match(query)
+    if match is None:
+        return None
+    condition, rank = match
+
+    return select(*CHURCH_COLUMNS).where(
+        condition,
+        *filter_conditions(filters)
+    ).order_by(
+        rank.desc().nulls_last(),
+        Church.id
+    ).limit(limit)
+
+def _nearby_condition(origin, radius_km):
+    return func.ST_DWithin(func.geography(Church.location), origin, radius_km * 1000, False)  # Convert km to meters
+
+def _origin(latitude, longitude):
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+
+def nearby_statement(latitude: float, longitude: float, radius_km: float = 10, limit: int = 50,
+                     filters: Optional[ChurchFilters] = None):
+    # The arguments may also be columns of an outer query (see nearby_batch_statement)
+    origin = _origin(latitude, longitude)
+    # Both sides must be the exact geography(location) expression so that
+    # ST_DWithin and the <-> KNN ordering use idx_churches_location_geog
+    # (or one of the filtered geography indexes).
+    location = func.geography(Church.location)
+
+    # Sphere distances (use_spheroid=false) like <-> itself, so the filter, the
+    # order and distance_meters agree with each other and with geo.distance_meters
+    return select(
+        *CHURCH_COLUMNS,
+        func.ST_Distance(location, origin, False).label('distance_meters')
+    ).where(
+        _nearby_condition(origin, radius_km),
+        *filter_conditions(filters)
+    ).order_by(
+        location.op('<->')(origin)
+    ).limit(limit)
+
+def facets_statement(area, filters: Optional[ChurchFilters] = None):
+    """Churches per denomination matching `area` and every filter except denomination itself,
+    so a client can show how many results each denomination choice would give"""
+    other_filters = filters.model_copy(update={'denomination': None}) if filters else None
+    count = func.count().label('count')
+    return select(
+        Church.denomination.label('value'),
+        count
+    ).where(
+        area,
+        *filter_conditions(other_filters)
+    ).group_by(Church.denomination).order_by(count.desc(), Church.denomination)
+
+def nearby_facets_statement(latitude: float, longitude: float, radius_km: float = 10,
+                            filters: Optional[ChurchFilters] = None):
+    return facets_statement(_nearby_condition(_origin(latitude, longitude), radius_km), filters)
+
+def search_facets_statement(query: str, filters: Optional[ChurchFilters] = None):
+    match = _search_match(query)
+    if match is None:
+        return None
+    return facets_statement(match[0], filters)
+
+def facet_counts(result):
+    return {'denomination': [{'value': value, 'count': count} for value, count in result]}
+
+def _array_param(values, item_type):
+    # Typed array parameters render with a ::type[] cast, so unnest() can be prepared
+    return literal(values, ARRAY(item_type))
+
+def nearby_batch_statement(origins: List[NearbyOrigin]):
+    """Nearest churches for many origins in one statement, rows tagged with the origin's index"""
+    params = func.unnest(
+        _array_param(list(range(len(origins))), Integer),
+        _array_param([origin.latitude for origin in origins], Float),
+        _array_param([origin.longitude for origin in origins], Float),
+        _array_param([origin.radius_km for origin in origins], Float),
+        _array_param([origin.limit for origin in origins], Integer),
+    ).table_valued(
+        column('origin', Integer),
+        column('latitude', Float),
+        column('longitude', Float),
+        column('radius_km', Float),
+        column('max_results', Integer),
+    ).render_derived(name='origins')
+
+    # One KNN index scan per origin, exactly as in the single-origin search
+    nearest = nearby_statement(
+        params.c.latitude,
+        params.c.longitude,
+        radius_km=params.c.radius_km,
+        limit=params.c.max_results
+    ).lateral('nearest')
+
+    return select(
+        params.c.origin,
+        *(nearest.c[key] for key in CHURCH_FIELDS + ('distance_meters',))
+    ).select_from(
+        params.join(nearest, true())
+    ).order_by(params.c.origin, nearest.c.distance_meters)
+
+def nearby_batch_results(origins: List[NearbyOrigin], result):
+    """Split nearby_batch_statement rows into one RowSet per origin, in request order"""
+    fields = tuple(result.keys())[1:]
+    grouped = [[] for _ in origins]
+    for row in result:
+        grouped[row[0]].append(row[1:])
+    return [RowSet(fields, rows) for rows in grouped]
+
+# Bulk writes: every operation of one kind is applied by a single statement over
+# unnest()ed parameter arrays, all in one transaction
+
+# Column -> element type of its parameter array
+BULK_COLUMNS = {
+    'id': Integer,
+    'osm_id': BigInteger,
+    **{field: Text for field in ChurchBase.model_fields},
+    'latitude': Float,
+    'longitude': Float,
+}
+
+def _bulk_params(names, rows):
+    return func.unnest(
+        *(_array_param([row[name] for row in rows], BULK_COLUMNS[name]) for name in names)
+    ).table_valued(
+        *(column(name, BULK_COLUMNS[name]) for name in names)
+    ).render_derived(name='v')
+
+def bulk_targets_statement(operations: List[BulkChurchOperation]):
+    """Lock the churches a batch targets, by id or osm_id, so their updated_at cannot change before commit"""
+    ids = [operation.id for operation in operations if operation.id is not None]
+    osm_ids = [operation.osm_id for operation in operations if operation.osm_id is not None]
+    return select(Church.id, Church.osm_id, Church.updated_at).where(
+        or_(Church.id.in_(ids), Church.osm_id.in_(osm_ids))
+    ).order_by(Church.id).with_for_update()
+
+def allocate_ids_statement(count: int):
+    # Ids for new churches, taken up front so every inserted row can be matched to its operation
+    return select(func.nextval(func.pg_get_serial_sequence('churches', 'id'))).select_from(func.generate_series(1, count))
+
+def bulk_insert_statement(rows):
+    """INSERT ... SELECT FROM unnest(...) ON CONFLICT (osm_id) DO NOTHING; rows carry their allocated id"""
+    names = list(BULK_COLUMNS)
+    params = _bulk_params(names, rows)
+    now = func.timezone('UTC', func.now())
+    fields = [name for name in names if name not in ('latitude', 'longitude')]
+    return pg_insert(Church).from_select(
+        fields + ['location', 'created_at', 'updated_at'],
+        select(*(params.c[name] for name in fields), location_point(params.c.latitude, params.c.longitude), now, now),
+        include_defaults=False,
+    ).on_conflict_do_nothing(index_elements=[Church.osm_id]).returning(*CHURCH_COLUMNS)
+
+def bulk_update_statement(names, rows):
+    """UPDATE ... FROM unnest(...) for updates that all set the same columns"""
+    params = _bulk_params(('id',) + names, rows)
+    values = {name: params.c[name] for name in names if name not in ('latitude', 'longitude')}
+    # As in update_statement, a single coordinate is combined with the stored other one
+    if 'latitude' in names or 'longitude' in names:
+        values['location'] = location_point(
+            params.c.latitude if 'latitude' in names else func.ST_Y(Church.location),
+            params.c.longitude if 'longitude' in names else func.ST_X(Church.location)
+        )
+    return update(Church).where(Church.id == params.c.id).values(**values).returning(*CHURCH_COLUMNS)
+
+def bulk_delete_statement(ids: List[int]):
+    return delete(Church).where(Church.id.in_(ids)).returning(Church.id)
+
+def churches_by_id_statement(ids: List[int]):
+    return select(*CHURCH_COLUMNS).where(Church.id.in_(ids))
+
+def naive_utc(moment):
+    # updated_at is a TIMESTAMP holding UTC
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+class BulkPlan:
+    """Checks a batch of operations against the locked rows they target and
+    builds the statements applying the ones that passed.
+
+    Run statements() in order, passing each one's rows to record(), then read results().
+    """
+
+    def __init__(self, operations: List[BulkChurchOperation], targets):
+        self.operations = operations
+        self.outcomes = {}  # index -> (status, church id, error)
+        self.churches = {}  # church id -> written (or, for conflicts, current) row
+        self.creates = []
+        self.updates = defaultdict(list)  # set columns -> [(index, id, values)]
+        self.deletes = []
+
+        by_id = {row.id: row for row in targets}
+        by_osm_id = {row.osm_id: row for row in targets if row.osm_id is not None}
+        seen = set()
+        for index, operation in enumerate(operations):
+            if operation.op == 'create':
+                existing = by_osm_id.get(operation.osm_id) if operation.osm_id is not None else None
+                if existing is not None:
+                    self.outcomes[index] = ('conflict', existing.id, 'osm_id already exists')
+                else:
+                    self.creates.append((index, operation.values()))
+                continue
+
+            row = by_id.get(operation.id) if operation.id is not None else by_osm_id.get(operation.osm_id)
+            if row is None:
+                self.outcomes[index] = ('not_found', None, 'church not found')
+            elif row.id in seen:
+                self.outcomes[index] = ('duplicate', row.id, 'church already changed by an earlier operation')
+            elif operation.if_updated_at is not None and naive_utc(operation.if_updated_at) != row.updated_at:
+                self.outcomes[index] = ('conflict', row.id, 'church was modified since if_updated_at')
+            elif operation.op == 'update':
+                values = operation.values()
+                self.updates[tuple(sorted(values))].append((index, row.id, values))
+            else:
+                self.deletes.append((index, row.id))
+            if row is not None:
+                seen.add(row.id)
+
+    @property
+    def failed(self):
+        return bool(self.outcomes)
+
+    def conflict_ids(self):
+        return [church_id for status, church_id, _ in self.outcomes.values() if status == 'conflict']
+
+    def statements(self, new_ids):
+        """(kind, operations, statement) per write statement; `new_ids` are allocated ids, one per create"""
+        if self.deletes:
+            yield 'deleted', self.deletes, bulk_delete_statement([church_id for _, church_id in self.deletes])
+        for names, updates in self.updates.items():
+            rows = [{'id': church_id, **values} for _, church_id, values in updates]
+            yield 'updated', updates, bulk_update_statement(names, rows)
+        if self.creates:
+            creates = [(index, church_id, values) for (index, values), church_id in zip(self.creates, new_ids)]
+            rows = [{'id': church_id, **values} for _, church_id, values in creates]
+            yield 'created', creates, bulk_insert_statement(rows)
+
+    def record(self, kind: str, operations, rows):
+        written = set()
+        for row in rows:
+            written.add(row.id)
+            if kind != 'deleted':
+                self.churches[row.id] = row_to_dict(CHURCH_FIELDS, row)
+        for index, church_id, *_ in operations:
+            if church_id in written:
+                self.outcomes[index] = (kind, church_id, None)
+            elif kind == 'created':
+                # Another writer inserted the same osm_id after the targets were locked
+                self.outcomes[index] = ('conflict', None, 'osm_id already exists')
+            else:
+                self.outcomes[index] = ('not_found', None, 'church not found')
+
+    def record_current(self, rows):
+        for row in rows:
+            self.churches[row.id] = row_to_dict(CHURCH_FIELDS, row)
+
+    @property
+    def written(self):
+        return any(status in ('created', 'updated', 'deleted') for status, _, _ in self.outcomes.values())
+
+    @property
+    def all_applied(self):
+        return all(status in ('created', 'updated', 'deleted') for status, _, _ in self.outcomes.values())
+
+    def results(self, applied: bool = True):
+        results = []
+        for index in range(len(self.operations)):
+            status, church_id, error = self.outcomes.get(index, ('aborted', None, None))
+            if not applied and status in ('created', 'updated', 'deleted', 'aborted'):
+                status, church_id, error = 'aborted', None, 'batch rolled back'
+            church = self.churches.get(church_id) if status != 'deleted' else None
+            results.append({'index': index, 'status': status, 'id': church_id, 'church': church, 'error': error})
+        return {'applied': applied, 'results': results}
+
+def _cluster_cell_size(zoom: int):
+    if zoom > CLUSTER_MAX_ZOOM:
+        return 1.0  # 1m cells: only exact duplicates are merged
+    return WEB_MERCATOR_WORLD_METERS / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+def clusters_statement(min_lng: float, min_lat: float, max_lng: float, max_lat: float, zoom: int, limit: int = 2000):
+    cell = _cluster_cell_size(zoom)
+    envelope = func.ST_MakeEnvelope(min_lng, min_lat, max_lng, max_lat, 4326)
+    projected = func.ST_Transform(Church.location, 3857)
+    count = func.count(Church.id)
+    longitude = func.avg(func.ST_X(Church.location)).label('longitude')
+    latitude = func.avg(func.ST_Y(Church.location)).label('latitude')
+
+    return select(
+        count.label('count'),
+        longitude,
+        latitude,
+        # Single-church cells carry enough to render a marker
+        case((count == 1, func.min(Church.id))).label('id'),
+        case((count == 1, func.min(Church.name))).label('name'),
+        case((count == 1, func.min(Church.denomination))).label('denomination')
+    ).where(
+        Church.location.op('&&')(envelope)
+    ).group_by(
+        func.floor(func.ST_X(projected) / cell),
+        func.floor(func.ST_Y(projected) / cell)
+    ).order_by(
+        # Largest clusters first, so the same ones survive the limit on every request
+        count.desc(), longitude, latitude
+    ).limit(limit)
+
+TILE_SQL = text("""
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+    ),
+    points AS (
+        SELECT c.id, c.name, c.denomination, ST_Transform(c.location, 3857) AS geom
+        FROM churches c, bounds b
+        WHERE c.location && ST_Transform(b.geom, 4326)
+    ),
+    clusters AS (
+        SELECT count(*) AS point_count,
+               CASE WHEN count(*) = 1 THEN min(id) END AS id,
+               CASE WHEN count(*) = 1 THEN min(name) END AS name,
+               CASE WHEN count(*) = 1 THEN min(denomination) END AS denomination,
+               ST_Centroid(ST_Collect(geom)) AS geom
+        FROM points
+        GROUP BY floor(ST_X(geom) / :cell), floor(ST_Y(geom) / :cell)
+    )
+    SELECT ST_AsMVT(tile, 'churches', 4096, 'geom')
+    FROM (
+        SELECT point_count, id, name, denomination,
+               ST_AsMVTGeom(clusters.geom, bounds.geom) AS geom
+        FROM clusters, bounds
+    ) AS tile
+""")
+
+def tile_params(z: int, x: int, y: int):
+    return {'z': z, 'x': x, 'y': y, 'cell': _cluster_cell_size(z)}
+
+# Change feed replay (changes.py): what changed after an (updated_at, id) position, in feed order
+
+def database_time_statement():
+    # The clock updated_at and deleted_at are stamped with
+    return select(func.localtimestamp())
+
+def changed_churches_statement(after, bbox=None, limit: int = 1000):
+    return select(*CHURCH_COLUMNS).where(
+        tuple_(Church.updated_at, Church.id) > tuple_(*after),
+        *_bbox_conditions(bbox)
+    ).order_by(Church.updated_at, Church.id).limit(limit)
+
+def deleted_churches_statement(after, bbox=None, limit: int = 1000):
+    return select(
+        ChurchDeletion.id,
+        ChurchDeletion.deleted_at.label('updated_at'),
+        func.ST_X(ChurchDeletion.location).label('longitude'),
+        func.ST_Y(ChurchDeletion.location).label('latitude'),
+    ).where(
+        tuple_(ChurchDeletion.deleted_at, ChurchDeletion.id) > tuple_(*after),
+        *_bbox_conditions(bbox, ChurchDeletion.location)
+    ).order_by(ChurchDeletion.deleted_at, ChurchDeletion.id).limit(limit)
+
+# Spatial analytics, aggregated in the database
+
+# Resolutions per density grid: geohash precision (5 is about 4.9km x 4.9km), or hexagon
+# level, whose edge is HEX_LEVEL0_SIZE / 2**level Web Mercator metres (level 7: about 3.9km)
+DENSITY_RESOLUTIONS = {'geohash': range(1, 10), 'hex': range(0, 11)}
+HEX_LEVEL0_SIZE = 500_000.0
+# Upper bounds (km) of the nearest-neighbour distance histogram buckets; the last bucket is open
+NN_DISTANCE_BUCKETS_KM = (1, 2, 5, 10, 20, 50)
+NN_DISTANCE_PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+def _bbox_conditions(bbox, location=Church.location):
+    return [location.op('&&')(func.ST_MakeEnvelope(*bbox, 4326))] if bbox else []
+
+def _hex_cells(size: float, conditions):
+    """(i, j, count) per occupied hexagon of ST_Hexagon(size, i, j) on Web Mercator.
+
+    Like the cluster grid, every point is binned arithmetically, so only occupied
+    cells are ever produced, however fine the grid.
+    """
+    projected = func.ST_Transform(Church.location, 3857)
+    x = func.ST_X(projected, type_=Float)
+    y = func.ST_Y(projected, type_=Float)
+    # Fractional axial coordinates of flat-topped hexagons
+    points = select(
+        (x * (2 / 3 / size)).label('q'),
+        ((y * math.sqrt(3) - x) * (1 / 3 / size)).label('r'),
+    ).where(*conditions).subquery('points')
+
+    # Cube rounding: the coordinate that rounding moved the most is recomputed from the other two
+    q, r = points.c.q, points.c.r
+    rq, rr, rs = (func.round(value, type_=Float) for value in (q, r, -q - r))
+    dq, dr, ds = (func.abs(value, type_=Float) for value in (rq - q, rr - r, rs + q + r))
+    axial = select(
+        case((and_(dq > dr, dq > ds), -rr - rs), else_=rq).label('q'),
+        case((and_(dq > dr, dq > ds), rr), (dr > ds, -rq - rs), else_=rr).label('r'),
+    ).subquery('axial')
+
+    # ST_Hexagon numbers columns by q and rows by offset, odd columns shifted up half a row
+    i = cast(axial.c.q, Integer)
+    j = cast(axial.c.r + func.floor(axial.c.q * 0.5, type_=Float), Integer)
+    return select(
+        i.label('i'), j.label('j'), func.count().label('count')
+    ).group_by(i, j).subquery('cells')
+
+def density_statement(grid: str, resolution: int, bbox=None):
+    """Churches per occupied cell, densest first: cell id, count, cell centre, area and density"""
+    conditions = _bbox_conditions(bbox)
+    if grid == 'geohash':
+        cell = func.ST_GeoHash(Church.location, resolution)
+        cells = select(
+            cell.label('cell'), func.count().label('count')
+        ).where(*conditions).group_by(cell).subquery('cells')
+        shapes = select(cells.c.cell, cells.c.count, func.ST_GeomFromGeoHash(cells.c.cell).label('geom')).subquery('shapes')
+    else:
+        size = HEX_LEVEL0_SIZE / 2 ** resolution
+        cells = _hex_cells(size, conditions)
+        shapes = select(
+            func.concat(cells.c.i, ',', cells.c.j).label('cell'),
+            cells.c.count,
+            func.ST_Transform(func.ST_Hexagon(size, cells.c.i, cells.c.j), 4326).label('geom'),
+        ).subquery('shapes')
+
+    centre = func.ST_Centroid(shapes.c.geom)
+    area = func.ST_Area(func.geography(shapes.c.geom), False, type_=Float) / 1e6  # km2 on the sphere
+    return select(
+        shapes.c.cell,
+        shapes.c.count,
+        func.ST_Y(centre).label('latitude'),
+        func.ST_X(centre).label('longitude'),
+        area.label('area_km2'),
+        (shapes.c.count * 100 / area).label('per_100_km2'),
+    ).order_by(shapes.c.count.desc(), shapes.c.cell)
+
+def dbscan_statement(eps_km: float, min_points: int, bbox=None, limit: int = 500):
+    """Summaries of ST_ClusterDBSCAN clusters, largest first, after one row for the unclustered churches"""
+    conditions = _bbox_conditions(bbox)
+    # Web Mercator stretches distances by 1/cos(latitude); eps is scaled at the area's mean latitude
+    scale = select(func.cos(func.radians(func.avg(func.ST_Y(Church.location))), type_=Float)).where(*conditions).scalar_subquery()
+    points = select(
+        Church.location,
         Church.denomination,
-        Church.religion,
-        Church.amenity,
-        Church.building,
-        Church.address,
-        Church.phone,
-        Church.website,
-        Church.description,
-        Church.created_at,
-        Church.updated_at,
-        func.ST_X(Church.location).label('longitude'),
-        func.ST_Y(Church.location).label('latitude')
-    ).filter(Church.id == db_church.id).first()
-    
+        func.ST_ClusterDBSCAN(func.ST_Transform(Church.location, 3857), eps_km * 1000 / scale, min_points).over().label('cluster'),
+    ).where(*conditions).subquery('points')
+
+    collected = func.ST_Collect(points.c.location)
+    clusters = select(
+        points.c.cluster,
+        func.count().label('count'),
+        func.ST_Centroid(collected).label('centre'),
+        collected.label('points'),
+        func.min(func.ST_X(points.c.location)).label('min_lng'),
+        func.min(func.ST_Y(points.c.location)).label('min_lat'),
+        func.max(func.ST_X(points.c.location)).label('max_lng'),
+        func.max(func.ST_Y(points.c.location)).label('max_lat'),
+        func.mode().within_group(points.c.denomination).label('top_denomination'),
+    ).group_by(points.c.cluster).subquery('clusters')
+
+    return select(
+        clusters.c.cluster,
+        clusters.c.count,
+        func.ST_Y(clusters.c.centre).label('latitude'),
+        func.ST_X(clusters.c.centre).label('longitude'),
+        # Centre to the farthest member
+        func.ST_Length(func.geography(func.ST_LongestLine(clusters.c.centre, clusters.c.points)), False).label('radius_meters'),
+        clusters.c.min_lng,
+        clusters.c.min_lat,
+        clusters.c.max_lng,
+        clusters.c.max_lat,
+        clusters.c.top_denomination,
+    ).order_by(clusters.c.cluster.isnot(None), clusters.c.count.desc(), clusters.c.cluster).limit(limit + 1)
+
+def dbscan_results(result, limit: int):
+    clusters = [row._asdict() for row in result]
+    noise = clusters.pop(0)['count'] if clusters and clusters[0]['cluster'] is None else 0
+    # The statement's extra row is the noise row when there is one, and one cluster too many when there is not
+    return {'clusters': clusters[:limit], 'noise': noise}
+
+def region_code(location):
+    """Code of the admin region containing `location`, via the subdivided region polygons"""
+    return select(AdminRegionPart.code).where(
+        func.ST_Covers(AdminRegionPart.geom, location)
+    ).limit(1).scalar_subquery()
+
+def nearest_distances_statement():
+    """Distribution of every church's distance to its nearest neighbour, per admin region and overall"""
+    other = aliased(Church)
+    origin = func.geography(Church.location)
+    # One KNN index scan per church on idx_churches_location_geog, as in nearby_statement
+    nearest = select(
+        func.ST_Distance(func.geography(other.location), origin, False).label('distance')
+    ).where(
+        other.id != Church.id
+    ).order_by(
+        func.geography(other.location).op('<->')(origin)
+    ).limit(1).lateral('nearest')
+    located = select(
+        region_code(Church.location).label('code'), nearest.c.distance
+    ).select_from(Church).join(nearest, true()).subquery('located')
+
+    distance = located.c.distance
+    edges = [0] + [km * 1000 for km in NN_DISTANCE_BUCKETS_KM]
+    histogram = array([
+        func.count().filter(and_(distance >= low, distance < high)) for low, high in zip(edges, edges[1:])
+    ] + [func.count().filter(distance >= edges[-1])])
+    total = func.grouping(located.c.code) == 1
+
+    return select(
+        case((total, '*'), else_=func.coalesce(located.c.code, '')).label('region_code'),
+        case((total, 'All churches'), else_=func.coalesce(AdminRegion.name, 'Outside regions')).label('region'),
+        func.count().label('churches'),
+        func.avg(distance).label('mean_meters'),
+        func.min(distance).label('min_meters'),
+        func.max(distance).label('max_meters'),
+        func.percentile_cont(_array_param(list(NN_DISTANCE_PERCENTILES), Float)).within_group(distance).label('percentiles_meters'),
+        histogram.label('histogram'),
+    ).select_from(
+        located.outerjoin(AdminRegion, AdminRegion.code == located.c.code)
+    ).group_by(
+        func.grouping_sets(tuple_(located.c.code, AdminRegion.name), tuple_())
+    ).order_by(total.desc(), func.count().desc())
+
+def nearest_distances_results(result):
     return {
-        'id': result.id,
-        'osm_id': result.osm_id,
-        'name': result.name,
-        'denomination': result.denomination,
-        'religion': result.religion,
-        'amenity': result.amenity,
-        'building': result.building,
-        'address': result.address,
-        'phone': result.phone,
-        'website': result.website,
-        'description': result.description,
-        'latitude': float(result.latitude) if result.latitude else None,
-        'longitude': float(result.longitude) if result.longitude else None,
-        'created_at': result.created_at,
-        'updated_at': result.updated_at
+        'buckets_km': list(NN_DISTANCE_BUCKETS_KM),
+        'percentiles': list(NN_DISTANCE_PERCENTILES),
+        'regions': [row._asdict() for row in result],
     }
 
+@track_queries
+def get_church(db: Session, church_id: int):
+    return row_to_dict(CHURCH_FIELDS, db.execute(church_statement(church_id)).first())
+
+@track_queries
+def get_data_version(db: Session):
+    """(version, updated_at) of the churches table, bumped by every write to it"""
+    return tuple(db.execute(data_version_statement()).one())
+
+@track_queries
+def get_church_version(db: Session, church_id: int):
+    """(updated_at of the church or None, table version)"""
+    return tuple(db.execute(church_version_statement(church_id)).one())
+
+@track_queries
+def get_churches(db: Session, limit: int = 100, after=None, order: str = 'id', skip: int = 0):
+    statement = churches_statement(limit=limit, after=after, order=order, skip=skip)
+    return RowSet.from_result(db.execute(statement))
+
+@track_queries
+def create_church(db: Session, church: ChurchCreate):
+    # INSERT ... RETURNING: one round-trip, coordinates included
+    created = db.execute(insert_statement(church)).first()
+    db.commit()
+    bump_data_version()
+    return row_to_dict(CHURCH_FIELDS, created)
+
+@track_queries
 def update_church(db: Session, church_id: int, church_update: ChurchUpdate):
-    db_church = db.query(Church).filter(Church.id == church_id).first()
-    if not db_church:
-        return None
-    
-    update_data = church_update.dict(exclude_unset=True)
-    
-    # Handle location update
-    if 'latitude' in update_data and 'longitude' in update_data:
-        point = WKTElement(f'POINT({update_data["longitude"]} {update_data["latitude"]})', srid=4326)
-        db_church.location = point
-        del update_data['latitude']
-        del update_data['longitude']
-    elif 'latitude' in update_data or 'longitude' in update_data:
-        # If only one coordinate is provided, we need both
-        current = db.query(
-            func.ST_X(Church.location).label('longitude'),
-            func.ST_Y(Church.location).label('latitude')
-        ).filter(Church.id == church_id).first()
-        
-        lat = update_data.get('latitude', float(current.latitude))
-        lng = update_data.get('longitude', float(current.longitude))
-        point = WKTElement(f'POINT({lng} {lat})', srid=4326)
-        db_church.location = point
-        
-        if 'latitude' in update_data:
-            del update_data['latitude']
-        if 'longitude' in update_data:
-            del update_data['longitude']
-    
-    # Update other fields
-    for field, value in update_data.items():
-        setattr(db_church, field, value)
-    
+    updated = db.execute(update_statement(church_id, church_update)).first()
     db.commit()
-    db.refresh(db_church)
-    
-    # Return with coordinates
-    result = db.query(
-        Church.id,
-        Church.osm_id,
-        Church.name,
-        Church.denomination,
-        Church.religion,
-        Church.amenity,
-        Church.building,
-        Church.address,
-        Church.phone,
-        Church.website,
-        Church.description,
-        Church.created_at,
-        Church.updated_at,
-        func.ST_X(Church.location).label('longitude'),
-        func.ST_Y(Church.location).label('latitude')
-    ).filter(Church.id == church_id).first()
-    
-    return {
-        'id': result.id,
-        'osm_id': result.osm_id,
-        'name': result.name,
-        'denomination': result.denomination,
-        'religion': result.religion,
-        'amenity': result.amenity,
-        'building': result.building,
-        'address': result.address,
-        'phone': result.phone,
-        'website': result.website,
-        'description': result.description,
-        'latitude': float(result.latitude) if result.latitude else None,
-        'longitude': float(result.longitude) if result.longitude else None,
-        'created_at': result.created_at,
-        'updated_at': result.updated_at
-    }
+    if updated is None:
+        return None
+    bump_data_version()
+    return row_to_dict(CHURCH_FIELDS, updated)
 
+@track_queries
 def delete_church(db: Session, church_id: int):
-    db_church = db.query(Church).filter(Church.id == church_id).first()
-    if db_church:
-        db.delete(db_church)
-        db.commit()
+    result = db.execute(delete(Church).where(Church.id == church_id))
+    db.commit()
+    if result.rowcount:
+        bump_data_version()
         return True
     return False
 
-def search_churches(db: Session, query: str, limit: int = 50):
-    churches = db.query(
-        Church.id,
-        Church.osm_id,
-        Church.name,
-        Church.denomination,
-        Church.religion,
-        Church.amenity,
-        Church.building,
-        Church.address,
-        Church.phone,
-        Church.website,
-        Church.description,
-        Church.created_at,
-        Church.updated_at,
-        func.ST_X(Church.location).label('longitude'),
-        func.ST_Y(Church.location).label('latitude')
-    ).filter(
-        Church.name.ilike(f'%{query}%') |
-        Church.denomination.ilike(f'%{query}%') |
-        Church.address.ilike(f'%{query}%')
-    ).limit(limit).all()
-    
-    return [
-        {
-            'id': church.id,
-            'osm_id': church.osm_id,
-            'name': church.name,
-            'denomination': church.denomination,
-            'religion': church.religion,
-            'amenity': church.amenity,
-            'building': church.building,
-            'address': church.address,
-            'phone': church.phone,
-            'website': church.website,
-            'description': church.description,
-            'latitude': float(church.latitude) if church.latitude else None,
-            'longitude': float(church.longitude) if church.longitude else None,
-            'created_at': church.created_at,
-            'updated_at': church.updated_at
-        }
-        for church in churches
-    ]
-
-def find_nearby_churches(db: Session, latitude: float, longitude: float, radius_km: float = 10, limit: int = 50):
-    point = WKTElement(f'POINT({longitude} {latitude})', srid=4326)
-    
-    churches = db.query(
-        Church.id,
-        Church.osm_id,
-        Church.name,
-        Church.denomination,
-        Church.religion,
-        Church.amenity,
-        Church.building,
-        Church.address,
-        Church.phone,
-        Church.website,
-        Church.description,
-        Church.created_at,
-        Church.updated_at,
-        func.ST_X(Church.location).label('longitude'),
-        func.ST_Y(Church.location).label('latitude'),
-        func.ST_Distance(
-            func.ST_Transform(Church.location, 3857),
-            func.ST_Transform(point, 3857)
-        ).label('distance')
-    ).filter(
-        func.ST_DWithin(
-            func.ST_Transform(Church.location, 3857),
-            func.ST_Transform(point, 3857),
-            radius_km * 1000  # Convert km to meters
-        )
-    ).order_by(
-        func.ST_Distance(
-            func.ST_Transform(Church.location, 3857),
-            func.ST_Transform(point, 3857)
-        )
-    ).limit(limit).all()
-    
-    return [
-        {
-            'id': church.id,
-            'osm_id': church.osm_id,
-            'name': church.name,
-            'denomination': church.denomination,
-            'religion': church.religion,
-            'amenity': church.amenity,
-            'building': church.building,
-            'address': church.address,
-            'phone': church.phone,
-            'website': church.website,
-            'description': church.description,
-            'latitude': float(church.latitude) if church.latitude else None,
-            'longitude': float(church.longitude) if church.longitude else None,
-            'distance_meters': float(church.distance) if church.distance else None,
-            'created_at': church.created_at,
-            'updated_at': church.updated_at
-        }
-        for church in churches
-    ]
+@track_queries
+def bulk_write(db: Session, operations: List[BulkChurchOperation], atomic: bool = False):
+    plan = BulkPlan(operations, db.execute(bulk_targets_statement(operations)).all())
+    if not (atomic and plan.failed):
+        new_ids = db.execute(allocate_ids_statement(len(plan.creates))).scalars().all() if plan.creates else []
+        for kind, kind_operations, statement in plan.statements(new_ids):
+            plan.record(kind, kind_operations, db.execute(statement).all())
+    if plan.conflict_ids():
+        # Conflicting clients get the current state to merge with
+        plan.record_current(db.execute(churches_by_id_statement(plan.conflict_ids())))
+    if atomic and not plan.all_applied:
+        db.rollback()
+        return plan.results(applied=False)
+    db.commit()
+    if plan.written:
+        bump_data_version()
+    return plan.results()
+
+@track_queries
+def search_churches(db: Session, query: str, limit: int = 50, filters: Optional[ChurchFilters] = None):
+    statement = search_statement(query, limit=limit, filters=filters)
+    if statement is None:
+        return RowSet(CHURCH_FIELDS, [])
+    return RowSet.from_result(db.execute(statement))
+
+@track_queries
+def get_search_facets(db: Session, query: str, filters: Optional[ChurchFilters] = None):
+    statement = search_facets_statement(query, filters=filters)
+    if statement is None:
+        return facet_counts([])
+    return facet_counts(db.execute(statement))
+
+@track_queries
+def find_nearby_churches(db: Session, latitude: float, longitude: float, radius_km: float = 10, limit: int = 50,
+                         filters: Optional[ChurchFilters] = None):
+    statement = nearby_statement(latitude, longitude, radius_km=radius_km, limit=limit, filters=filters)
+    return RowSet.from_result(db.execute(statement))
+
+@track_queries
+def get_nearby_facets(db: Session, latitude: float, longitude: float, radius_km: float = 10,
+                      filters: Optional[ChurchFilters] = None):
+    return facet_counts(db.execute(nearby_facets_statement(latitude, longitude, radius_km=radius_km, filters=filters)))
+
+@track_queries
+def find_nearby_churches_batch(db: Session, origins: List[NearbyOrigin]):
+    return nearby_batch_results(origins, db.execute(nearby_batch_statement(origins)))
+
+@track_queries
+def get_church_clusters(db: Session, min_lng: float, min_lat: float, max_lng: float, max_lat: float, zoom: int, limit: int = 2000):
+    return RowSet.from_result(db.execute(clusters_statement(min_lng, min_lat, max_lng, max_lat, zoom, limit=limit)))
+
+@track_queries
+def get_church_tile(db: Session, z: int, x: int, y: int):
+    tile = db.execute(TILE_SQL, tile_params(z, x, y)).scalar()
+    return bytes(tile) if tile else b''
+
+@track_queries
+def get_church_density(db: Session, grid: str, resolution: int, bbox=None):
+    return RowSet.from_result(db.execute(density_statement(grid, resolution, bbox)))
+
+@track_queries
+def get_dbscan_clusters(db: Session, eps_km: float, min_points: int, bbox=None, limit: int = 500):
+    return dbscan_results(db.execute(dbscan_statement(eps_km, min_points, bbox, limit)), limit)
+
+@track_queries
+def get_nearest_distances(db: Session):
+    return nearest_distances_results(db.execute(nearest_distances_statement()))
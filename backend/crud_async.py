@@ -0,0 +1,150 @@
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Church
+from typing import List, Optional
+from schemas import BulkChurchOperation, ChurchCreate, ChurchFilters, ChurchUpdate, NearbyOrigin
+from cache import read_cache
+from metrics import track_queries
+from serializers import RowSet, row_to_dict
+import crud
+
+# Async counterparts of the functions in crud, built on the same statements
+
+@track_queries
+async def get_church(db: AsyncSession, church_id: int):
+    church = (await db.execute(crud.church_statement(church_id))).first()
+    return row_to_dict(crud.CHURCH_FIELDS, church)
+
+@track_queries
+async def get_data_version(db: AsyncSession):
+    return tuple((await db.execute(crud.data_version_statement())).one())
+
+@track_queries
+async def get_church_version(db: AsyncSession, church_id: int):
+    return tuple((await db.execute(crud.church_version_statement(church_id))).one())
+
+@track_queries
+async def get_churches(db: AsyncSession, limit: int = 100, after=None, order: str = 'id', skip: int = 0):
+    statement = crud.churches_statement(limit=limit, after=after, order=order, skip=skip)
+    return RowSet.from_result(await db.execute(statement))
+
+@track_queries
+async def stream_churches(db: AsyncSession, batch_size: int = 1000):
+    # Server-side cursor: only one batch of rows is held in memory at a time
+    result = await db.stream(crud.export_statement().execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+@track_queries
+async def create_church(db: AsyncSession, church: ChurchCreate):
+    # INSERT ... RETURNING: one round-trip, coordinates included
+    created = (await db.execute(crud.insert_statement(church))).first()
+    await db.commit()
+    await read_cache.invalidate()
+    return row_to_dict(crud.CHURCH_FIELDS, created)
+
+@track_queries
+async def update_church(db: AsyncSession, church_id: int, church_update: ChurchUpdate):
+    updated = (await db.execute(crud.update_statement(church_id, church_update))).first()
+    await db.commit()
+    if updated is None:
+        return None
+    await read_cache.invalidate()
+    return row_to_dict(crud.CHURCH_FIELDS, updated)
+
+@track_queries
+async def delete_church(db: AsyncSession, church_id: int):
+    result = await db.execute(delete(Church).where(Church.id == church_id))
+    await db.commit()
+    if result.rowcount:
+        await read_cache.invalidate()
+        return True
+    return False
+
+@track_queries
+async def bulk_write(db: AsyncSession, operations: List[BulkChurchOperation], atomic: bool = False):
+    plan = crud.BulkPlan(operations, (await db.execute(crud.bulk_targets_statement(operations))).all())
+    if not (atomic and plan.failed):
+        new_ids = (await db.execute(crud.allocate_ids_statement(len(plan.creates)))).scalars().all() if plan.creates else []
+        for kind, kind_operations, statement in plan.statements(new_ids):
+            plan.record(kind, kind_operations, (await db.execute(statement)).all())
+    if plan.conflict_ids():
+        # Conflicting clients get the current state to merge with
+        plan.record_current(await db.execute(crud.churches_by_id_statement(plan.conflict_ids())))
+    if atomic and not plan.all_applied:
+        await db.rollback()
+        return plan.results(applied=False)
+    await db.commit()
+    if plan.written:
+        await read_cache.invalidate()
+    return plan.results()
+
+@track_queries
+async def get_churches_by_id(db: AsyncSession, ids: List[int]):
+    """Church dicts keyed by id; missing ids are left out"""
+    rows = (await db.execute(crud.churches_by_id_statement(ids))).all()
+    return {row.id: row_to_dict(crud.CHURCH_FIELDS, row) for row in rows}
+
+@track_queries
+async def get_database_time(db: AsyncSession):
+    return (await db.execute(crud.database_time_statement())).scalar_one()
+
+@track_queries
+async def get_changes(db: AsyncSession, after, bbox=None, limit: int = 1000):
+    """Churches changed and churches deleted after an (updated_at, id) position, as two lists of dicts"""
+    changed = RowSet.from_result(await db.execute(crud.changed_churches_statement(after, bbox=bbox, limit=limit)))
+    deleted = RowSet.from_result(await db.execute(crud.deleted_churches_statement(after, bbox=bbox, limit=limit)))
+    return changed.to_dicts(), deleted.to_dicts()
+
+@track_queries
+async def search_churches(db: AsyncSession, query: str, limit: int = 50, filters: Optional[ChurchFilters] = None):
+    statement = crud.search_statement(query, limit=limit, filters=filters)
+    if statement is None:
+        return RowSet(crud.CHURCH_FIELDS, [])
+    return RowSet.from_result(await db.execute(statement))
+
+@track_queries
+async def get_search_facets(db: AsyncSession, query: str, filters: Optional[ChurchFilters] = None):
+    statement = crud.search_facets_statement(query, filters=filters)
+    if statement is None:
+        return crud.facet_counts([])
+    return crud.facet_counts(await db.execute(statement))
+
+@track_queries
+async def find_nearby_churches(db: AsyncSession, latitude: float, longitude: float, radius_km: float = 10, limit: int = 50,
+                               filters: Optional[ChurchFilters] = None):
+    statement = crud.nearby_statement(latitude, longitude, radius_km=radius_km, limit=limit, filters=filters)
+    return RowSet.from_result(await db.execute(statement))
+
+@track_queries
+async def get_nearby_facets(db: AsyncSession, latitude: float, longitude: float, radius_km: float = 10,
+                            filters: Optional[ChurchFilters] = None):
+    statement = crud.nearby_facets_statement(latitude, longitude, radius_km=radius_km, filters=filters)
+    return crud.facet_counts(await db.execute(statement))
+
+@track_queries
+async def find_nearby_churches_batch(db: AsyncSession, origins: List[NearbyOrigin]):
+    result = await db.execute(crud.nearby_batch_statement(origins))
+    return crud.nearby_batch_results(origins, result)
+
+@track_queries
+async def get_church_clusters(db: AsyncSession, min_lng: float, min_lat: float, max_lng: float, max_lat: float, zoom: int, limit: int = 2000):
+    statement = crud.clusters_statement(min_lng, min_lat, max_lng, max_lat, zoom, limit=limit)
+    return RowSet.from_result(await db.execute(statement))
+
+@track_queries
+async def get_church_tile(db: AsyncSession, z: int, x: int, y: int):
+    tile = (await db.execute(crud.TILE_SQL, crud.tile_params(z, x, y))).scalar()
+    return bytes(tile) if tile else b''
+
+@track_queries
+async def get_church_density(db: AsyncSession, grid: str, resolution: int, bbox=None):
+    return RowSet.from_result(await db.execute(crud.density_statement(grid, resolution, bbox)))
+
+@track_queries
+async def get_dbscan_clusters(db: AsyncSession, eps_km: float, min_points: int, bbox=None, limit: int = 500):
+    return crud.dbscan_results(await db.execute(crud.dbscan_statement(eps_km, min_points, bbox, limit)), limit)
+
+@track_queries
+async def get_nearest_distances(db: AsyncSession):
+    return crud.nearest_distances_results(await db.execute(crud.nearest_distances_statement()))
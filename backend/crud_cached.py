@@ -0,0 +1,166 @@
+import os
+import re
+import unicodedata
+from datetime import datetime
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+import crud_async
+import geo
+from cache import read_cache
+from schemas import ChurchFilters
+from serializers import RowSet, columns, dumps, encode_rows
+
+# Read-through cache in front of crud_async for the hot read endpoints.
+# Functions return the encoded body, or None when there is nothing to return;
+# lists are encoded in the requested serializers.ROW_FORMATS format.
+
+# Geohash precision of nearby-search cells; 6 is roughly 1.2km x 0.6km
+NEARBY_CELL_PRECISION = int(os.getenv("NEARBY_CACHE_PRECISION", "6"))
+# Requested radii are rounded up to one of these before caching
+NEARBY_RADIUS_BUCKETS_KM = (1, 2, 5, 10, 25, 50, 100)
+# Cells with more candidates than this are queried directly every time
+NEARBY_MAX_CANDIDATES = 1000
+
+
+# Validators for conditional requests always come from the database
+get_data_version = crud_async.get_data_version
+get_church_version = crud_async.get_church_version
+
+
+async def get_church(db: AsyncSession, church_id: int):
+    async def load():
+        church = await crud_async.get_church(db, church_id=church_id)
+        return dumps(church) if church is not None else None
+
+    return await read_cache.get_or_load("church", (church_id,), load)
+
+
+def _normalize_query(query: str):
+    # Queries that differ only in case, spacing or Unicode form share an entry
+    return " ".join(re.findall(r"[^\W_]+", unicodedata.normalize("NFC", query).lower()))
+
+
+def _filters_key(filters: Optional[ChurchFilters]):
+    return filters.cache_key() if filters is not None else ""
+
+
+async def search_churches(db: AsyncSession, query: str, limit: int = 50, filters: Optional[ChurchFilters] = None,
+                          format: str = "json"):
+    async def load():
+        return encode_rows(format, await crud_async.search_churches(db, query=query, limit=limit, filters=filters))
+
+    return await read_cache.get_or_load(
+        "search", (format, limit, _normalize_query(query), _filters_key(filters)), load
+    )
+
+
+async def get_search_facets(db: AsyncSession, query: str, filters: Optional[ChurchFilters] = None):
+    async def load():
+        return dumps(await crud_async.get_search_facets(db, query=query, filters=filters))
+
+    return await read_cache.get_or_load("search_facets", (_normalize_query(query), _filters_key(filters)), load)
+
+
+def _radius_bucket(radius_km: float):
+    return next((bucket for bucket in NEARBY_RADIUS_BUCKETS_KM if bucket >= radius_km), radius_km)
+
+
+def _datetime_columns(rowset: RowSet):
+    """Indexes of the columns holding datetimes, which JSON turns into strings"""
+    return [
+        index for index, values in enumerate(columns(rowset).values())
+        if isinstance(next((value for value in values if value is not None), None), datetime)
+    ]
+
+
+async def find_nearby_churches(db: AsyncSession, latitude: float, longitude: float, radius_km: float = 10, limit: int = 50,
+                               filters: Optional[ChurchFilters] = None, format: str = "json"):
+    cell = geo.geohash_encode(latitude, longitude, NEARBY_CELL_PRECISION)
+    bucket = _radius_bucket(radius_km)
+
+    async def load():
+        # Every church within `bucket` of any point in the cell is within
+        # bucket + half-diagonal of its centre, so one query serves the whole cell
+        centre_lat, centre_lng, half_diagonal = geo.geohash_cell(cell)
+        candidates = await crud_async.find_nearby_churches(
+            db,
+            latitude=centre_lat,
+            longitude=centre_lng,
+            radius_km=bucket + half_diagonal / 1000,
+            limit=NEARBY_MAX_CANDIDATES + 1,
+            filters=filters
+        )
+        if len(candidates) > NEARBY_MAX_CANDIDATES:
+            return b""  # Too dense: remembered so the next request skips straight to the database
+        return orjson.dumps({
+            "fields": candidates.fields, "rows": candidates.rows, "datetimes": _datetime_columns(candidates),
+        })
+
+    # Filters only remove rows, so filtered candidates are cached per cell the same way
+    cached = await read_cache.get_or_load("nearby_cell", (cell, bucket, _filters_key(filters)), load)
+    if not cached:
+        return encode_rows(format, await crud_async.find_nearby_churches(
+            db, latitude=latitude, longitude=longitude, radius_km=radius_km, limit=limit, filters=filters
+        ))
+
+    # Re-rank the cell's candidates for the exact request point
+    candidates = orjson.loads(cached)
+    fields = candidates["fields"]
+    lat_index = fields.index("latitude")
+    lng_index = fields.index("longitude")
+    max_distance = radius_km * 1000
+
+    ranked = []
+    for row in candidates["rows"]:
+        distance = geo.distance_meters(latitude, longitude, row[lat_index], row[lng_index])
+        if distance <= max_distance:
+            ranked.append((distance, row[0], row))
+    ranked.sort(key=lambda item: item[:2])
+
+    # Same types as a direct query, so every format encodes them the same way; only the returned rows are parsed
+    datetimes = candidates["datetimes"]
+    rows = []
+    for distance, _, row in ranked[:limit]:
+        for index in datetimes:
+            if row[index] is not None:
+                row[index] = datetime.fromisoformat(row[index])
+        # distance_meters is the last column; replace the centre's distance with the request's
+        rows.append(row[:-1] + [distance])
+    return encode_rows(format, RowSet(fields, rows))
+
+
+async def get_nearby_facets(db: AsyncSession, latitude: float, longitude: float, radius_km: float = 10,
+                            filters: Optional[ChurchFilters] = None):
+    # Counts depend on the exact circle, so unlike the results they can't be shared per cell
+    return dumps(await crud_async.get_nearby_facets(
+        db, latitude=latitude, longitude=longitude, radius_km=radius_km, filters=filters
+    ))
+
+
+# Spatial analytics scan every church, so results are kept until the next write.
+# Resolutions come from a small fixed set, which bounds the number of entries.
+
+async def get_church_density(db: AsyncSession, grid: str, resolution: int, bbox=None, format: str = "json"):
+    async def load():
+        return encode_rows(format, await crud_async.get_church_density(db, grid=grid, resolution=resolution, bbox=bbox))
+
+    return await read_cache.get_or_load("density", (format, grid, resolution, bbox or ""), load)
+
+
+async def get_dbscan_clusters(db: AsyncSession, eps_km: float, min_points: int, bbox=None, limit: int = 500):
+    async def load():
+        return dumps(await crud_async.get_dbscan_clusters(
+            db, eps_km=eps_km, min_points=min_points, bbox=bbox, limit=limit
+        ))
+
+    return await read_cache.get_or_load("dbscan", (eps_km, min_points, limit, bbox or ""), load)
+
+
+async def get_nearest_distances(db: AsyncSession):
+    async def load():
+        return dumps(await crud_async.get_nearest_distances(db))
+
+    return await read_cache.get_or_load("nearest_distances", (), load)
@@ -0,0 +1,49 @@
+import os
+from datetime import datetime
+
+from offline_index import ChurchIndex
+from serializers import dumps, encode_rows
+
+# Read-only counterparts of the crud_cached read functions, answered from a
+# memory-mapped offline_index snapshot instead of Postgres. `db` is unused and
+# only kept so that main.py can call either module the same way; so is `filters`,
+# which main.py never passes here (filtered searches need the database).
+
+OFFLINE_SNAPSHOT = os.getenv("OFFLINE_SNAPSHOT", "offline_snapshot")
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = ChurchIndex(OFFLINE_SNAPSHOT)
+    return _index
+
+
+async def get_data_version(db):
+    # The snapshot never changes while it is being served; a rebuild is a new version
+    built_at = get_index().manifest['built_at']
+    return built_at, datetime.fromisoformat(built_at)
+
+
+async def get_church_version(db, church_id: int):
+    church = get_index().get(church_id)
+    built_at = get_index().manifest['built_at']
+    if church is None:
+        return None, built_at
+    return datetime.fromisoformat(church['updated_at'] or built_at), built_at
+
+
+async def get_church(db, church_id: int):
+    church = get_index().get(church_id)
+    return dumps(church) if church is not None else None
+
+
+async def search_churches(db, query: str, limit: int = 50, filters=None, format: str = "json"):
+    return encode_rows(format, get_index().search(query, limit=limit))
+
+
+async def find_nearby_churches(db, latitude: float, longitude: float, radius_km: float = 10, limit: int = 50, filters=None,
+                               format: str = "json"):
+    return encode_rows(format, get_index().nearby(latitude, longitude, radius_km=radius_km, limit=limit))
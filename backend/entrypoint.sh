@@ -3,35 +3,14 @@ set -e
 
 echo "Starting backend service..."
 
-# Wait for database to be ready
-echo "Waiting for database to be ready..."
-while ! pg_isready -h db -p 5432 -U postgres; do
-    echo "Database is not ready yet. Waiting..."
-    sleep 2
-done
+# No waiting for the database here: workers start serving at once and keep retrying
+# their pool warm-up until it answers; GET /ready reports when they are warm.
 
-echo "Database is ready!"
-
-# Check if data has already been imported
-echo "Checking if data import is needed..."
-CHURCH_COUNT=$(python -c "
-from database import get_db, Church
-db = next(get_db())
-count = db.query(Church).count()
-db.close()
-print(count)
-")
-
-echo "Current church count: $CHURCH_COUNT"
-
-if [ "$CHURCH_COUNT" -eq "0" ]; then
-    echo "No churches found in database. Running data import..."
-    python import_data.py
-    echo "Data import completed!"
-else
-    echo "Churches already exist in database. Skipping import."
+# Data import runs separately (import_job.sh), so replicas start straight away
+if [ "${APP_ENV:-production}" = "development" ]; then
+    echo "Starting FastAPI application with auto-reload..."
+    exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
 fi
 
-# Start the FastAPI application
-echo "Starting FastAPI application..."
-exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+echo "Starting FastAPI application under gunicorn..."
+exec gunicorn -c gunicorn.conf.py main:app
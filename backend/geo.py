@@ -0,0 +1,75 @@
+import math
+
+# Radius of the sphere PostGIS uses for geography <-> and use_spheroid=false
+# distances, so that distances computed here match the database exactly
+EARTH_RADIUS_METERS = 6371008.7714150598
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 6) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # geohash bits alternate longitude, latitude, longitude, ...
+
+    while len(chars) < precision:
+        coordinate, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str):
+    """(min_lat, min_lng, max_lat, max_lng) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lng_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if value >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def distance_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance on the PostGIS sphere"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    sin_dphi = math.sin((phi2 - phi1) / 2)
+    sin_dlambda = math.sin(math.radians(lng2 - lng1) / 2)
+    a = sin_dphi * sin_dphi + math.cos(phi1) * math.cos(phi2) * sin_dlambda * sin_dlambda
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_cell(geohash: str):
+    """Centre of a geohash cell and the distance from it to the farthest corner"""
+    min_lat, min_lng, max_lat, max_lng = geohash_bounds(geohash)
+    latitude = (min_lat + max_lat) / 2
+    longitude = (min_lng + max_lng) / 2
+    # The corner nearer the equator is the farthest one
+    corner_lat = min_lat if abs(min_lat) < abs(max_lat) else max_lat
+    return latitude, longitude, distance_meters(latitude, longitude, corner_lat, max_lng)
@@ -0,0 +1,97 @@
+"""Production server: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+One worker per CPU by default. Each worker gets its share of a connection
+budget derived from Postgres max_connections, so that all workers of all
+replicas together can never exhaust the server:
+
+    per worker = (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) / APP_REPLICAS / workers
+
+That share is split between the worker's async pool, its nearest-job
+processes, which hold one connection each, and the change feed's LISTEN
+connection. Explicit DB_POOL_SIZE /
+DB_MAX_OVERFLOW / NEAREST_JOB_PROCESSES settings win over the derived ones.
+"""
+import os
+import shutil
+import tempfile
+
+# Connection budget
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))  # Postgres max_connections
+# Left for everything that is not an API worker: analytics, imports, Metabase, psql, superuser slots
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "20"))
+APP_REPLICAS = int(os.getenv("APP_REPLICAS", "1"))
+# Fewer connections than this per worker and requests mostly queue for the pool
+MIN_CONNECTIONS_PER_WORKER = 4
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))  # Honours container CPU pinning
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+cpus = available_cpus()
+budget = max(1, (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // APP_REPLICAS)
+requested_workers = int(os.getenv("WEB_CONCURRENCY", "0")) or cpus
+workers = max(1, min(requested_workers, budget // MIN_CONNECTIONS_PER_WORKER))
+per_worker = budget // workers
+
+# Up to a quarter of the worker's share, and its share of the CPUs, for nearest-job processes;
+# the rest for request handling
+job_processes = int(os.environ.setdefault(
+    "NEAREST_JOB_PROCESSES", str(max(1, min(per_worker // 4, cpus // workers))),
+))
+# One more for the change feed's LISTEN connection (changes.py)
+pool_connections = max(1, per_worker - job_processes - 1)
+pool_size = int(os.environ.setdefault("DB_POOL_SIZE", str(max(1, pool_connections * 3 // 4))))
+max_overflow = int(os.environ.setdefault("DB_MAX_OVERFLOW", str(max(0, pool_connections - pool_size))))
+
+# Metrics from every worker are aggregated through files in this directory. It has to be
+# emptied before the (preloaded) app is imported, which happens before any server hook runs.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "church-api-metrics"))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master; workers fork with it already loaded
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+# Seconds a worker may take to finish in-flight requests after SIGTERM
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Idle keep-alive; keep it above the load balancer's idle timeout to avoid races on reused connections
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+# Recycle workers now and then; the jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+
+
+def on_starting(server):
+    total = workers * (pool_size + max_overflow + job_processes + 1)
+    server.log.info(
+        "%d workers x (pool %d + overflow %d + %d job processes + 1 listener) = %d connections per replica, budget %d",
+        workers, pool_size, max_overflow, job_processes, total, budget,
+    )
+    if workers < requested_workers:
+        server.log.warning("Capped at %d workers to stay within the connection budget", workers)
+    if total > budget:
+        server.log.warning("Explicit pool settings exceed the connection budget of %d", budget)
+
+
+def post_fork(server, worker):
+    # A preloaded app's pools are copied into every worker; connections must never
+    # be shared between processes, so drop any the master may hold without closing them
+    from database import async_engine, engine
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,196 @@
+import email.utils
+import os
+import zlib
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are only gzip-compressed
+    brotli = None
+
+# Conditional GETs and response compression for the read endpoints
+
+# Seconds clients may reuse a read response without asking again. The default, 0,
+# makes them revalidate every time, which with an ETag costs a 304 and no body.
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+# Smaller bodies are sent as they are; compressing them saves less than the headers cost
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Brotli 4 compresses better than gzip 6 at about the same CPU cost
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Streams whose chunks must reach the client as they are produced
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def cache_control():
+    if HTTP_CACHE_MAX_AGE > 0:
+        return f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+    return "no-cache"
+
+
+class Validator:
+    """ETag and Last-Modified of one response, from a data version and its modification time.
+
+    `vary` names the request headers that select between representations of
+    the same data; each representation needs its own `tag`.
+    """
+
+    __slots__ = ("etag", "last_modified", "vary")
+
+    def __init__(self, tag: str, modified_at: datetime, vary: str = None):
+        # Weak: the same data may be sent with different content encodings
+        self.etag = f'W/"{tag}"'
+        self.vary = vary
+        if modified_at.tzinfo is None:
+            modified_at = modified_at.replace(tzinfo=timezone.utc)  # TIMESTAMP columns hold UTC
+        # HTTP dates have one-second resolution
+        self.last_modified = modified_at.astimezone(timezone.utc).replace(microsecond=0)
+
+    def headers(self):
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": email.utils.format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": cache_control(),
+        }
+        if self.vary:
+            headers["Vary"] = self.vary
+        return headers
+
+    def matches(self, request_headers) -> bool:
+        """Whether the client's copy is current, per If-None-Match or else If-Modified-Since"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            current = self.etag.removeprefix("W/")
+            return any(tag.strip().removeprefix("W/") == current for tag in if_none_match.split(","))
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return self.last_modified <= since
+
+    def check(self, request):
+        """Answer 304 Not Modified, before any query runs, if the client's copy is current"""
+        if self.matches(request.headers):
+            raise HTTPException(status_code=304, headers=self.headers())
+        return self
+
+    def apply(self, response):
+        response.headers.update(self.headers())
+        return response
+
+
+def accepted_encoding(accept_encoding: str):
+    """br or gzip, whichever the client accepts and prefers, or None"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        if params.strip().startswith("q="):
+            try:
+                weight = float(params.strip()[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    default = weights.get("*", 0.0)
+    candidates = [("br", 1), ("gzip", 0)] if brotli is not None else [("gzip", 0)]
+    # Highest q-value wins; on a tie brotli, which compresses better
+    weight, _, coding = max((weights.get(coding, default), preference, coding) for coding, preference in candidates)
+    return coding if weight > 0 else None
+
+
+class _Compressor:
+    def __init__(self, coding: str):
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compressed `data`, flushed so the client can decode it without waiting for more"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with brotli (if installed) or gzip.
+
+    Bodies under COMPRESSION_MIN_SIZE, responses that already have a
+    Content-Encoding and event streams are passed through untouched.
+    Streamed responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        coding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                return await send(message)
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or headers.get("content-type", "").startswith(UNCOMPRESSED_TYPES):
+                    passthrough = True
+                    return await send(message)
+                start = message  # Held back until the first body chunk shows how big the body is
+                return
+
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+
+                compressor = _Compressor(coding)
+                headers["Content-Encoding"] = coding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": body})
+                await send(start)
+
+            body = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
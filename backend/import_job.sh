@@ -0,0 +1,21 @@
+#!/bin/bash
+set -e
+
+# One-shot data import, run once per deployment rather than by every API replica:
+#   docker compose run --rm importer
+
+# Wait for database to be ready
+echo "Waiting for database to be ready..."
+while ! pg_isready -h db -p 5432 -U postgres; do
+    echo "Database is not ready yet. Waiting..."
+    sleep 2
+done
+
+echo "Database is ready!"
+
+# Full import into an empty database, otherwise a sync of the changes since the last one;
+# decided inside the importer, so the check does not start an interpreter of its own
+python import_data.py --auto
+
+# Admin regions for the regional analytics; only loaded once, reload by hand after changing the file
+python load_regions.py --if-empty
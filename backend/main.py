@@ -1,13 +1,60 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, File, Header, HTTPException, Path, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Literal, Optional
 
 import crud
+import crud_async
+import crud_cached
+import http_cache
+import metrics
+import nearest_jobs
 import schemas
-from database import get_db
+import warmup
+from cache import data_version, read_cache, tile_cache
+from changes import Position, change_feed, event_stream
+from database import AsyncSessionLocal, async_engine, engine, get_async_db
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from serializers import ROW_FORMATS, FastJSONResponse, encode_rows, negotiate_format, stream_export
+
+# CHURCH_READ_ENGINE=offline answers GET /churches/{id}, text and nearby search
+# from a prebuilt offline_index snapshot, without touching Postgres
+OFFLINE_READS = os.getenv("CHURCH_READ_ENGINE", "postgres") == "offline"
+if OFFLINE_READS:
+    import crud_offline as read_crud
+else:
+    read_crud = crud_cached
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "churches.ndjson"),
+    "geojson": ("application/geo+json", "churches.geojson"),
+    "csv": ("text/csv; charset=utf-8", "churches.csv"),
+}
 
-app = FastAPI(title="Church Location Search API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if OFFLINE_READS:
+        # No Postgres to listen to or warm up: ready once the snapshot is mapped
+        warming = asyncio.create_task(warmup.load_snapshot(read_crud.get_index))
+    else:
+        # One LISTEN connection per worker: feeds GET /churches/changes and keeps the read cache fresh
+        change_feed.start()
+        # Serving starts right away; GET /ready reports when the pool is warm
+        warming = asyncio.create_task(warmup.warm_up())
+    yield
+    warming.cancel()
+    if not OFFLINE_READS:
+        await change_feed.stop()
+
+# Handlers return FastJSONResponse themselves: the rows are already in the
+# response shape, so response_model only documents it and is not re-validated
+app = FastAPI(title="Church Location Search API", version="1.0.0", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -16,116 +63,424 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link"],
 )
+app.add_middleware(http_cache.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engines({"sync": engine, "async": async_engine.sync_engine})
+
+def parse_bbox(bbox: str):
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lng,min_lat,max_lng,max_lat")
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise HTTPException(status_code=400, detail="bbox minimums must be below maximums")
+    return min_lng, min_lat, max_lng, max_lat
+
+def parse_polygon(polygon: str):
+    try:
+        values = [float(value) for value in polygon.split(",")]
+    except ValueError:
+        values = []
+    if len(values) < 6 or len(values) % 2:
+        raise HTTPException(status_code=400, detail="polygon must be lng,lat,lng,lat,... with at least 3 vertices")
+    vertices = list(zip(values[::2], values[1::2]))
+    if len(vertices) > 1000:
+        raise HTTPException(status_code=400, detail="polygon may have at most 1000 vertices")
+    if not all(-180 <= lng <= 180 and -90 <= lat <= 90 for lng, lat in vertices):
+        raise HTTPException(status_code=400, detail="polygon coordinates out of range")
+    return vertices
+
+def church_filters(
+    denomination: Optional[List[str]] = Query(None, description="Repeat for any of several, e.g. catholic"),
+    building: Optional[List[str]] = Query(None, description="Repeat for any of several, e.g. church"),
+    has_phone: Optional[bool] = Query(None),
+    has_website: Optional[bool] = Query(None),
+    bbox: Optional[str] = Query(None, description="Only inside min_lng,min_lat,max_lng,max_lat"),
+    polygon: Optional[str] = Query(None, description="Only inside the ring lng,lat,lng,lat,..."),
+):
+    filters = schemas.ChurchFilters(
+        denomination=[value.strip().lower() for value in denomination] if denomination else None,
+        building=[value.strip().lower() for value in building] if building else None,
+        has_phone=has_phone,
+        has_website=has_website,
+        bbox=parse_bbox(bbox) if bbox else None,
+        polygon=parse_polygon(polygon) if polygon else None,
+    )
+    if filters.is_empty():
+        return None
+    if OFFLINE_READS:
+        raise HTTPException(status_code=501, detail="Filters need the database; the offline engine does not support them")
+    return filters
+
+def row_format(request: Request):
+    """serializers.ROW_FORMATS name negotiated from the Accept header"""
+    format = negotiate_format(request.headers.get("accept", ""))
+    if format is None:
+        supported = ", ".join(media_type for media_type, _ in ROW_FORMATS.values())
+        raise HTTPException(status_code=406, detail=f"Supported response types: {supported}")
+    return format
+
+def rows_response(format: str, body: bytes):
+    return Response(body, media_type=ROW_FORMATS[format][0])
+
+async def _table_validator(source, request: Request, db: AsyncSession, format: str = None):
+    version, modified_at = await source.get_data_version(db)
+    # Keeps this worker's read and tile caches in step with writes made by other workers or imports,
+    # so a body served under a new ETag is never a stale cached one
+    await read_cache.sync_database_version(version)
+    if format is None:
+        return http_cache.Validator(f"v{version}", modified_at).check(request)
+    return http_cache.Validator(f"v{version}-{format}", modified_at, vary="Accept").check(request)
+
+async def data_validator(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """ETag / Last-Modified from the table version; answers 304 before the endpoint queries anything"""
+    return await _table_validator(crud_async, request, db)
+
+async def rows_validator(
+    request: Request, format: str = Depends(row_format), db: AsyncSession = Depends(get_async_db)
+):
+    """data_validator for row lists, which have one representation per format"""
+    return await _table_validator(crud_async, request, db, format)
+
+async def read_validator(
+    request: Request, format: str = Depends(row_format), db: AsyncSession = Depends(get_async_db)
+):
+    """rows_validator for the endpoints the offline engine can answer, from its snapshot when it does"""
+    return await _table_validator(read_crud, request, db, format)
+
+async def church_validator(church_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    # From the church's own updated_at, so writes to other churches keep its ETag valid
+    updated_at, version = await read_crud.get_church_version(db, church_id=church_id)
+    await read_cache.sync_database_version(version)
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Church not found")
+    return http_cache.Validator(f"{church_id}-{updated_at.isoformat()}", updated_at).check(request)
+
+def with_facets(format: str, churches: bytes, facets: bytes):
+    # Both parts are already encoded JSON
+    return rows_response(format, b'{"churches":' + churches + b',"facets":' + facets + b'}')
+
+def check_facets(format: str):
+    if OFFLINE_READS:
+        raise HTTPException(status_code=501, detail="Facets need the database; the offline engine does not support them")
+    if not ROW_FORMATS[format][0].endswith("json"):
+        raise HTTPException(status_code=406, detail="Facets are only available in the JSON formats")
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Church Location Search API"}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    # Unlike /health, only OK once this worker's pool is warm; for load balancer readiness probes
+    status = warmup.readiness.status()
+    return FastJSONResponse(status, status_code=200 if warmup.readiness.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"data_version": await read_cache.version(), **read_cache.stats()}
+
 @app.get("/churches", response_model=List[schemas.ChurchInDB])
-def get_churches(
-    skip: int = Query(0, ge=0),
+async def get_churches(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    order: Literal["id", "updated"] = Query("id", description="id, or updated for a change feed"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Use cursor instead"),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    format: str = Depends(row_format),
+    validator: http_cache.Validator = Depends(rows_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(order, cursor)
+        except InvalidCursor as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    churches = await crud_async.get_churches(db, limit=limit, after=after, order=order, skip=skip if after is None else 0)
+    response = rows_response(format, encode_rows(format, churches))
+
+    # A full page means there may be more; the cursor points past its last row
+    if len(churches) == limit:
+        last = churches.rows[-1]
+        next_cursor = encode_cursor(order, last)
+        next_url = request.url.remove_query_params("skip").include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return validator.apply(response)
+
+@app.get("/churches/export")
+async def export_churches(
+    format: Literal["ndjson", "geojson", "csv"] = Query("ndjson"),
+    validator: http_cache.Validator = Depends(data_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    media_type, filename = EXPORT_FORMATS[format]
+    # The validator's session is not needed while the export streams from its own
+    await db.close()
+
+    async def body():
+        # Own session: it has to stay open for as long as the response streams
+        async with AsyncSessionLocal() as db:
+            async for chunk in stream_export(crud_async.stream_churches(db), crud.CHURCH_FIELDS, format):
+                yield chunk
+
+    return validator.apply(StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    ))
+
+@app.get("/churches/clusters", response_model=List[schemas.ChurchCluster])
+async def get_church_clusters(
+    bbox: str = Query(..., description="Viewport as min_lng,min_lat,max_lng,max_lat"),
+    zoom: int = Query(..., ge=0, le=22),
+    validator: http_cache.Validator = Depends(data_validator),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    churches = crud.get_churches(db, skip=skip, limit=limit)
-    return churches
+    min_lng, min_lat, max_lng, max_lat = parse_bbox(bbox)
+    clusters = await crud_async.get_church_clusters(
+        db,
+        min_lng=min_lng,
+        min_lat=min_lat,
+        max_lng=max_lng,
+        max_lat=max_lat,
+        zoom=zoom
+    )
+    return validator.apply(FastJSONResponse(clusters))
+
+@app.get("/churches/tiles/{z}/{x}/{y}")
+async def get_church_tile(
+    request: Request,
+    z: int = Path(..., ge=0, le=22),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    validator = await data_validator(request, db)
+
+    # Read the version before querying so a concurrent write can only
+    # leave a stale tile under a key that is never looked up again
+    key = (z, x, y, data_version())
+    tile = tile_cache.get(key)
+    if tile is None:
+        tile = await crud_async.get_church_tile(db, z=z, x=x, y=y)
+        tile_cache.set(key, tile)
+
+    return validator.apply(Response(content=tile, media_type="application/vnd.mapbox-vector-tile"))
+
+# Spatial analytics: aggregated in the database and cached until the next write
+
+DEFAULT_DENSITY_RESOLUTIONS = {"geohash": 5, "hex": 7}
+
+@app.get("/churches/density", response_model=List[schemas.DensityCell])
+async def get_church_density(
+    grid: Literal["hex", "geohash"] = Query("hex"),
+    resolution: Optional[int] = Query(None, description="Geohash precision 1-9 (default 5), or hexagon level 0-10 (default 7, edges of about 3.9km)"),
+    bbox: Optional[str] = Query(None, description="Only churches inside min_lng,min_lat,max_lng,max_lat"),
+    format: str = Depends(row_format),
+    validator: http_cache.Validator = Depends(rows_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if resolution is None:
+        resolution = DEFAULT_DENSITY_RESOLUTIONS[grid]
+    allowed = crud.DENSITY_RESOLUTIONS[grid]
+    if resolution not in allowed:
+        raise HTTPException(status_code=400, detail=f"{grid} resolution must be between {allowed[0]} and {allowed[-1]}")
+    cells = await crud_cached.get_church_density(
+        db, grid=grid, resolution=resolution, bbox=parse_bbox(bbox) if bbox else None, format=format
+    )
+    return validator.apply(rows_response(format, cells))
+
+@app.get("/churches/clusters/dbscan", response_model=schemas.DbscanClusters)
+async def get_dbscan_clusters(
+    eps_km: float = Query(2, gt=0, le=50, description="Neighbourhood radius in kilometers"),
+    min_points: int = Query(5, ge=2, le=1000, description="Churches needed within eps_km to form a cluster"),
+    bbox: Optional[str] = Query(None, description="Only churches inside min_lng,min_lat,max_lng,max_lat"),
+    limit: int = Query(500, ge=1, le=5000),
+    validator: http_cache.Validator = Depends(data_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    clusters = await crud_cached.get_dbscan_clusters(
+        db, eps_km=eps_km, min_points=min_points, bbox=parse_bbox(bbox) if bbox else None, limit=limit
+    )
+    return validator.apply(FastJSONResponse(clusters))
+
+@app.get("/churches/nearest-distances", response_model=schemas.NearestDistances)
+async def get_nearest_distances(
+    validator: http_cache.Validator = Depends(data_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Distance from every church to its nearest neighbour, summarised per admin region
+    distances = await crud_cached.get_nearest_distances(db)
+    return validator.apply(FastJSONResponse(distances))
+
+@app.get("/churches/changes")
+async def stream_changes(
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None, description="Replay changes made after this time"),
+    cursor: Optional[str] = Query(None, description="Resume after this event id"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """Server-sent events: upsert / delete per changed church, resumable by event id"""
+    if OFFLINE_READS:
+        raise HTTPException(status_code=503, detail="The change feed needs Postgres; not available in offline mode")
+    after = None
+    # EventSource sends Last-Event-ID by itself when it reconnects
+    if cursor or last_event_id:
+        try:
+            after = Position(*decode_cursor("updated", cursor or last_event_id))
+        except InvalidCursor as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    elif since is not None:
+        after = Position(crud.naive_utc(since), 0)
+
+    return StreamingResponse(
+        event_stream(change_feed, parse_bbox(bbox) if bbox else None, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/churches/{church_id}", response_model=schemas.ChurchInDB)
-def get_church(church_id: int, db: Session = Depends(get_db)):
-    church = crud.get_church(db, church_id=church_id)
+async def get_church(
+    church_id: int,
+    validator: http_cache.Validator = Depends(church_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    church = await read_crud.get_church(db, church_id=church_id)
     if church is None:
         raise HTTPException(status_code=404, detail="Church not found")
-    
-    # Get coordinates for the response
-    from sqlalchemy import func
-    result = db.query(
-        crud.Church.id,
-        crud.Church.osm_id,
-        crud.Church.name,
-        crud.Church.denomination,
-        crud.Church.religion,
-        crud.Church.amenity,
-        crud.Church.building,
-        crud.Church.address,
-        crud.Church.phone,
-        crud.Church.website,
-        crud.Church.description,
-        crud.Church.created_at,
-        crud.Church.updated_at,
-        func.ST_X(crud.Church.location).label('longitude'),
-        func.ST_Y(crud.Church.location).label('latitude')
-    ).filter(crud.Church.id == church_id).first()
-    
-    return {
-        'id': result.id,
-        'osm_id': result.osm_id,
-        'name': result.name,
-        'denomination': result.denomination,
-        'religion': result.religion,
-        'amenity': result.amenity,
-        'building': result.building,
-        'address': result.address,
-        'phone': result.phone,
-        'website': result.website,
-        'description': result.description,
-        'latitude': float(result.latitude) if result.latitude else None,
-        'longitude': float(result.longitude) if result.longitude else None,
-        'created_at': result.created_at,
-        'updated_at': result.updated_at
-    }
+    return validator.apply(FastJSONResponse(church))
 
 @app.post("/churches", response_model=schemas.ChurchInDB)
-def create_church(church: schemas.ChurchCreate, db: Session = Depends(get_db)):
-    return crud.create_church(db=db, church=church)
+async def create_church(church: schemas.ChurchCreate, db: AsyncSession = Depends(get_async_db)):
+    created = await crud_async.create_church(db=db, church=church)
+    return FastJSONResponse(created)
 
 @app.put("/churches/{church_id}", response_model=schemas.ChurchInDB)
-def update_church(
-    church_id: int, 
-    church_update: schemas.ChurchUpdate, 
-    db: Session = Depends(get_db)
+async def update_church(
+    church_id: int,
+    church_update: schemas.ChurchUpdate,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    church = crud.update_church(db, church_id=church_id, church_update=church_update)
+    church = await crud_async.update_church(db, church_id=church_id, church_update=church_update)
     if church is None:
         raise HTTPException(status_code=404, detail="Church not found")
-    return church
+    return FastJSONResponse(church)
 
 @app.delete("/churches/{church_id}")
-def delete_church(church_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_church(db, church_id=church_id)
+async def delete_church(church_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await crud_async.delete_church(db, church_id=church_id)
     if not success:
         raise HTTPException(status_code=404, detail="Church not found")
     return {"message": "Church deleted successfully"}
 
+@app.post("/churches/bulk", response_model=schemas.BulkChurchResponse)
+async def bulk_write_churches(bulk: schemas.BulkChurchRequest, db: AsyncSession = Depends(get_async_db)):
+    # One transaction, one statement per kind of operation; per-operation results in request order
+    result = await crud_async.bulk_write(db, operations=bulk.operations, atomic=bulk.atomic)
+    return FastJSONResponse(result, status_code=200 if result["applied"] else 409)
+
+FACETS_DESCRIPTION = 'Respond with {"churches": [...], "facets": {"denomination": [{"value", "count"}]}} (JSON formats only)'
+
 @app.get("/churches/search/text", response_model=List[schemas.ChurchInDB])
-def search_churches(
+async def search_churches(
     q: str = Query(..., description="Search query"),
     limit: int = Query(50, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    facets: bool = Query(False, description=FACETS_DESCRIPTION),
+    filters: Optional[schemas.ChurchFilters] = Depends(church_filters),
+    format: str = Depends(row_format),
+    validator: http_cache.Validator = Depends(read_validator),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    churches = crud.search_churches(db, query=q, limit=limit)
-    return churches
+    if facets:
+        check_facets(format)
+    churches = await read_crud.search_churches(db, query=q, limit=limit, filters=filters, format=format)
+    if not facets:
+        return validator.apply(rows_response(format, churches))
+    facet_counts = await read_crud.get_search_facets(db, query=q, filters=filters)
+    return validator.apply(with_facets(format, churches, facet_counts))
 
-@app.get("/churches/search/nearby", response_model=List[schemas.ChurchInDB])
-def find_nearby_churches(
+@app.get("/churches/search/nearby", response_model=List[schemas.NearbyChurch])
+async def find_nearby_churches(
     lat: float = Query(..., ge=-90, le=90, description="Latitude"),
     lng: float = Query(..., ge=-180, le=180, description="Longitude"),
     radius: float = Query(10, ge=0.1, le=100, description="Search radius in kilometers"),
     limit: int = Query(50, ge=1, le=1000),
-    db: Session = Depends(get_db)
-):
-    churches = crud.find_nearby_churches(
-        db, 
-        latitude=lat, 
-        longitude=lng, 
-        radius_km=radius, 
-        limit=limit
+    facets: bool = Query(False, description=FACETS_DESCRIPTION),
+    filters: Optional[schemas.ChurchFilters] = Depends(church_filters),
+    format: str = Depends(row_format),
+    validator: http_cache.Validator = Depends(read_validator),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if facets:
+        check_facets(format)
+    churches = await read_crud.find_nearby_churches(
+        db,
+        latitude=lat,
+        longitude=lng,
+        radius_km=radius,
+        limit=limit,
+        filters=filters,
+        format=format
     )
-    return churches
+    if not facets:
+        return validator.apply(rows_response(format, churches))
+    facet_counts = await read_crud.get_nearby_facets(db, latitude=lat, longitude=lng, radius_km=radius, filters=filters)
+    return validator.apply(with_facets(format, churches, facet_counts))
+
+@app.post("/churches/search/nearby/batch", response_model=schemas.NearbyBatchResult)
+async def find_nearby_churches_batch(search: schemas.NearbyBatchSearch, db: AsyncSession = Depends(get_async_db)):
+    # All origins are resolved by a single LATERAL KNN query
+    results = await crud_async.find_nearby_churches_batch(db, origins=search.origins)
+    return FastJSONResponse({"results": dict(zip(search.result_keys(), results))})
+
+@app.post("/churches/nearest/jobs", status_code=202)
+async def create_nearest_job(
+    request: Request,
+    file: UploadFile = File(..., description="CSV with lat/lng columns, or GeoJSON Points"),
+    k: int = Query(5, ge=1, le=100, description="Nearest churches per point"),
+    radius: float = Query(100, ge=0.1, le=100, description="Search radius in kilometers"),
+):
+    try:
+        points = nearest_jobs.parse_points(file.filename, await file.read())
+    except nearest_jobs.InvalidPoints as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    status = nearest_jobs.start_job(points, k=k, radius_km=radius)
+    return {
+        **status,
+        "status_url": str(request.url_for("get_nearest_job", job_id=status["id"])),
+        "results_url": str(request.url_for("get_nearest_job_results", job_id=status["id"])),
+    }
+
+@app.get("/churches/nearest/jobs/{job_id}")
+async def get_nearest_job(job_id: str):
+    status = nearest_jobs.read_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@app.get("/churches/nearest/jobs/{job_id}/results")
+async def get_nearest_job_results(job_id: str):
+    if nearest_jobs.read_status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Streams lines as chunks finish and ends once the job is done
+    return StreamingResponse(nearest_jobs.stream_results(job_id), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,233 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.routing import Match
+
+# Prometheus metrics for the API: HTTP latency, connection pools and per-crud-function queries
+
+# Statements slower than this are logged with their EXPLAIN (ANALYZE, BUFFERS) plan; 0 disables it.
+# The plan is produced by running the statement a second time, so leave it off unless tuning.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Each distinct statement is explained at most once per interval
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body chunk is sent",
+    ["method", "route", "status"],
+)
+# Gauges are summed over the live worker processes when running under gunicorn (see render)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", ["method", "route"], multiprocess_mode="livesum",
+)
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool, including connecting a new one",
+    ["engine"],
+)
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "Statement execution time", ["function"])
+QUERY_ROWS = Histogram("db_query_rows", "Rows returned or affected per statement", ["function"], buckets=ROW_BUCKETS)
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["engine"], multiprocess_mode="livesum")
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Pool connections in use", ["engine"], multiprocess_mode="livesum",
+)
+CHANGE_FEED_SUBSCRIBERS = Gauge(
+    "change_feed_subscribers", "Open GET /churches/changes streams", multiprocess_mode="livesum",
+)
+CHANGE_FEED_NOTIFICATIONS = Counter("change_feed_notifications_total", "NOTIFY payloads received", ["op"])
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ["function"])
+
+logger = logging.getLogger("slow_query")
+
+# Name of the crud function whose statements are executing, for the query metric labels
+_query_function = contextvars.ContextVar("query_function", default="other")
+_explained_at = {}
+
+
+def track_queries(fn):
+    """Label the statements executed by a crud function with its name"""
+    name = f"{fn.__module__}.{fn.__name__}"
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def generator_wrapper(*args, **kwargs):
+            items = fn(*args, **kwargs)
+            try:
+                while True:
+                    token = _query_function.set(name)
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        _query_function.reset(token)
+                    yield item
+            finally:
+                await items.aclose()
+        return generator_wrapper
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            token = _query_function.set(name)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _query_function.reset(token)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _query_function.set(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _query_function.reset(token)
+    return wrapper
+
+
+class TimedQueuePool(QueuePool):
+    engine_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(self.engine_label).observe(time.perf_counter() - started)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(self.engine_label).observe(time.perf_counter() - started)
+
+
+def _pool_checkout(engine, size_gauge, checked_out_gauge):
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # Set here rather than once at startup: each forked worker starts with its own empty values
+        size_gauge.set(engine.pool.size())
+        checked_out_gauge.inc()
+        connection_record.info["metrics_checked_out"] = True
+    return on_checkout
+
+
+def _pool_checkin(checked_out_gauge):
+    def on_checkin(dbapi_connection, connection_record):
+        # Checkins also happen for connections whose checkout failed part way
+        if connection_record.info.pop("metrics_checked_out", False):
+            checked_out_gauge.dec()
+    return on_checkin
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    function = _query_function.get()
+    QUERY_SECONDS.labels(function).observe(elapsed)
+    if cursor.rowcount >= 0:
+        QUERY_ROWS.labels(function).observe(cursor.rowcount)
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.labels(function).inc()
+        # EXPLAIN ANALYZE executes the statement again: only ever do that for reads.
+        # Server-side cursors still have the connection busy with the original statement.
+        is_select = statement.lstrip()[:6].upper() == "SELECT"
+        if is_select and not executemany and not context.execution_options.get("stream_results"):
+            _log_slow_query(conn, statement, parameters, function, elapsed)
+
+
+def _log_slow_query(conn, statement, parameters, function, elapsed):
+    now = time.monotonic()
+    if now - _explained_at.get(statement, float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL:
+        return
+    if len(_explained_at) > 1000:
+        _explained_at.clear()
+    _explained_at[statement] = now
+
+    # A fresh DBAPI cursor keeps the original cursor's rows intact and bypasses these events;
+    # the savepoint keeps a failed EXPLAIN from aborting the caller's transaction
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as exc:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            plan = f"EXPLAIN failed: {exc}"
+        logger.warning("Slow query in %s (%.0f ms):\n%s\n%s", function, elapsed * 1000, statement, plan)
+    finally:
+        cursor.close()
+
+
+def instrument_engines(engines):
+    """Time every statement on these engines ({label: engine}) and report their pools"""
+    for label, engine in engines.items():
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        checked_out = POOL_CHECKED_OUT.labels(label)
+        event.listen(engine, "checkout", _pool_checkout(engine, POOL_SIZE.labels(label), checked_out))
+        event.listen(engine, "checkin", _pool_checkin(checked_out))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-flight requests per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        # Route templates, not raw paths, keep the label set small
+        route = next(
+            (r.path for r in scope["app"].router.routes if r.matches(scope)[0] == Match.FULL),
+            "unmatched",
+        )
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.labels(method, route, status).observe(time.perf_counter() - started)
+            in_progress.dec()
+
+
+def render():
+    """Body and content type for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Several worker processes: merge what each of them wrote to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
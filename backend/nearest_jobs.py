@@ -0,0 +1,282 @@
+"""Bulk "nearest churches" jobs for large point sets (schools, wards, census centroids).
+
+Points are split into chunks. Each chunk is resolved by one nearby batch
+statement (crud.nearby_batch_statement) in a process pool worker. Results
+are appended to an NDJSON file as chunks finish, and status.json records the
+progress; both live in the job's directory, so any API worker on the host
+can answer status and results requests. From backend/, the same pipeline
+also runs without the API:
+
+    python nearest_jobs.py points.csv --k 5 > nearest.ndjson
+"""
+import argparse
+import asyncio
+import csv
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import orjson
+from sqlalchemy.orm import Session
+
+import crud
+from schemas import NearbyOrigin
+
+JOB_DIR = os.getenv("NEAREST_JOB_DIR", os.path.join(tempfile.gettempdir(), "church-nearest-jobs"))
+# Points per batch statement
+CHUNK_SIZE = int(os.getenv("NEAREST_JOB_CHUNK_SIZE", "500"))
+MAX_POINTS = int(os.getenv("NEAREST_JOB_MAX_POINTS", "200000"))
+PROCESSES = int(os.getenv("NEAREST_JOB_PROCESSES", "0")) or os.cpu_count()
+# Finished jobs are removed this long after they were created
+JOB_TTL_SECONDS = int(os.getenv("NEAREST_JOB_TTL", str(24 * 3600)))
+# A running job rewrites its status at least this often; a queued or running job whose
+# status is older than STALE_AFTER_SECONDS lost its worker (restart, redeploy) and counts as failed
+HEARTBEAT_SECONDS = 30
+STALE_AFTER_SECONDS = int(os.getenv("NEAREST_JOB_STALE_AFTER", "300"))
+
+LATITUDE_COLUMNS = ('lat', 'latitude', 'y')
+LONGITUDE_COLUMNS = ('lng', 'lon', 'long', 'longitude', 'x')
+KEY_COLUMNS = ('key', 'id', 'name')
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_pool = None
+_running = set()
+
+
+class InvalidPoints(ValueError):
+    pass
+
+
+def _point(key, latitude, longitude, where: str):
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+    except (TypeError, ValueError):
+        raise InvalidPoints(f"{where}: coordinates must be numbers")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise InvalidPoints(f"{where}: coordinates out of range")
+    return key, latitude, longitude
+
+
+def _csv_points(text: str):
+    reader = csv.DictReader(io.StringIO(text))
+    columns = {name.strip().lower(): name for name in reader.fieldnames or ()}
+    lat_column = next((columns[name] for name in LATITUDE_COLUMNS if name in columns), None)
+    lng_column = next((columns[name] for name in LONGITUDE_COLUMNS if name in columns), None)
+    key_column = next((columns[name] for name in KEY_COLUMNS if name in columns), None)
+    if lat_column is None or lng_column is None:
+        raise InvalidPoints("CSV needs latitude and longitude columns (lat/lng, latitude/longitude or y/x)")
+
+    for line, row in enumerate(reader, start=2):
+        key = row[key_column] if key_column else None
+        yield _point(key, row[lat_column], row[lng_column], f"line {line}")
+
+
+def _geojson_points(document):
+    features = document.get('features') if document.get('type') == 'FeatureCollection' else [document]
+    for number, feature in enumerate(features or ()):
+        geometry = (feature or {}).get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            raise InvalidPoints(f"feature {number}: only Point geometries are supported")
+        properties = feature.get('properties') or {}
+        key = feature.get('id', next((properties[name] for name in KEY_COLUMNS if name in properties), None))
+        longitude, latitude = geometry.get('coordinates', (None, None))[:2]
+        yield _point(key, latitude, longitude, f"feature {number}")
+
+
+def parse_points(filename: str, content: bytes):
+    """(key, latitude, longitude) tuples from an uploaded CSV or GeoJSON file"""
+    is_json = (filename or '').lower().endswith(('.json', '.geojson')) or content.lstrip()[:1] == b'{'
+    try:
+        if is_json:
+            points = list(_geojson_points(orjson.loads(content)))
+        else:
+            points = list(_csv_points(content.decode('utf-8-sig')))
+    except (orjson.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise InvalidPoints(f"Could not read the file: {exc}")
+
+    if not points:
+        raise InvalidPoints("The file contains no points")
+    if len(points) > MAX_POINTS:
+        raise InvalidPoints(f"At most {MAX_POINTS:,} points per job")
+    return points
+
+
+def nearest_chunk(chunk, k: int, radius_km: float) -> bytes:
+    """NDJSON lines for one chunk of (index, key, latitude, longitude); runs in a pool worker"""
+    from database import engine
+
+    origins = [NearbyOrigin(latitude=lat, longitude=lng, radius_km=radius_km, limit=k) for _, _, lat, lng in chunk]
+    with Session(engine) as db:
+        results = crud.find_nearby_churches_batch(db, origins)
+
+    return b''.join(
+        orjson.dumps({
+            'index': index,
+            'key': key,
+            'latitude': lat,
+            'longitude': lng,
+            'nearest': churches.to_dicts(),
+        }) + b'\n'
+        for (index, key, lat, lng), churches in zip(chunk, results)
+    )
+
+
+def _chunks(points):
+    for start in range(0, len(points), CHUNK_SIZE):
+        yield [(start + offset, *point) for offset, point in enumerate(points[start:start + CHUNK_SIZE])]
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process has an event loop and DB connections
+        _pool = ProcessPoolExecutor(max_workers=PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _job_path(job_id: str, name: str = ''):
+    return os.path.join(JOB_DIR, job_id, name)
+
+
+def _write_status(status):
+    status['updated_at'] = datetime.now(timezone.utc).isoformat()
+    temporary = _job_path(status['id'], 'status.json.tmp')
+    with open(temporary, 'wb') as f:
+        f.write(orjson.dumps(status))
+    os.replace(temporary, _job_path(status['id'], 'status.json'))
+
+
+def read_status(job_id: str):
+    if not _JOB_ID_RE.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id, 'status.json'), 'rb') as f:
+            status = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    if status['status'] in ('queued', 'running'):
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(status['updated_at'])
+        if age.total_seconds() > STALE_AFTER_SECONDS:
+            status['status'] = 'failed'
+            status['error'] = 'the worker running the job stopped'
+    return status
+
+
+def _remove_expired_jobs():
+    if not os.path.isdir(JOB_DIR):
+        return
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for job_id in os.listdir(JOB_DIR):
+        status = read_status(job_id)
+        if status and status['status'] in ('done', 'failed') and os.path.getmtime(_job_path(job_id)) < cutoff:
+            shutil.rmtree(_job_path(job_id), ignore_errors=True)
+
+
+def start_job(points, k: int, radius_km: float):
+    """Register a job and start it in the background; returns its initial status"""
+    _remove_expired_jobs()
+    job_id = uuid.uuid4().hex
+    os.makedirs(_job_path(job_id))
+    open(_job_path(job_id, 'results.ndjson'), 'wb').close()
+
+    status = {
+        'id': job_id,
+        'status': 'queued',
+        'total': len(points),
+        'processed': 0,
+        'k': k,
+        'radius_km': radius_km,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'error': None,
+    }
+    _write_status(status)
+
+    task = asyncio.get_running_loop().create_task(_run_job(status, points))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return status
+
+
+async def _run_job(status, points):
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    # Keep every worker busy without queueing the whole file at once
+    in_flight = asyncio.Semaphore(PROCESSES * 2)
+
+    async def run(chunk):
+        async with in_flight:
+            return len(chunk), await loop.run_in_executor(pool, nearest_chunk, chunk, status['k'], status['radius_km'])
+
+    async def heartbeat():
+        # Progress is only written when a chunk finishes, which may take longer
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            _write_status(status)
+
+    status['status'] = 'running'
+    _write_status(status)
+    beating = asyncio.create_task(heartbeat())
+    try:
+        with open(_job_path(status['id'], 'results.ndjson'), 'ab') as results:
+            # Results are written in completion order; every line carries its input index
+            for finished in asyncio.as_completed([run(chunk) for chunk in _chunks(points)]):
+                count, lines = await finished
+                results.write(lines)
+                results.flush()
+                status['processed'] += count
+                _write_status(status)
+        status['status'] = 'done'
+    except Exception as exc:
+        status['status'] = 'failed'
+        status['error'] = str(exc)
+    finally:
+        beating.cancel()
+    _write_status(status)
+
+
+async def stream_results(job_id: str, poll_interval: float = 0.5):
+    """Yield the job's NDJSON as it is written, until the job has finished"""
+    with open(_job_path(job_id, 'results.ndjson'), 'rb') as results:
+        pending = b''
+        while True:
+            status = read_status(job_id)
+            # No status: the job expired mid-stream and was removed; the open file still has its lines
+            finished = status is None or status['status'] in ('done', 'failed')
+            # Only hand out complete lines; a chunk may be half-written
+            complete, newline, pending = (pending + results.read()).rpartition(b'\n')
+            if newline:
+                yield complete + newline
+            elif finished:
+                return
+            else:
+                await asyncio.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nearest churches for every point in a CSV or GeoJSON file")
+    parser.add_argument("points_file")
+    parser.add_argument("--k", type=int, default=5, help="Churches per point (default 5)")
+    parser.add_argument("--radius", type=float, default=100, help="Search radius in km (default 100)")
+    args = parser.parse_args()
+
+    with open(args.points_file, 'rb') as f:
+        points = parse_points(args.points_file, f.read())
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=PROCESSES) as pool:
+        futures = [pool.submit(nearest_chunk, chunk, args.k, args.radius) for chunk in _chunks(points)]
+        for future in as_completed(futures):
+            sys.stdout.buffer.write(future.result())
+
+    elapsed = time.perf_counter() - started
+    print(f"{len(points):,} points in {elapsed:.1f}s ({len(points) / elapsed:,.0f} points/s)", file=sys.stderr)
@@ -0,0 +1,418 @@
+"""Read-only, in-memory church index for serving search without Postgres.
+
+A snapshot is a directory of .npy arrays plus two byte blobs, all memory-mapped
+on load so that start-up does not depend on the size of the data set:
+
+    python offline_index.py --from-json data.json --out offline_snapshot
+    python offline_index.py --from-db --out offline_snapshot
+
+Proximity search uses a KD-tree over unit-sphere (x, y, z) points, on which
+straight-line chord distance orders points exactly like great-circle distance.
+Text search uses a trigram inverted index built like pg_trgm's.
+"""
+import argparse
+import heapq
+import math
+import mmap
+import os
+import re
+import time
+import unicodedata
+from datetime import datetime, timezone
+
+import numpy as np
+import orjson
+
+import geo
+from serializers import RowSet
+
+SNAPSHOT_FORMAT = 1
+# Points per KD-tree leaf; leaves are scanned with vectorised NumPy
+LEAF_SIZE = 32
+# Minimum share of a query's trigrams a document needs to be a fuzzy match,
+# the same default as pg_trgm.word_similarity_threshold
+FUZZY_THRESHOLD = 0.6
+
+FIELDS = (
+    'id', 'osm_id', 'name', 'denomination', 'religion', 'amenity', 'building',
+    'address', 'phone', 'website', 'description', 'created_at', 'updated_at',
+    'longitude', 'latitude',
+)
+NEARBY_FIELDS = FIELDS + ('distance_meters',)
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def normalize(text: str) -> str:
+    """Lower-case, accent-free words separated by single spaces, like f_unaccent(lower(...))"""
+    decomposed = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_WORD_RE.findall(stripped.lower()))
+
+
+def _trigram_key(trigram: str) -> int:
+    # Three code points (at most 21 bits each) packed into one integer
+    return (ord(trigram[0]) << 42) | (ord(trigram[1]) << 21) | ord(trigram[2])
+
+
+def word_trigrams(word: str):
+    """pg_trgm-style trigrams: the word padded with two leading spaces and one trailing"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def unit_vectors(latitudes, longitudes):
+    lat = np.radians(latitudes)
+    lng = np.radians(longitudes)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def chord_length(meters: float) -> float:
+    return 2 * math.sin(min(meters / (2 * geo.EARTH_RADIUS_METERS), math.pi / 2))
+
+
+def build_kdtree(points, leaf_size: int = LEAF_SIZE):
+    """Median-split KD-tree; returns the point permutation and flat node arrays"""
+    order = np.arange(len(points))
+    lo, hi, left, right, box_min, box_max = [], [], [], [], [], []
+    stack = [(0, len(points), -1, None)]
+
+    while stack:
+        start, stop, parent, side = stack.pop()
+        node = len(lo)
+        if parent >= 0:
+            (left if side == 'left' else right)[parent] = node
+
+        members = points[order[start:stop]]
+        lower = members.min(axis=0) if len(members) else np.zeros(3)
+        upper = members.max(axis=0) if len(members) else np.zeros(3)
+        lo.append(start)
+        hi.append(stop)
+        left.append(-1)
+        right.append(-1)
+        box_min.append(lower)
+        box_max.append(upper)
+
+        if stop - start > leaf_size:
+            # Split the widest dimension at the median
+            axis = int(np.argmax(upper - lower))
+            middle = (start + stop) // 2
+            segment = order[start:stop]
+            order[start:stop] = segment[np.argpartition(points[segment, axis], middle - start)]
+            stack.append((middle, stop, node, 'right'))
+            stack.append((start, middle, node, 'left'))
+
+    return order, {
+        'node_lo': np.array(lo, dtype=np.int64),
+        'node_hi': np.array(hi, dtype=np.int64),
+        'node_left': np.array(left, dtype=np.int64),
+        'node_right': np.array(right, dtype=np.int64),
+        'node_min': np.array(box_min, dtype=np.float64).reshape(-1, 3),
+        'node_max': np.array(box_max, dtype=np.float64).reshape(-1, 3),
+    }
+
+
+def build_trigram_index(texts):
+    """CSR inverted index: sorted trigram keys, offsets into a postings array of record numbers"""
+    keys = []
+    docs = []
+    for doc, text in enumerate(texts):
+        trigrams = set()
+        for word in text.split():
+            trigrams |= word_trigrams(word)
+        keys.extend(_trigram_key(trigram) for trigram in trigrams)
+        docs.extend([doc] * len(trigrams))
+
+    keys = np.array(keys, dtype=np.int64)
+    docs = np.array(docs, dtype=np.int32)
+    order = np.lexsort((docs, keys))
+    keys = keys[order]
+    docs = docs[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+    return {'trigram_keys': unique_keys, 'trigram_offsets': offsets, 'trigram_docs': docs}
+
+
+def _pack(blobs):
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+    return b''.join(blobs), offsets
+
+
+def build_snapshot(rows, out_dir: str, source: str):
+    """Write a snapshot for `rows`, tuples in FIELDS order"""
+    started = time.perf_counter()
+    rows = list(rows)
+    latitudes = np.array([row[FIELDS.index('latitude')] for row in rows], dtype=np.float64)
+    longitudes = np.array([row[FIELDS.index('longitude')] for row in rows], dtype=np.float64)
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+
+    order, tree = build_kdtree(unit_vectors(latitudes, longitudes))
+    texts = [
+        normalize(' '.join(filter(None, (row[FIELDS.index(field)] for field in ('name', 'denomination', 'address')))))
+        for row in rows
+    ]
+    records, record_offsets = _pack([orjson.dumps(list(row)) for row in rows])
+    text_blob, text_offsets = _pack([text.encode() for text in texts])
+
+    arrays = {
+        **tree,
+        **build_trigram_index(texts),
+        'tree_points': unit_vectors(latitudes, longitudes)[order],
+        'tree_records': order.astype(np.int32),
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'ids': ids,
+        'id_order': np.argsort(ids, kind='stable').astype(np.int32),
+        'record_offsets': record_offsets,
+        'text_offsets': text_offsets,
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f'{name}.npy'), array)
+    with open(os.path.join(out_dir, 'records.bin'), 'wb') as f:
+        f.write(records)
+    with open(os.path.join(out_dir, 'texts.bin'), 'wb') as f:
+        f.write(text_blob)
+    # Written last: a snapshot without a manifest is incomplete
+    with open(os.path.join(out_dir, 'manifest.json'), 'wb') as f:
+        f.write(orjson.dumps({
+            'format': SNAPSHOT_FORMAT,
+            'count': len(rows),
+            'fields': FIELDS,
+            'source': source,
+            'built_at': datetime.now(timezone.utc),
+        }, option=orjson.OPT_INDENT_2))
+
+    print(f"Wrote {len(rows):,} churches to {out_dir} in {time.perf_counter() - started:.1f}s")
+
+
+def _map_blob(path: str):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChurchIndex:
+    def __init__(self, path: str):
+        with open(os.path.join(path, 'manifest.json'), 'rb') as f:
+            self.manifest = orjson.loads(f.read())
+        if self.manifest['format'] != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {self.manifest['format']}; rebuild it")
+
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                setattr(self, name[:-4], np.load(os.path.join(path, name), mmap_mode='r'))
+        self.records = _map_blob(os.path.join(path, 'records.bin'))
+        self.texts = _map_blob(os.path.join(path, 'texts.bin'))
+
+    def __len__(self):
+        return self.manifest['count']
+
+    def record(self, index: int):
+        return orjson.loads(self.records[self.record_offsets[index]:self.record_offsets[index + 1]])
+
+    def text(self, index: int) -> str:
+        return self.texts[self.text_offsets[index]:self.text_offsets[index + 1]].decode()
+
+    def get(self, church_id: int):
+        position = int(np.searchsorted(self.ids, church_id, sorter=self.id_order))
+        if position == len(self.id_order) or self.ids[self.id_order[position]] != church_id:
+            return None
+        return dict(zip(FIELDS, self.record(int(self.id_order[position]))))
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float = 10, limit: int = 50):
+        """Churches within radius_km, nearest first, with distance_meters (matches crud.nearby_statement)"""
+        if not len(self):
+            return RowSet(NEARBY_FIELDS, [])
+
+        query = unit_vectors(latitude, longitude)[0]
+        bound = chord_length(radius_km * 1000)
+        found_chords = []
+        found_positions = []
+        found = 0
+
+        # Best-first descent: visit nodes in order of their box's distance to the query
+        pending = [(0.0, 0)]
+        while pending:
+            distance, node = heapq.heappop(pending)
+            if distance > bound:
+                break
+
+            left = self.node_left[node]
+            if left < 0:
+                start, stop = self.node_lo[node], self.node_hi[node]
+                chords = np.sqrt(((self.tree_points[start:stop] - query) ** 2).sum(axis=1))
+                within = np.nonzero(chords <= bound)[0]
+                if len(within):
+                    found_chords.append(chords[within])
+                    found_positions.append(within + start)
+                    found += len(within)
+                    if found >= limit:
+                        # The limit-th nearest so far caps the search radius
+                        bound = min(bound, float(np.partition(np.concatenate(found_chords), limit - 1)[limit - 1]))
+                continue
+
+            for child in (left, self.node_right[node]):
+                gap = np.maximum(np.maximum(self.node_min[child] - query, query - self.node_max[child]), 0)
+                child_distance = float(np.sqrt((gap * gap).sum()))
+                if child_distance <= bound:
+                    heapq.heappush(pending, (child_distance, int(child)))
+
+        if not found:
+            return RowSet(NEARBY_FIELDS, [])
+
+        records = self.tree_records[np.concatenate(found_positions)]
+        max_distance = radius_km * 1000
+        ranked = []
+        for record in records.tolist():
+            distance = geo.distance_meters(latitude, longitude, self.latitudes[record], self.longitudes[record])
+            if distance <= max_distance:
+                ranked.append((distance, int(self.ids[record]), record))
+        ranked.sort()
+
+        return RowSet(NEARBY_FIELDS, [self.record(record) + [distance] for distance, _, record in ranked[:limit]])
+
+    def _postings(self, trigram: str):
+        key = _trigram_key(trigram)
+        position = int(np.searchsorted(self.trigram_keys, key))
+        if position == len(self.trigram_keys) or self.trigram_keys[position] != key:
+            return np.empty(0, dtype=np.int32)
+        return self.trigram_docs[self.trigram_offsets[position]:self.trigram_offsets[position + 1]]
+
+    def _word_candidates(self, word: str):
+        # Long words may match anywhere (substring); short ones only as a word prefix
+        if len(word) >= 3:
+            trigrams = {word[i:i + 3] for i in range(len(word) - 2)}
+        else:
+            padded = f'  {word}'
+            trigrams = {padded[i:i + 3] for i in range(len(word))}
+
+        candidates = None
+        for trigram in sorted(trigrams, key=lambda trigram: len(self._postings(trigram))):
+            postings = self._postings(trigram)
+            candidates = postings if candidates is None else np.intersect1d(candidates, postings, assume_unique=True)
+            if not len(candidates):
+                break
+        return candidates
+
+    def search(self, query: str, limit: int = 50):
+        """Every word as a prefix or substring, then trigram-similar (typo) matches; approximates crud.search_statement"""
+        words = normalize(query).split()
+        if not words or not len(self):
+            return RowSet(FIELDS, [])
+
+        candidates = None
+        for word in words:
+            matches = self._word_candidates(word)
+            candidates = matches if candidates is None else np.intersect1d(candidates, matches, assume_unique=True)
+            if not len(candidates):
+                break
+
+        results = self._rank(words, candidates, limit) if len(candidates) else []
+        if len(results) < limit:
+            results += self._fuzzy(words, exclude=set(results), limit=limit - len(results))
+        return RowSet(FIELDS, [self.record(doc) for doc in results])
+
+    def _word_score(self, text: str, word: str):
+        # Matches at the start of a word count double, like a tsquery prefix hit
+        if text.startswith(word) or f' {word}' in text:
+            return 1.0
+        return 0.5 if word in text else None
+
+    def _rank(self, words, candidates, limit: int):
+        """Top `limit` candidates by score, then id, verifying as few texts as possible"""
+        # Vectorised upper bound per candidate: a word can only score 1.0 where
+        # some word of the text begins with its first two letters
+        bounds = np.zeros(len(candidates))
+        for word in words:
+            postings = self._postings(f' {word[:2]}' if len(word) >= 2 else f'  {word}')
+            if len(postings):
+                positions = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+                bounds += np.where(postings[positions] == candidates, 1.0, 0.5)
+            else:
+                bounds += 0.5
+
+        best = []  # min-heap of (score, -id, doc) holding the current top `limit`
+        for index in np.lexsort((self.ids[candidates], -bounds)).tolist():
+            if len(best) == limit and bounds[index] <= best[0][0]:
+                break  # Nothing left can outrank the current top `limit`
+            doc = int(candidates[index])
+            text = self.text(doc)
+            score = 0.0
+            for word in words:
+                word_score = self._word_score(text, word)
+                if word_score is None:
+                    break
+                score += word_score
+            else:
+                entry = (score, -int(self.ids[doc]), doc)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        return [doc for _, _, doc in sorted(best, reverse=True)]
+
+    def _fuzzy(self, words, exclude, limit: int):
+        trigrams = set()
+        for word in words:
+            trigrams |= word_trigrams(word)
+        postings = [self._postings(trigram) for trigram in trigrams]
+        postings = [p for p in postings if len(p)]
+        if not postings:
+            return []
+
+        docs, shared = np.unique(np.concatenate(postings), return_counts=True)
+        similar = shared / len(trigrams) >= FUZZY_THRESHOLD
+        ranked = sorted(
+            (-count, int(self.ids[doc]), int(doc))
+            for doc, count in zip(docs[similar].tolist(), shared[similar].tolist())
+            if doc not in exclude
+        )
+        return [doc for _, _, doc in ranked[:limit]]
+
+
+def json_rows(json_file_path: str):
+    """Churches from an Overpass export, filtered exactly as import_data.py does"""
+    import import_data
+
+    timestamp = import_data.parse_timestamp(import_data.read_metadata(json_file_path).get('timestamp_osm_base'))
+    timestamp = timestamp or datetime.now(timezone.utc)
+    churches = {}
+    for element in import_data.iter_elements(json_file_path):
+        if not import_data.is_church(element):
+            continue
+        row = import_data.church_row(element)
+        if row is None:
+            continue
+        # No database ids here: the OSM id doubles as the church id. Later duplicates win, as in MERGE_SQL
+        churches[row[0]] = (row[0],) + row[:-2] + (timestamp, timestamp) + row[-2:]
+    return churches.values()
+
+
+def database_rows():
+    from sqlalchemy.orm import Session
+
+    import crud
+    from database import engine
+
+    with Session(engine) as db:
+        yield from db.execute(crud.export_statement().execution_options(yield_per=10_000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an offline search snapshot")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-json", metavar="JSON_FILE", help="Overpass JSON export, e.g. data.json")
+    source.add_argument("--from-db", action="store_true", help="The churches table in DATABASE_URL")
+    parser.add_argument("--out", default=os.getenv("OFFLINE_SNAPSHOT", "offline_snapshot"))
+    args = parser.parse_args()
+
+    if args.from_json:
+        build_snapshot(json_rows(args.from_json), args.out, source=os.path.basename(args.from_json))
+    else:
+        build_snapshot(database_rows(), args.out, source='database')
@@ -0,0 +1,33 @@
+import base64
+from datetime import datetime
+
+import orjson
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order: str, row) -> str:
+    """Opaque cursor pointing just past `row` when ordering by id or by (updated_at, id)"""
+    if order == 'updated':
+        key = [order, row.updated_at.isoformat(), row.id]
+    else:
+        key = [order, row.id]
+    return base64.urlsafe_b64encode(orjson.dumps(key)).rstrip(b'=').decode()
+
+
+def decode_cursor(order: str, cursor: str):
+    """Keyset position encoded by encode_cursor: an id, or an (updated_at, id) pair"""
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if key[0] != order:
+            raise InvalidCursor(f"Cursor was issued for order={key[0]}")
+        if order == 'updated':
+            updated_at, church_id = key[1:]
+            return datetime.fromisoformat(updated_at), int(church_id)
+        (church_id,) = key[1:]
+        return int(church_id)
+    except InvalidCursor:
+        raise
+    except (ValueError, TypeError, IndexError):
+        raise InvalidCursor("Malformed cursor")
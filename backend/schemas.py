@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+import hashlib
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Literal, Optional, Tuple
 from datetime import datetime
 
 class ChurchBase(BaseModel):
@@ -22,6 +23,56 @@ class ChurchUpdate(ChurchBase):
     latitude: Optional[float] = Field(None, ge=-90, le=90)
     longitude: Optional[float] = Field(None, ge=-180, le=180)
 
+class BulkChurchOperation(ChurchBase):
+    op: Literal['create', 'update', 'delete']
+    # The church to update or delete, by id or by osm_id; for creates osm_id is just a field
+    id: Optional[int] = None
+    osm_id: Optional[int] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    # Optimistic concurrency: only update/delete if the church's updated_at is still this
+    if_updated_at: Optional[datetime] = None
+
+    @model_validator(mode='after')
+    def check_operation(self):
+        if self.op == 'create':
+            if self.id is not None:
+                raise ValueError('create must not set id')
+            if self.latitude is None or self.longitude is None:
+                raise ValueError('create needs latitude and longitude')
+        elif (self.id is None) == (self.osm_id is None):
+            raise ValueError(f'{self.op} needs exactly one of id or osm_id')
+        elif self.op == 'update' and not self.values():
+            raise ValueError('update needs at least one field to change')
+        return self
+
+    def target(self):
+        """('id' or 'osm_id', value) this operation is keyed by, or None for a create without osm_id"""
+        if self.id is not None:
+            return 'id', self.id
+        return ('osm_id', self.osm_id) if self.osm_id is not None else None
+
+    def values(self):
+        """Church columns to write: every field for a create, the fields that were sent for an update"""
+        fields = set(ChurchBase.model_fields) | {'latitude', 'longitude'}
+        if self.op == 'create':
+            return self.model_dump(include=fields | {'osm_id'})
+        values = self.model_dump(include=fields, exclude_unset=True)
+        # As in PUT /churches/{id}, a null coordinate means "leave it"
+        return {key: value for key, value in values.items() if value is not None or key not in ('latitude', 'longitude')}
+
+class BulkChurchRequest(BaseModel):
+    operations: List[BulkChurchOperation] = Field(..., min_length=1, max_length=1000)
+    # Apply all operations or none: any failed operation rolls back the rest
+    atomic: bool = False
+
+    @model_validator(mode='after')
+    def unique_targets(self):
+        targets = [target for target in (operation.target() for operation in self.operations) if target]
+        if len(set(targets)) != len(targets):
+            raise ValueError('each church may appear only once per batch')
+        return self
+
 class ChurchInDB(ChurchBase):
     id: int
     osm_id: Optional[int] = None
@@ -33,10 +84,137 @@ class ChurchInDB(ChurchBase):
     class Config:
         from_attributes = True
 
+class BulkChurchResult(BaseModel):
+    index: int
+    # created, updated, deleted; or not_found, conflict (stale if_updated_at or existing osm_id),
+    # duplicate (same church as an earlier operation) and aborted (atomic batch with a failure)
+    status: str
+    id: Optional[int] = None
+    # The church as written; for a conflict, its current state
+    church: Optional['ChurchInDB'] = None
+    error: Optional[str] = None
+
+class BulkChurchResponse(BaseModel):
+    applied: bool
+    results: List[BulkChurchResult]
+
+class NearbyChurch(ChurchInDB):
+    distance_meters: float
+
+class ChurchCluster(BaseModel):
+    count: int
+    latitude: float
+    longitude: float
+    # Only set when the cluster holds a single church
+    id: Optional[int] = None
+    name: Optional[str] = None
+    denomination: Optional[str] = None
+
+class DensityCell(BaseModel):
+    # Geohash, or "i,j" of ST_Hexagon(size, i, j) on Web Mercator
+    cell: str
+    count: int
+    # Cell centre
+    latitude: float
+    longitude: float
+    area_km2: float
+    per_100_km2: float
+
+class DbscanCluster(BaseModel):
+    cluster: int
+    count: int
+    # Centroid, and the distance from it to the farthest member
+    latitude: float
+    longitude: float
+    radius_meters: float
+    min_lng: float
+    min_lat: float
+    max_lng: float
+    max_lat: float
+    top_denomination: Optional[str] = None
+
+class DbscanClusters(BaseModel):
+    clusters: List[DbscanCluster]
+    # Churches in no cluster
+    noise: int
+
+class NearestDistanceRegion(BaseModel):
+    # "*" for all churches, "" for churches outside every admin region
+    region_code: str
+    region: str
+    churches: int
+    mean_meters: Optional[float] = None
+    min_meters: Optional[float] = None
+    max_meters: Optional[float] = None
+    # At NearestDistances.percentiles
+    percentiles_meters: Optional[List[float]] = None
+    # Churches per NearestDistances.buckets_km bucket, plus one for anything farther
+    histogram: List[int]
+
+class NearestDistances(BaseModel):
+    buckets_km: List[float]
+    percentiles: List[float]
+    regions: List[NearestDistanceRegion]
+
+class ChurchFilters(BaseModel):
+    # Each list matches any of its values; all given filters must hold
+    denomination: Optional[List[str]] = None
+    building: Optional[List[str]] = None
+    has_phone: Optional[bool] = None
+    has_website: Optional[bool] = None
+    # min_lng, min_lat, max_lng, max_lat
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    # Ring of (lng, lat) vertices; closed automatically
+    polygon: Optional[List[Tuple[float, float]]] = Field(None, min_length=3, max_length=1000)
+
+    def is_empty(self):
+        return not any(value is not None for value in self.model_dump().values())
+
+    def cache_key(self):
+        """Short key that is the same for equivalent filters ('' when there are none)"""
+        values = self.model_dump(exclude_none=True)
+        if not values:
+            return ''
+        for key in ('denomination', 'building'):
+            if key in values:
+                values[key] = sorted(set(values[key]))
+        return hashlib.blake2b(repr(sorted(values.items())).encode(), digest_size=12).hexdigest()
+
+class FacetCount(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+class SearchFacets(BaseModel):
+    denomination: List[FacetCount]
+
 class ChurchSearch(BaseModel):
     query: str
     limit: Optional[int] = 50
 
+class NearbyOrigin(BaseModel):
+    # Key of this origin's results in the response; defaults to its position
+    key: Optional[str] = None
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    radius_km: float = Field(default=10, ge=0.1, le=100)
+    limit: int = Field(default=50, ge=1, le=1000)
+
+class NearbyBatchSearch(BaseModel):
+    origins: List[NearbyOrigin] = Field(..., min_length=1, max_length=1000)
+
+    @model_validator(mode='after')
+    def unique_keys(self):
+        keys = self.result_keys()
+        if len(set(keys)) != len(keys):
+            raise ValueError('origin keys must be unique')
+        return self
+
+    def result_keys(self):
+        return [origin.key if origin.key is not None else str(index) for index, origin in enumerate(self.origins)]
+
+class NearbyBatchResult(BaseModel):
+    results: Dict[str, List[NearbyChurch]]
+
 class ProximitySearch(BaseModel):
     latitude: float = Field(..., ge=-90, le=90)
     longitude: float = Field(..., ge=-180, le=180)
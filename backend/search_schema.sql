@@ -0,0 +1,42 @@
+-- Text search columns, trigger and indexes on churches. Idempotent, so the one
+-- copy serves both new databases (run by Postgres after database/init.sql, see
+-- docker-compose.yml) and existing ones (run by import_data.py on every start).
+
+-- Trigram and accent-folding support for text search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() is only STABLE; pinning the dictionary makes it safe to use in
+-- indexes and triggers ("Nhà thờ" and "nha tho" normalise to the same text)
+CREATE OR REPLACE FUNCTION f_unaccent(text)
+RETURNS text AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- Maintained by the churches_search_update trigger
+ALTER TABLE churches ADD COLUMN IF NOT EXISTS search_text TEXT;
+ALTER TABLE churches ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;
+
+-- Keep the accent-folded search columns in sync with name/denomination/address
+CREATE OR REPLACE FUNCTION update_church_search_columns()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_text = f_unaccent(lower(concat_ws(' ', NEW.name, NEW.denomination, NEW.address)));
+    NEW.search_vector =
+        setweight(to_tsvector('simple', f_unaccent(coalesce(NEW.name, ''))), 'A') ||
+        setweight(to_tsvector('simple', f_unaccent(coalesce(NEW.denomination, ''))), 'B') ||
+        setweight(to_tsvector('simple', f_unaccent(coalesce(NEW.address, ''))), 'C');
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER churches_search_update BEFORE INSERT OR UPDATE OF name, denomination, address
+    ON churches FOR EACH ROW EXECUTE FUNCTION update_church_search_columns();
+
+-- Churches written before the trigger existed: the trigger never leaves search_text
+-- NULL, so this only touches them, once, and is a no-op on later runs
+UPDATE churches SET name = name WHERE search_text IS NULL;
+
+-- Full-text (word prefix) and trigram (substring / fuzzy) search indexes, built after the backfill
+CREATE INDEX IF NOT EXISTS idx_churches_search_vector ON churches USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_churches_search_text_trgm ON churches USING GIN (search_text gin_trgm_ops);
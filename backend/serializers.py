@@ -0,0 +1,207 @@
+import csv
+import io
+from datetime import date, datetime
+
+import orjson
+from fastapi.responses import Response
+
+
+class RowSet:
+    """Query result kept as row tuples plus one shared tuple of field names"""
+
+    __slots__ = ("fields", "rows")
+
+    def __init__(self, fields, rows):
+        self.fields = fields
+        self.rows = rows
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(tuple(result.keys()), result.all())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def to_dicts(self):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in self.rows]
+
+
+def row_to_dict(fields, row):
+    return dict(zip(fields, row)) if row is not None else None
+
+
+def _default(obj):
+    # An array of objects needs a dict per row; orjson encodes those faster than
+    # anything assembled from the tuples in Python
+    if isinstance(obj, RowSet):
+        return obj.to_dicts()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+# Compact alternatives to a JSON array of objects for row sets, chosen by the
+# Accept header. All are encoded straight from the row tuples, without a dict per row.
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.churches.columnar+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def columns(rowset: RowSet) -> dict:
+    """Field name -> list of values, one per row"""
+    if not rowset.rows:
+        return {field: [] for field in rowset.fields}
+    return dict(zip(rowset.fields, zip(*rowset.rows)))
+
+
+def columnar_document(rowset: RowSet) -> dict:
+    return {"count": len(rowset), "columns": columns(rowset)}
+
+
+def dumps_columnar(rowset: RowSet) -> bytes:
+    return orjson.dumps(columnar_document(rowset))
+
+
+def _isoformat_column(values):
+    # Same strings as the JSON formats; a whole column at a time is much cheaper than msgpack's default hook
+    return [value.isoformat() if value is not None else None for value in values]
+
+
+def dumps_msgpack(rowset: RowSet) -> bytes:
+    """The columnar document as MessagePack"""
+    import msgpack
+    document = columnar_document(rowset)
+    data = document["columns"]
+    for field, values in data.items():
+        if isinstance(next((value for value in values if value is not None), None), (datetime, date)):
+            data[field] = _isoformat_column(values)
+    return msgpack.packb(document)
+
+
+def dumps_geoarrow(rowset: RowSet) -> bytes:
+    """Arrow IPC stream, one column per field, longitude/latitude as a GeoArrow point column"""
+    import pyarrow as pa  # Optional and slow to import; only loaded for clients asking for Arrow
+
+    data = columns(rowset)
+    x = pa.array(data.pop("longitude"), type=pa.float64())
+    y = pa.array(data.pop("latitude"), type=pa.float64())
+    arrays = [pa.array(values) for values in data.values()]
+    fields = [pa.field(name, array.type) for name, array in zip(data, arrays)]
+
+    arrays.append(pa.StructArray.from_arrays([x, y], fields=[
+        pa.field("x", pa.float64(), nullable=False), pa.field("y", pa.float64(), nullable=False),
+    ]))
+    fields.append(pa.field("geometry", arrays[-1].type, nullable=False, metadata={
+        "ARROW:extension:name": "geoarrow.point",
+        "ARROW:extension:metadata": '{"crs":"OGC:CRS84"}',
+    }))
+
+    batch = pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+# Format name -> (media type, encoder)
+ROW_FORMATS = {
+    "json": ("application/json", dumps),
+    "columnar": (COLUMNAR_MEDIA_TYPE, dumps_columnar),
+    "msgpack": (MSGPACK_MEDIA_TYPE, dumps_msgpack),
+    "geoarrow": (ARROW_MEDIA_TYPE, dumps_geoarrow),
+}
+_MEDIA_TYPE_FORMATS = {
+    **{media_type: name for name, (media_type, _) in ROW_FORMATS.items()},
+    "application/x-msgpack": "msgpack",
+    "*/*": "json",
+    "application/*": "json",
+}
+
+
+def negotiate_format(accept: str):
+    """ROW_FORMATS name for an Accept header, or None if it accepts none of them"""
+    if not accept.strip():
+        return "json"
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        name = _MEDIA_TYPE_FORMATS.get(media_type.lower())
+        if name is not None and weight > 0:
+            # Highest q-value first; among equals the client's own order
+            candidates.append((-weight, position, name))
+    return min(candidates)[2] if candidates else None
+
+
+def encode_rows(format: str, rowset: RowSet) -> bytes:
+    return ROW_FORMATS[format][1](rowset)
+
+
+class FastJSONResponse(Response):
+    """orjson-encoded response; returning it skips response_model re-validation"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+# Encoders for streamed exports: each takes one batch of rows and returns bytes
+
+def ndjson_batch(fields, rows) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+
+def geojson_feature(fields, row) -> dict:
+    properties = dict(zip(fields, row))
+    coordinates = [properties.pop("longitude"), properties.pop("latitude")]
+    return {
+        "type": "Feature",
+        "id": properties["id"],
+        "geometry": {"type": "Point", "coordinates": coordinates},
+        "properties": properties,
+    }
+
+
+def csv_batch(fields, rows, header=False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def stream_export(batches, fields, format: str):
+    """Encode an async iterator of row batches as one ndjson, GeoJSON or CSV document"""
+    if format == "csv":
+        yield csv_batch(fields, [], header=True)
+        async for rows in batches:
+            yield csv_batch(fields, rows)
+    elif format == "geojson":
+        # FeatureCollection written incrementally: opening, comma-separated features, closing
+        yield b'{"type":"FeatureCollection","features":['
+        separator = b""
+        async for rows in batches:
+            if rows:
+                yield separator + b",".join(orjson.dumps(geojson_feature(fields, row)) for row in rows)
+                separator = b","
+        yield b"]}"
+    else:
+        async for rows in batches:
+            yield ndjson_batch(fields, rows)
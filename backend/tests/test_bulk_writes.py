@@ -0,0 +1,38 @@
+"""POST /churches/bulk's crud_async.bulk_write against the seeded database (conftest.py).
+
+Same-column updates are applied by one UPDATE statement, so a batch fires one
+change notification for all of them; a batch large enough to overflow its
+payload must still commit.
+
+    pytest tests/test_bulk_writes.py
+"""
+import asyncio
+import random
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import crud_async
+from schemas import BulkChurchOperation
+
+
+async def bulk_write(engine, operations, atomic):
+    async_engine = create_async_engine(engine.url.set(drivername="postgresql+asyncpg"))
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            return await crud_async.bulk_write(db, operations=operations, atomic=atomic)
+    finally:
+        await async_engine.dispose()
+
+
+def test_bulk_update_of_50_churches(plan_engine, throwaway_churches):
+    # Full-precision coordinates, as clients send them: the longest notification rows
+    operations = [
+        BulkChurchOperation(op="update", id=church_id, name=f"Bulk {church_id}",
+                            latitude=random.uniform(10.5, 11), longitude=random.uniform(106.5, 107))
+        for church_id in throwaway_churches
+    ]
+    response = asyncio.run(bulk_write(plan_engine, operations, atomic=True))
+
+    assert response["applied"]
+    assert [result["status"] for result in response["results"]] == ["updated"] * len(operations)
+    assert [result["church"]["name"] for result in response["results"]] == [f"Bulk {i}" for i in throwaway_churches]
@@ -0,0 +1,66 @@
+"""Change feed notifications (change_tracking.sql) against the seeded database (conftest.py).
+
+pg_notify raises on payloads of 8000 bytes or more, and an error in the trigger
+rolls back the write that fired it, so a statement whose row list would not
+fit must still go through, announced as a bulk change.
+
+    pytest tests/test_change_feed.py
+"""
+import select
+from contextlib import contextmanager
+
+import orjson
+from sqlalchemy import text
+
+MOVE_SQL = text("""
+    UPDATE churches
+    SET location = ST_SetSRID(ST_MakePoint(ST_X(location) + 0.00012345678901234, ST_Y(location)), 4326)
+    WHERE id = ANY(:ids)
+""")
+
+
+@contextmanager
+def listening(engine):
+    """Yields a function returning the church_changes notifications received so far"""
+    connection = engine.raw_connection()
+    # Autocommit would stick to the connection; keep it out of the pool
+    connection.detach()
+    try:
+        listener = connection.driver_connection
+        listener.autocommit = True
+        listener.cursor().execute("LISTEN church_changes")
+
+        def received(timeout=5):
+            # Delivered on commit; wait for the first, then take whatever has arrived
+            if not listener.notifies:
+                select.select([listener], [], [], timeout)
+            listener.poll()
+            messages = [orjson.loads(notify.payload) for notify in listener.notifies]
+            listener.notifies.clear()
+            return messages
+
+        yield received
+    finally:
+        connection.close()
+
+
+def test_small_update_lists_rows(plan_engine, throwaway_churches):
+    ids = throwaway_churches[:5]
+    with listening(plan_engine) as received:
+        with plan_engine.begin() as connection:
+            connection.execute(MOVE_SQL, {"ids": ids})
+        updates = [message for message in received() if message["op"] == "update"]
+
+    assert [message["count"] for message in updates] == [len(ids)]
+    assert sorted(row["id"] for row in updates[0]["rows"]) == sorted(ids)
+
+
+def test_update_too_large_to_list_is_announced_as_bulk(plan_engine, throwaway_churches):
+    # 50 rows with full-precision old and new coordinates: well over 8000 bytes listed
+    with listening(plan_engine) as received:
+        with plan_engine.begin() as connection:
+            connection.execute(MOVE_SQL, {"ids": throwaway_churches})
+        updates = [message for message in received() if message["op"] == "update"]
+
+    assert [message["count"] for message in updates] == [len(throwaway_churches)]
+    assert updates[0]["rows"] is None
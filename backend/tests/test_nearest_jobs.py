@@ -0,0 +1,60 @@
+"""Status and cleanup of nearest-church jobs whose worker died; no database needed.
+
+    pytest tests/test_nearest_jobs.py
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+import nearest_jobs
+
+JOB_ID = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(nearest_jobs, "JOB_DIR", str(tmp_path))
+    return tmp_path
+
+
+def write_job(status, updated_seconds_ago, lines=b""):
+    os.makedirs(nearest_jobs._job_path(JOB_ID))
+    updated_at = datetime.now(timezone.utc) - timedelta(seconds=updated_seconds_ago)
+    with open(nearest_jobs._job_path(JOB_ID, "status.json"), "wb") as f:
+        f.write(orjson.dumps({"id": JOB_ID, "status": status, "updated_at": updated_at.isoformat(), "error": None}))
+    with open(nearest_jobs._job_path(JOB_ID, "results.ndjson"), "wb") as f:
+        f.write(lines)
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.parametrize("state", ["queued", "running"])
+def test_stale_job_counts_as_failed(job_dir, state):
+    write_job(state, nearest_jobs.STALE_AFTER_SECONDS + 60)
+    status = nearest_jobs.read_status(JOB_ID)
+    assert status["status"] == "failed"
+    assert status["error"]
+
+
+def test_recent_running_job_is_still_running(job_dir):
+    write_job("running", nearest_jobs.HEARTBEAT_SECONDS)
+    assert nearest_jobs.read_status(JOB_ID)["status"] == "running"
+
+
+def test_stream_of_stale_job_ends(job_dir):
+    write_job("running", nearest_jobs.STALE_AFTER_SECONDS + 60, lines=b'{"index":0}\n{"index":1')
+    chunks = asyncio.run(asyncio.wait_for(collect(nearest_jobs.stream_results(JOB_ID, poll_interval=0.01)), 5))
+    assert chunks == [b'{"index":0}\n']
+
+
+def test_stale_job_is_swept(job_dir, monkeypatch):
+    write_job("running", nearest_jobs.STALE_AFTER_SECONDS + 60)
+    long_ago = (datetime.now() - timedelta(days=2)).timestamp()
+    os.utime(nearest_jobs._job_path(JOB_ID), (long_ago, long_ago))
+    nearest_jobs._remove_expired_jobs()
+    assert not os.path.exists(nearest_jobs._job_path(JOB_ID))
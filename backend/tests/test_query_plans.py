@@ -0,0 +1,156 @@
+"""Query plan contract for the hot crud functions.
+
+Every case calls a crud function against the seeded database (conftest.py),
+captures the SQL it emits and checks EXPLAIN (FORMAT JSON) of each statement:
+
+- no Seq Scan on churches
+- the expected index is used
+- the estimated cost stays under a share of a full scan of churches, and the
+  rows estimated to be read from churches under a share of the table; both
+  are relative, so the budgets hold at any PLAN_TEST_SIZE
+
+    pytest tests/test_query_plans.py
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import crud
+from benchmarks.common import tile_for, viewport
+from schemas import ChurchFilters, NearbyOrigin
+
+HUE = (16.4637, 107.5909)
+DA_LAT = (11.9404, 108.4583)
+VINH = (18.6796, 105.6813)
+
+
+class PlanCase:
+    def __init__(self, name, call, indexes, max_cost=0.1, max_rows=0.05):
+        self.name = name
+        # call(db) runs the crud function
+        self.call = call
+        # Each entry is an index name, or a tuple of which any one will do
+        self.indexes = indexes
+        # Share of a full scan's cost, and of the table's rows (None: not checked)
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+
+
+CASES = [
+    PlanCase("get_church", lambda db: crud.get_church(db, 1000), ["churches_pkey"], max_cost=0.01, max_rows=0.001),
+    PlanCase("get_church_version", lambda db: crud.get_church_version(db, 1000), ["churches_pkey"],
+             max_cost=0.01, max_rows=0.001),
+    # Keyset pages: the scan's estimate is everything after the cursor, but LIMIT stops it
+    # early; the cost budget, which accounts for that, is the one that matters
+    PlanCase("get_churches", lambda db: crud.get_churches(db, limit=100, after=5000), ["churches_pkey"],
+             max_rows=None),
+    PlanCase("get_churches_updated",
+             lambda db: crud.get_churches(db, limit=100, after=(datetime(2000, 1, 1), 0), order="updated"),
+             ["idx_churches_updated_at_id"], max_rows=None),
+    PlanCase("find_nearby_churches", lambda db: crud.find_nearby_churches(db, *HUE, radius_km=5),
+             ["idx_churches_location_geog"]),
+    PlanCase("find_nearby_churches_denomination",
+             lambda db: crud.find_nearby_churches(db, *HUE, radius_km=10, filters=ChurchFilters(denomination=["protestant"])),
+             [("idx_churches_denomination_location_geog", "idx_churches_location_geog")]),
+    PlanCase("find_nearby_churches_has_phone",
+             lambda db: crud.find_nearby_churches(db, *HUE, radius_km=10, filters=ChurchFilters(has_phone=True)),
+             [("idx_churches_location_geog_phone", "idx_churches_location_geog")]),
+    PlanCase("get_nearby_facets", lambda db: crud.get_nearby_facets(db, *DA_LAT, radius_km=5),
+             ["idx_churches_location_geog"]),
+    PlanCase("find_nearby_churches_batch",
+             lambda db: crud.find_nearby_churches_batch(db, [
+                 NearbyOrigin(latitude=lat, longitude=lng, radius_km=5, limit=10) for lat, lng in (HUE, DA_LAT, VINH)
+             ]),
+             ["idx_churches_location_geog"]),
+    # Word prefixes through the tsvector index, substrings and typos through the trigram index
+    PlanCase("search_churches", lambda db: crud.search_churches(db, "Kẻ Sặt"),
+             ["idx_churches_search_vector", "idx_churches_search_text_trgm"], max_cost=0.5, max_rows=0.1),
+    PlanCase("get_search_facets", lambda db: crud.get_search_facets(db, "Kẻ Sặt"),
+             ["idx_churches_search_vector", "idx_churches_search_text_trgm"], max_cost=0.5, max_rows=0.1),
+    PlanCase("get_church_clusters", lambda db: crud.get_church_clusters(db, *viewport(*HUE, 12)),
+             ["idx_churches_location"]),
+    PlanCase("get_church_tile", lambda db: crud.get_church_tile(db, *tile_for(*HUE, 12)),
+             ["idx_churches_location"]),
+]
+
+
+@contextmanager
+def captured_statements(engine):
+    """(SQL, parameters) of every statement executed on `engine` in the block"""
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def explain(engine, statement, parameters):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()[0]["Plan"]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def describe(plan, depth=0):
+    """Indented node list for failure messages"""
+    label = plan["Node Type"] + "".join(
+        f" {key}={plan[key]}" for key in ("Relation Name", "Index Name") if key in plan
+    )
+    lines = [f"{'  ' * depth}{label} (cost={plan['Total Cost']}, rows={plan['Plan Rows']})"]
+    for child in plan.get("Plans", []):
+        lines.extend(describe(child, depth + 1))
+    return lines
+
+
+@pytest.fixture(scope="module")
+def table_scan(plan_engine):
+    """(cost, rows) of a full scan of churches: the yardstick for the budgets"""
+    with plan_engine.connect() as connection:
+        plan = connection.execute(text("EXPLAIN (FORMAT JSON) SELECT * FROM churches")).scalar()[0]["Plan"]
+    return plan["Total Cost"], plan["Plan Rows"]
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case.name for case in CASES])
+def test_query_plan(plan_engine, table_scan, case):
+    with captured_statements(plan_engine) as statements, Session(plan_engine) as db:
+        case.call(db)
+    statements = [(sql, params) for sql, params in statements if "churches" in sql]
+    assert statements, f"{case.name} ran no statement on churches"
+
+    scan_cost, table_rows = table_scan
+    for statement, parameters in statements:
+        plan = explain(plan_engine, statement, parameters)
+        nodes = list(plan_nodes(plan))
+        shown = "\n".join([statement, ""] + describe(plan))
+
+        seq_scans = [node for node in nodes if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == "churches"]
+        assert not seq_scans, f"{case.name}: Seq Scan on churches\n{shown}"
+
+        used = {node["Index Name"] for node in nodes if "Index Name" in node}
+        for expected in case.indexes:
+            choices = expected if isinstance(expected, tuple) else (expected,)
+            assert used.intersection(choices), f"{case.name}: none of {choices} used\n{shown}"
+
+        assert plan["Total Cost"] <= case.max_cost * scan_cost, (
+            f"{case.name}: cost {plan['Total Cost']} over {case.max_cost:.0%} of a full scan ({scan_cost})\n{shown}"
+        )
+        if case.max_rows is None:
+            continue
+        church_rows = max(
+            (node["Plan Rows"] for node in nodes if node.get("Relation Name") == "churches"), default=0
+        )
+        assert church_rows <= case.max_rows * table_rows, (
+            f"{case.name}: {church_rows} rows estimated from churches, over {case.max_rows:.0%} of {table_rows}\n{shown}"
+        )
@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud_async
+from database import POOL_OPTIONS, AsyncSessionLocal
+
+# Startup warm-up, run by the app's lifespan in every worker: open pool connections and
+# run the hot statements on each, so that the first requests find connected, authenticated
+# backends with PostGIS loaded and their statements already prepared (asyncpg prepares
+# and caches every statement per connection) and compiled (SQLAlchemy's statement cache).
+
+# Connections beyond the pool size would be closed again as soon as they are returned
+WARM_CONNECTIONS = min(int(os.getenv("DB_WARM_CONNECTIONS", str(POOL_OPTIONS["pool_size"]))), POOL_OPTIONS["pool_size"])
+RETRY_MAX_DELAY = 30
+
+# Any point and any word will do: only the statements matter, not their results
+WARM_POINT = (10.7769, 106.7009)
+WARM_QUERY = "nha tho"
+
+logger = logging.getLogger("warmup")
+
+
+class Readiness:
+    """Whether this worker has finished warming up, for GET /ready"""
+
+    def __init__(self):
+        self.ready = False
+        self.warm_seconds = None
+        # What was warmed: {"connections": n}, or {"snapshot_built_at": ...} in offline mode
+        self.warmed = {}
+
+    def status(self) -> dict:
+        if self.ready:
+            return {"status": "ready", **self.warmed, "warm_seconds": round(self.warm_seconds, 3)}
+        return {"status": "warming"}
+
+    def mark_ready(self, seconds: float, **warmed):
+        self.warm_seconds = seconds
+        self.warmed = warmed
+        self.ready = True
+
+
+readiness = Readiness()
+
+
+async def run_hot_statements(db: AsyncSession):
+    latitude, longitude = WARM_POINT
+    # Validator lookups come first on almost every read
+    await crud_async.get_data_version(db)
+    await crud_async.get_church_version(db, 0)
+    await crud_async.get_church(db, 0)
+    await crud_async.find_nearby_churches(db, latitude, longitude, limit=1)
+    await crud_async.search_churches(db, WARM_QUERY, limit=1)
+
+
+async def warm_pool(connections: int):
+    # All sessions are held open together, so each checks out a connection of its own
+    async with contextlib.AsyncExitStack() as stack:
+        sessions = [await stack.enter_async_context(AsyncSessionLocal()) for _ in range(connections)]
+        await asyncio.gather(*(run_hot_statements(db) for db in sessions))
+
+
+async def warm_up():
+    """Warm the pool, retrying until the database answers, then report ready"""
+    delay = 1
+    while True:
+        started = time.perf_counter()
+        try:
+            await warm_pool(WARM_CONNECTIONS)
+        except (OSError, asyncio.TimeoutError, SQLAlchemyError) as exc:
+            logger.warning("Warm-up failed (%s); retrying in %ds", str(exc).splitlines()[0], delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+            continue
+        readiness.mark_ready(time.perf_counter() - started, connections=WARM_CONNECTIONS)
+        logger.info("Warmed %d connections in %.2fs", WARM_CONNECTIONS, readiness.warm_seconds)
+        return
+
+
+async def load_snapshot(get_index):
+    """Offline mode (CHURCH_READ_ENGINE=offline): map the snapshot, then report ready"""
+    started = time.perf_counter()
+    try:
+        index = await asyncio.to_thread(get_index)
+    except (OSError, ValueError, KeyError):
+        # Not ready, and never will be: the probe keeps failing until the snapshot is fixed
+        logger.exception("Cannot load the offline snapshot")
+        return
+    built_at = index.manifest['built_at']
+    readiness.mark_ready(time.perf_counter() - started, snapshot_built_at=built_at)
+    logger.info("Loaded offline snapshot built at %s in %.2fs", built_at, readiness.warm_seconds)
@@ -0,0 +1,157 @@
+-- Metabase analytics views
+--
+-- Runs after init.sql on a fresh database and is safe to re-run against an
+-- existing one. The aggregate views are materialized and kept up to date by
+-- backend/analytics.py, which refreshes them CONCURRENTLY (readers are never
+-- blocked) a while after writes to the tables they read settle down.
+
+-- Row-level views stay plain: they are cheap projections of the churches table
+
+-- View 1: Churches with coordinates as separate columns
+CREATE OR REPLACE VIEW churches_analytics AS
+SELECT 
+    id,
+    osm_id,
+    name,
+    denomination,
+    religion,
+    amenity,
+    building,
+    address,
+    phone,
+    website,
+    description,
+    ST_X(location) as longitude,
+    ST_Y(location) as latitude,
+    created_at,
+    updated_at
+FROM churches;
+
+-- View 4: Churches with location names (for better mapping)
+-- region is the admin region (admin_regions, loaded by backend/load_regions.py) containing the church
+CREATE OR REPLACE VIEW churches_with_location AS
+SELECT 
+    c.*,
+    ST_X(c.location) as longitude,
+    ST_Y(c.location) as latitude,
+    COALESCE((
+        SELECT r.name
+        FROM admin_region_parts p
+        JOIN admin_regions r ON r.code = p.code
+        WHERE ST_Covers(p.geom, c.location)
+        LIMIT 1
+    ), 'Outside regions') as region,
+    CASE 
+        WHEN c.name IS NOT NULL AND c.name != '' THEN c.name
+        ELSE 'Unnamed Church #' || c.id
+    END as display_name
+FROM churches c;
+
+-- Aggregates are materialized; databases created before this change have them as
+-- plain views, which are dropped so they can be replaced
+DO $$
+DECLARE
+    view_name TEXT;
+BEGIN
+    FOREACH view_name IN ARRAY ARRAY['denomination_stats', 'churches_by_region', 'church_additions_by_month', 'church_density_analysis'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM pg_class
+            WHERE relname = view_name AND relkind = 'v' AND relnamespace = 'public'::regnamespace
+        ) THEN
+            EXECUTE format('DROP VIEW %I', view_name);
+        END IF;
+    END LOOP;
+
+    -- churches_by_region used to bucket churches by hard-coded latitude bands, and
+    -- then to publish densities over the placeholder region areas
+    IF EXISTS (
+        SELECT 1 FROM pg_matviews
+        WHERE matviewname = 'churches_by_region' AND schemaname = 'public'
+          AND (definition NOT LIKE '%admin_region%' OR definition LIKE '%area_km2%')
+    ) THEN
+        DROP MATERIALIZED VIEW churches_by_region;
+    END IF;
+END $$;
+
+-- Each materialized view needs a unique index for REFRESH MATERIALIZED VIEW CONCURRENTLY
+
+-- View 2: Denomination statistics
+CREATE MATERIALIZED VIEW IF NOT EXISTS denomination_stats AS
+SELECT 
+    COALESCE(denomination, 'Unknown') as denomination,
+    COUNT(*) as church_count,
+    COUNT(*) * 100.0 / SUM(COUNT(*)) OVER () as percentage
+FROM churches 
+GROUP BY COALESCE(denomination, 'Unknown')
+ORDER BY church_count DESC;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_denomination_stats_denomination ON denomination_stats (denomination);
+
+-- View 3: Churches by region, over the admin region polygons. Regions without
+-- churches are listed too; churches outside every region count under region_code ''.
+-- No area or density columns: the bundled regions are coarse placeholder bands
+-- whose areas take in sea and neighbouring countries
+CREATE MATERIALIZED VIEW IF NOT EXISTS churches_by_region AS
+WITH located AS (
+    SELECT 
+        c.location,
+        (SELECT p.code FROM admin_region_parts p WHERE ST_Covers(p.geom, c.location) LIMIT 1) as code
+    FROM churches c
+)
+SELECT 
+    COALESCE(r.code, '') as region_code,
+    COALESCE(r.name, 'Outside regions') as region,
+    COUNT(l.location) as church_count,
+    AVG(ST_X(l.location)) as avg_longitude,
+    AVG(ST_Y(l.location)) as avg_latitude
+FROM admin_regions r
+FULL JOIN located l ON l.code = r.code
+GROUP BY r.code, r.name
+ORDER BY church_count DESC;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_churches_by_region_region_code ON churches_by_region (region_code);
+
+-- View 5: Monthly church additions (for growth tracking)
+CREATE MATERIALIZED VIEW IF NOT EXISTS church_additions_by_month AS
+SELECT 
+    DATE_TRUNC('month', created_at) as month,
+    COUNT(*) as churches_added,
+    STRING_AGG(DISTINCT denomination, ', ' ORDER BY denomination) as denominations_added
+FROM churches 
+GROUP BY DATE_TRUNC('month', created_at)
+ORDER BY month;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_church_additions_by_month_month ON church_additions_by_month (month);
+
+-- View 6: Distance analysis (churches density by area)
+-- Pairs come from an index-driven self-join: for every church the geography
+-- GIST index (idx_churches_location_geog) returns only its neighbours within
+-- 50km, instead of transforming and testing every pair of churches.
+CREATE MATERIALIZED VIEW IF NOT EXISTS church_density_analysis AS
+WITH church_pairs AS (
+    SELECT 
+        c1.id as church1_id,
+        c2.id as church2_id,
+        ST_Distance(geography(c1.location), geography(c2.location), false) / 1000.0 as distance_km
+    FROM churches c1
+    JOIN churches c2
+      ON ST_DWithin(geography(c1.location), geography(c2.location), 50000, false)  -- 50km
+     AND c1.id < c2.id
+)
+SELECT 
+    ROUND(distance_km::numeric, 1) as distance_range_km,
+    COUNT(*) as church_pairs_count
+FROM church_pairs
+GROUP BY ROUND(distance_km::numeric, 1)
+ORDER BY distance_range_km;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_church_density_analysis_range ON church_density_analysis (distance_range_km);
+
+-- When each materialized view was last refreshed, and the change counter it
+-- reflects: pg_stat_user_tables inserts + updates + deletes, summed over the
+-- tables the view reads (churches, and the admin region tables for churches_by_region)
+CREATE TABLE IF NOT EXISTS analytics_refresh_state (
+    view_name VARCHAR(100) PRIMARY KEY,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    churches_changes BIGINT NOT NULL
+);
@@ -1,6 +1,9 @@
 -- Enable PostGIS extension
 CREATE EXTENSION IF NOT EXISTS postgis;
 
+-- Plain-type operator classes for GiST, for the composite denomination + location index
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- Create metabase database for Metabase's internal data (only if it doesn't exist)
 SELECT 'CREATE DATABASE metabase'
 WHERE NOT EXISTS (SELECT FROM pg_database WHERE datname = 'metabase')\gexec
@@ -20,12 +23,40 @@ CREATE TABLE IF NOT EXISTS churches (
     website VARCHAR(255),
     description TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Hash of the OSM source row; NULL for churches that were not imported
+    osm_hash TEXT
+);
+
+-- Watermark of the last OSM import/sync (Overpass osm3s.timestamp_osm_base)
+CREATE TABLE IF NOT EXISTS osm_sync_state (
+    source VARCHAR(50) PRIMARY KEY,
+    timestamp_osm_base TIMESTAMPTZ NOT NULL,
+    synced_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Create spatial index for efficient proximity searches
 CREATE INDEX IF NOT EXISTS idx_churches_location ON churches USING GIST (location);
 
+-- Geography expression index so that metre-based ST_DWithin and <-> KNN ordering
+-- on geography(location) are index-assisted
+CREATE INDEX IF NOT EXISTS idx_churches_location_geog ON churches USING GIST (geography(location));
+
+-- Filtered proximity search (e.g. catholic churches near me): one KNN index scan
+-- that only visits churches of the requested denomination
+CREATE INDEX IF NOT EXISTS idx_churches_denomination_location_geog
+    ON churches USING GIST (denomination, geography(location));
+
+-- Partial geography indexes for the has_phone / has_website filters; only a
+-- minority of churches list either, so these are small
+CREATE INDEX IF NOT EXISTS idx_churches_location_geog_phone
+    ON churches USING GIST (geography(location)) WHERE phone IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_churches_location_geog_website
+    ON churches USING GIST (geography(location)) WHERE website IS NOT NULL;
+
+-- Keyset pagination in modification order (GET /churches?order=updated)
+CREATE INDEX IF NOT EXISTS idx_churches_updated_at_id ON churches (updated_at, id);
+
 -- Create function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -39,109 +70,25 @@ $$ language 'plpgsql';
 CREATE TRIGGER update_churches_updated_at BEFORE UPDATE
     ON churches FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
--- Create useful views for Metabase analytics
-
--- View 1: Churches with coordinates as separate columns
-CREATE OR REPLACE VIEW churches_analytics AS
-SELECT 
-    id,
-    osm_id,
-    name,
-    denomination,
-    religion,
-    amenity,
-    building,
-    address,
-    phone,
-    website,
-    description,
-    ST_X(location) as longitude,
-    ST_Y(location) as latitude,
-    created_at,
-    updated_at
-FROM churches;
-
--- View 2: Denomination statistics
-CREATE OR REPLACE VIEW denomination_stats AS
-SELECT 
-    COALESCE(denomination, 'Unknown') as denomination,
-    COUNT(*) as church_count,
-    COUNT(*) * 100.0 / SUM(COUNT(*)) OVER () as percentage
-FROM churches 
-GROUP BY denomination
-ORDER BY church_count DESC;
-
--- View 3: Churches by region (based on coordinates)
-CREATE OR REPLACE VIEW churches_by_region AS
-SELECT 
-    CASE 
-        WHEN ST_Y(location) >= 22 THEN 'North Vietnam'
-        WHEN ST_Y(location) >= 16 THEN 'Central Vietnam'
-        ELSE 'South Vietnam'
-    END as region,
-    COUNT(*) as church_count,
-    AVG(ST_X(location)) as avg_longitude,
-    AVG(ST_Y(location)) as avg_latitude
-FROM churches
-GROUP BY 
-    CASE 
-        WHEN ST_Y(location) >= 22 THEN 'North Vietnam'
-        WHEN ST_Y(location) >= 16 THEN 'Central Vietnam'
-        ELSE 'South Vietnam'
-    END
-ORDER BY church_count DESC;
-
--- View 4: Churches with location names (for better mapping)
-CREATE OR REPLACE VIEW churches_with_location AS
-SELECT 
-    c.*,
-    ST_X(c.location) as longitude,
-    ST_Y(c.location) as latitude,
-    CASE 
-        WHEN ST_Y(c.location) >= 22 THEN 'North Vietnam'
-        WHEN ST_Y(c.location) >= 16 THEN 'Central Vietnam'
-        ELSE 'South Vietnam'
-    END as region,
-    CASE 
-        WHEN c.name IS NOT NULL AND c.name != '' THEN c.name
-        ELSE 'Unnamed Church #' || c.id
-    END as display_name
-FROM churches c;
+-- Administrative regions for the regional analytics, loaded from a local
+-- GeoJSON file by backend/load_regions.py
+CREATE TABLE IF NOT EXISTS admin_regions (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    geom GEOMETRY(MULTIPOLYGON, 4326) NOT NULL,
+    area_km2 DOUBLE PRECISION NOT NULL
+);
 
--- View 5: Monthly church additions (for growth tracking)
-CREATE OR REPLACE VIEW church_additions_by_month AS
-SELECT 
-    DATE_TRUNC('month', created_at) as month,
-    COUNT(*) as churches_added,
-    STRING_AGG(DISTINCT denomination, ', ' ORDER BY denomination) as denominations_added
-FROM churches 
-GROUP BY DATE_TRUNC('month', created_at)
-ORDER BY month;
+-- The same polygons cut into pieces of at most 256 vertices: point-in-polygon
+-- tests against small pieces with tight bounding boxes are far cheaper than
+-- against a whole province outline
+CREATE TABLE IF NOT EXISTS admin_region_parts (
+    id SERIAL PRIMARY KEY,
+    code TEXT NOT NULL REFERENCES admin_regions (code) ON DELETE CASCADE,
+    geom GEOMETRY(POLYGON, 4326) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_admin_region_parts_geom ON admin_region_parts USING GIST (geom);
 
--- View 6: Distance analysis (churches density by area)
-CREATE OR REPLACE VIEW church_density_analysis AS
-WITH church_pairs AS (
-    SELECT 
-        c1.id as church1_id,
-        c1.name as church1_name,
-        c2.id as church2_id,
-        c2.name as church2_name,
-        ST_Distance(
-            ST_Transform(c1.location, 3857),
-            ST_Transform(c2.location, 3857)
-        ) / 1000.0 as distance_km
-    FROM churches c1
-    CROSS JOIN churches c2
-    WHERE c1.id < c2.id
-    AND ST_DWithin(
-        ST_Transform(c1.location, 3857),
-        ST_Transform(c2.location, 3857),
-        50000  -- 50km
-    )
-)
-SELECT 
-    ROUND(distance_km::numeric, 1) as distance_range_km,
-    COUNT(*) as church_pairs_count
-FROM church_pairs
-GROUP BY ROUND(distance_km::numeric, 1)
-ORDER BY distance_range_km;
+-- Text search (backend/search_schema.sql), change tracking (data version and change
+-- feed triggers, backend/change_tracking.sql) and the Metabase analytics views
+-- (analytics.sql) run right after this script, in that order
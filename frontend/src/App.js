@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import {
   Box,
   Flex,
@@ -25,9 +25,10 @@ import NearbyChurchesList from './components/NearbyChurchesList';
 import { churchService } from './services/api';
 
 function App() {
-  const [churches, setChurches] = useState([]);
   const [searchResults, setSearchResults] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [viewportCount, setViewportCount] = useState(0);
+  const [mapRefreshKey, setMapRefreshKey] = useState(0);
   const [selectedChurch, setSelectedChurch] = useState(null);
   const [isAddingMode, setIsAddingMode] = useState(false);
   const [centerLocation, setCenterLocation] = useState(null);
@@ -37,17 +38,13 @@ function App() {
   const { isOpen: isAddModalOpen, onOpen: onAddModalOpen, onClose: onAddModalClose } = useDisclosure();
   const toast = useToast();
 
-  // Load initial churches
-  useEffect(() => {
-    loadChurches();
-  }, []);
-
-  const loadChurches = async () => {
-    setIsLoading(true);
-    try {
-      const data = await churchService.getChurches(0, 1000); // Load more churches for map
-      setChurches(data);
-    } catch (error) {
+  // The map loads server-side clusters for its viewport; this tracks their progress
+  const handleViewportChange = ({ loading, count, error }) => {
+    setIsLoading(loading);
+    if (count !== undefined) {
+      setViewportCount(count);
+    }
+    if (error) {
       toast({
         title: 'Error loading churches',
         description: 'Unable to load church data from the server',
@@ -55,11 +52,13 @@ function App() {
         duration: 3000,
         isClosable: true,
       });
-    } finally {
-      setIsLoading(false);
     }
   };
 
+  const refreshMap = () => {
+    setMapRefreshKey((key) => key + 1);
+  };
+
   const handleSearchResults = (results, type) => {
     setSearchResults(results);
     setSearchType(type);
@@ -96,7 +95,7 @@ function App() {
   };
 
   const handleSaveChurch = () => {
-    loadChurches(); // Refresh the churches list
+    refreshMap(); // Refresh the clusters for the current viewport
     setNewChurchCoordinates(null);
   };
 
@@ -104,7 +103,7 @@ function App() {
     setCenterLocation(location);
   };
 
-  const displayedChurches = searchResults.length > 0 ? searchResults : churches;
+  const displayedCount = searchResults.length > 0 ? searchResults.length : viewportCount;
 
   return (
     <Box minHeight="100vh" bg="gray.50">
@@ -218,7 +217,7 @@ function App() {
               {!isLoading && (
                 <Box p={4} bg="white" borderRadius="md" shadow="md">
                   <Text fontSize="sm" color="gray.600">
-                    {displayedChurches.length} churches displayed
+                    {displayedCount} churches {searchResults.length > 0 ? 'displayed' : 'in view'}
                   </Text>
                   {isAddingMode && (
                     <Alert status="info" mt={2} borderRadius="md">
@@ -236,12 +235,15 @@ function App() {
           {/* Right Side - Map */}
           <Box flex={1} borderRadius="md" overflow="hidden" shadow="md">
             <ChurchMap
-              churches={displayedChurches}
+              churches={searchResults}
               onChurchSelect={handleChurchSelect}
               onAddChurch={handleAddChurch}
               isAddingMode={isAddingMode}
               selectedChurch={selectedChurch}
               centerLocation={centerLocation}
+              clusterRefreshKey={mapRefreshKey}
+              onViewportChange={handleViewportChange}
+              onChurchSaved={refreshMap}
             />
           </Box>
         </Flex>
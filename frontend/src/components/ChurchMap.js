@@ -12,6 +12,7 @@ import {
   useDisclosure,
 } from '@chakra-ui/react';
 import ChurchModal from './ChurchModal';
+import { churchService } from '../services/api';
 
 // Fix for default markers in react-leaflet
 delete L.Icon.Default.prototype._getIconUrl;
@@ -34,6 +35,64 @@ const churchIcon = new L.Icon({
   popupAnchor: [1, -34],
 });
 
+// Icon for a server-side cluster, sized by the number of churches it holds
+const clusterIcon = (count) => {
+  const size = count < 10 ? 30 : count < 100 ? 36 : 44;
+  return L.divIcon({
+    html: `<div style="width:${size}px;height:${size}px;line-height:${size}px;border-radius:50%;background:rgba(139,69,19,0.8);color:white;font-weight:bold;text-align:center;">${count}</div>`,
+    className: '',
+    iconSize: [size, size],
+  });
+};
+
+// Component to load clusters for the visible viewport whenever the map moves
+function ViewportClusterLoader({ enabled, refreshKey, onClusters, onViewportChange }) {
+  const map = useMap();
+
+  const loadClusters = async () => {
+    const bounds = map.getBounds();
+    if (onViewportChange) {
+      onViewportChange({ loading: true });
+    }
+    try {
+      const clusters = await churchService.getClusters({
+        west: bounds.getWest(),
+        south: bounds.getSouth(),
+        east: bounds.getEast(),
+        north: bounds.getNorth(),
+      }, map.getZoom());
+      onClusters(clusters);
+      if (onViewportChange) {
+        onViewportChange({
+          loading: false,
+          count: clusters.reduce((total, cluster) => total + cluster.count, 0),
+        });
+      }
+    } catch (error) {
+      if (onViewportChange) {
+        onViewportChange({ loading: false, error });
+      }
+    }
+  };
+
+  useMapEvents({
+    moveend: () => {
+      if (enabled) {
+        loadClusters();
+      }
+    },
+  });
+
+  useEffect(() => {
+    if (enabled) {
+      loadClusters();
+    }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [enabled, refreshKey]);
+
+  return null;
+}
+
 // Component to handle map clicks for adding new churches
 function MapClickHandler({ onMapClick, isAddingMode }) {
   useMapEvents({
@@ -100,9 +159,14 @@ const ChurchMap = ({
   onAddChurch, 
   isAddingMode = false,
   selectedChurch = null,
-  centerLocation = null 
+  centerLocation = null,
+  clusterRefreshKey = 0,
+  onViewportChange,
+  onChurchSaved
 }) => {
   const [selectedChurchData, setSelectedChurchData] = useState(null);
+  const [clusters, setClusters] = useState([]);
+  const [loadedChurches, setLoadedChurches] = useState({});
   const { isOpen, onOpen, onClose } = useDisclosure();
   const mapRef = useRef();
 
@@ -131,6 +195,91 @@ const ChurchMap = ({
     onOpen();
   };
 
+  // Single-church clusters only carry id/name, so fetch the full record on click
+  const handleClusterChurchClick = async (cluster) => {
+    try {
+      const church = loadedChurches[cluster.id] || await churchService.getChurch(cluster.id);
+      setLoadedChurches((loaded) => ({ ...loaded, [church.id]: church }));
+      handleMarkerClick(church);
+    } catch (error) {
+      // Leave the popup showing the cluster summary
+    }
+  };
+
+  const handleClusterClick = (cluster) => {
+    if (mapRef.current) {
+      mapRef.current.setView([cluster.latitude, cluster.longitude], mapRef.current.getZoom() + 2);
+    }
+  };
+
+  const showClusters = churches.length === 0;
+
+  const renderChurchPopup = (church) => (
+    <Popup>
+      <VStack align="stretch" spacing={2} maxW="250px">
+        <Text fontWeight="bold" fontSize="md">
+          {church.name || 'Unnamed Church'}
+        </Text>
+        
+        {church.denomination && (
+          <Badge colorScheme="blue" variant="subtle">
+            {church.denomination}
+          </Badge>
+        )}
+        
+        {church.address && (
+          <Text fontSize="sm" color="gray.600">
+            📍 {church.address}
+          </Text>
+        )}
+        
+        {church.phone && (
+          <Text fontSize="sm">
+            📞 {church.phone}
+          </Text>
+        )}
+        
+        {church.website && (
+          <Text fontSize="sm">
+            🌐 <a href={church.website} target="_blank" rel="noopener noreferrer">
+              Website
+            </a>
+          </Text>
+        )}
+        
+        {church.distance_meters && (
+          <Text fontSize="sm" color="green.600">
+            📏 {(church.distance_meters / 1000).toFixed(2)} km away
+          </Text>
+        )}
+
+        <Divider />
+        
+        <HStack>
+          <Button 
+            size="sm" 
+            colorScheme="blue" 
+            isDisabled={!church.created_at}
+            onClick={() => handleEditChurch(church)}
+          >
+            Edit
+          </Button>
+          <Button 
+            size="sm" 
+            variant="outline"
+            onClick={() => {
+              if (mapRef.current) {
+                mapRef.current.setView([church.latitude, church.longitude], 16);
+              }
+            }}
+          >
+            Center
+          </Button>
+        </HStack>
+      </VStack>
+    </Popup>
+  );
+
   return (
     <Box height="100%" position="relative">
       <MapContainer
@@ -148,6 +297,37 @@ const ChurchMap = ({
         <MapController center={centerLocation} />
         <PopupController selectedChurch={selectedChurch} churches={churches} />
         
+        <ViewportClusterLoader
+          enabled={showClusters}
+          refreshKey={clusterRefreshKey}
+          onClusters={setClusters}
+          onViewportChange={onViewportChange}
+        />
+        
+        {showClusters && clusters.map((cluster) => (
+          cluster.count > 1 ? (
+            <Marker
+              key={`cluster-${cluster.latitude}-${cluster.longitude}`}
+              position={[cluster.latitude, cluster.longitude]}
+              icon={clusterIcon(cluster.count)}
+              eventHandlers={{
+                click: () => handleClusterClick(cluster),
+              }}
+            />
+          ) : (
+            <Marker
+              key={`church-${cluster.id}`}
+              position={[cluster.latitude, cluster.longitude]}
+              icon={churchIcon}
+              eventHandlers={{
+                click: () => handleClusterChurchClick(cluster),
+              }}
+            >
+              {renderChurchPopup(loadedChurches[cluster.id] || cluster)}
+            </Marker>
+          )
+        ))}
+        
         {churches.map((church) => (
           <Marker
             key={church.id}
@@ -157,68 +337,7 @@ const ChurchMap = ({
               click: () => handleMarkerClick(church),
             }}
           >
-            <Popup>
-              <VStack align="stretch" spacing={2} maxW="250px">
-                <Text fontWeight="bold" fontSize="md">
-                  {church.name || 'Unnamed Church'}
-                </Text>
-                
-                {church.denomination && (
-                  <Badge colorScheme="blue" variant="subtle">
-                    {church.denomination}
-                  </Badge>
-                )}
-                
-                {church.address && (
-                  <Text fontSize="sm" color="gray.600">
-                    📍 {church.address}
-                  </Text>
-                )}
-                
-                {church.phone && (
-                  <Text fontSize="sm">
-                    📞 {church.phone}
-                  </Text>
-                )}
-                
-                {church.website && (
-                  <Text fontSize="sm">
-                    🌐 <a href={church.website} target="_blank" rel="noopener noreferrer">
-                      Website
-                    </a>
-                  </Text>
-                )}
-                
-                {church.distance_meters && (
-                  <Text fontSize="sm" color="green.600">
-                    📏 {(church.distance_meters / 1000).toFixed(2)} km away
-                  </Text>
-                )}
-
-                <Divider />
-                
-                <HStack>
-                  <Button 
-                    size="sm" 
-                    colorScheme="blue" 
-                    onClick={() => handleEditChurch(church)}
-                  >
-                    Edit
-                  </Button>
-                  <Button 
-                    size="sm" 
-                    variant="outline"
-                    onClick={() => {
-                      if (mapRef.current) {
-                        mapRef.current.setView([church.latitude, church.longitude], 16);
-                      }
-                    }}
-                  >
-                    Center
-                  </Button>
-                </HStack>
-              </VStack>
-            </Popup>
+            {renderChurchPopup(church)}
           </Marker>
         ))}
       </MapContainer>
@@ -230,7 +349,10 @@ const ChurchMap = ({
           church={selectedChurchData}
           onSave={() => {
             onClose();
-            // Refresh churches list if needed
+            setLoadedChurches({});
+            if (onChurchSaved) {
+              onChurchSaved();
+            }
           }}
         />
       )}
@@ -16,6 +16,13 @@ export const churchService = {
     return response.data;
   },
 
+  // Get server-side clusters for the visible map area
+  getClusters: async (bounds, zoom) => {
+    const bbox = [bounds.west, bounds.south, bounds.east, bounds.north].join(',');
+    const response = await api.get(`/churches/clusters?bbox=${bbox}&zoom=${zoom}`);
+    return response.data;
+  },
+
   // Get single church
   getChurch: async (id) => {
     const response = await api.get(`/churches/${id}`);
@@ -52,9 +52,33 @@ if [ $attempt -gt $max_attempts ]; then
     exit 1
 fi
 
-# Wait for backend to be ready (automatic import will happen here)
-echo "🔍 Checking backend (data import happens automatically)..."
-max_attempts=60  # Give more time for potential data import
+# Wait for the one-shot importer to finish (it runs alongside the backend)
+echo "🔍 Checking data import..."
+max_attempts=100  # A first import takes a while
+attempt=1
+
+while [ $attempt -le $max_attempts ]; do
+    if $COMPOSE_CMD ps -a importer | grep -qE "Exit(ed)? \(?0"; then
+        echo "✅ Data import completed!"
+        break
+    fi
+    if $COMPOSE_CMD ps -a importer | grep -qE "Exit(ed)? \(?[1-9]"; then
+        echo "❌ Data import failed. Please check the logs with: $COMPOSE_CMD logs importer"
+        exit 1
+    fi
+
+    echo "⏳ Waiting for data import... (attempt $attempt/$max_attempts)"
+    sleep 3
+    attempt=$((attempt + 1))
+done
+
+if [ $attempt -gt $max_attempts ]; then
+    echo "⚠️ Data import is still running. Follow it with: $COMPOSE_CMD logs -f importer"
+fi
+
+# Wait for backend to be ready
+echo "🔍 Checking backend..."
+max_attempts=60
 attempt=1
 
 while [ $attempt -le $max_attempts ]; do
@@ -63,7 +87,7 @@ while [ $attempt -le $max_attempts ]; do
         break
     fi
     
-    echo "⏳ Waiting for backend and data import... (attempt $attempt/$max_attempts)"
+    echo "⏳ Waiting for backend... (attempt $attempt/$max_attempts)"
     sleep 3
     attempt=$((attempt + 1))
 done
@@ -139,8 +163,8 @@ echo "   • churches_by_region - Regional analysis"
 echo "   • church_density_analysis - Distance analysis"
 echo "   • church_additions_by_month - Growth tracking"
 echo ""
-echo "🎯 Data Import: ✅ Automatic (completed)"
-echo "💡 Note: Data import happens automatically when starting with empty database"
+echo "🎯 Data Import: ✅ Automatic (importer service)"
+echo "💡 Note: Data is imported into an empty database, or synced otherwise, by the one-shot importer service"
 echo ""
 echo "🔧 Useful commands:"
 echo "   Stop services: $COMPOSE_CMD down"